@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import struct
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+import msgpack
+
+from .records import set_node
+
+logger = logging.getLogger(__name__)
+
+# Called with (room, envelope) for every envelope published by another node
+Deliver = Callable[[str, Dict[str, Any]], Awaitable[None]]
+# Called with each subscribed room after (re)connecting, to re-announce this node's state
+Rejoin = Callable[[str], Awaitable[None]]
+
+# Frames between nodes and the broker: 4-byte big-endian length + MessagePack body
+_HEADER = struct.Struct("!I")
+
+
+async def read_packet(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    """Read one length-prefixed packet"""
+    header = await reader.readexactly(_HEADER.size)
+    (length,) = _HEADER.unpack(header)
+    return msgpack.unpackb(await reader.readexactly(length), raw=False)
+
+
+class NodeIdConflict(RuntimeError):
+    """The node number this node must use for message ids is held by another process"""
+
+
+def write_packet(writer: asyncio.StreamWriter, packet: Dict[str, Any]) -> None:
+    """Write one length-prefixed packet"""
+    body = msgpack.packb(packet, use_bin_type=True)
+    writer.write(_HEADER.pack(len(body)) + body)
+
+
+class Backplane:
+    """Relays room events between nodes. Each node only subscribes to rooms it has local members in."""
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex
+        self.deliver: Optional[Deliver] = None
+        self.rejoin: Optional[Rejoin] = None
+
+    async def start(self, deliver: Deliver, rejoin: Optional[Rejoin] = None) -> None:
+        """Begin relaying; `deliver` is called for envelopes published by other nodes, and
+        `rejoin` for every subscribed room whenever the connection to them is (re)established"""
+        self.deliver = deliver
+        self.rejoin = rejoin
+
+    async def stop(self) -> None:
+        pass
+
+    async def subscribe(self, room: str) -> None:
+        pass
+
+    async def unsubscribe(self, room: str) -> None:
+        pass
+
+    async def publish(self, room: str, envelope: Dict[str, Any]) -> None:
+        pass
+
+
+class LocalBackplane(Backplane):
+    """Single-node backplane: there are no other nodes, so nothing is relayed"""
+
+
+# Every backplane connection a process opens (one per shard) registers for the same node number
+PROCESS_ID = uuid.uuid4().hex
+_process_node: Optional[int] = None
+
+
+class UnixSocketBackplane(Backplane):
+    """Backplane that relays through the broker process in app.broker over a Unix domain socket.
+
+    Registering with the broker also reserves the node number used in this process's
+    message ids: the configured one (startup fails if another process holds it) or one
+    the broker picks.
+    """
+
+    def __init__(self, path: str, retry_delay: float = 1.0, message_node: Optional[int] = None):
+        super().__init__()
+        self.path = path
+        self.retry_delay = retry_delay
+        self.fixed_node = message_node  # from CHAT_NODE_ID; None lets the broker choose
+        self.rooms: Set[str] = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+        self._failure: Optional[Exception] = None
+        self._registered = False  # registered with the broker at least once
+
+    async def start(self, deliver: Deliver, rejoin: Optional[Rejoin] = None) -> None:
+        await super().start(deliver, rejoin)
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning("backplane broker at %s not reachable yet, retrying in background", self.path)
+        if self._failure is not None:
+            await self.stop()
+            raise self._failure
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._close_writer()
+
+    async def subscribe(self, room: str) -> None:
+        self.rooms.add(room)
+        await self._send({"op": "sub", "room": room})
+
+    async def unsubscribe(self, room: str) -> None:
+        self.rooms.discard(room)
+        await self._send({"op": "unsub", "room": room})
+
+    async def publish(self, room: str, envelope: Dict[str, Any]) -> None:
+        await self._send({"op": "pub", "room": room, "node": self.node_id, "envelope": envelope})
+
+    async def _send(self, packet: Dict[str, Any]) -> None:
+        if self._writer is None:
+            return  # Disconnected: subscriptions are replayed on reconnect, events are dropped
+        try:
+            write_packet(self._writer, packet)
+            await self._writer.drain()
+        except (ConnectionError, OSError):
+            self._close_writer()
+
+    async def _run(self) -> None:
+        """Keep a broker connection open, resubscribing, rejoining and delivering until stopped"""
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(self.retry_delay)
+                continue
+
+            try:
+                await self._register(reader, writer)
+            except NodeIdConflict as error:
+                writer.close()
+                if not self._registered:
+                    # Still starting up: refuse to run rather than issue ids another node issues too
+                    self._failure = error
+                    self._connected.set()
+                    return
+                logger.error("%s; retrying", error)
+                await asyncio.sleep(self.retry_delay)
+                continue
+            except (asyncio.IncompleteReadError, ConnectionError, OSError):
+                writer.close()
+                await asyncio.sleep(self.retry_delay)
+                continue
+
+            self._registered = True
+            self._writer = writer
+            for room in self.rooms:
+                write_packet(writer, {"op": "sub", "room": room})
+            self._connected.set()
+
+            try:
+                # Anything published while we were away was lost, and the broker told the other
+                # nodes we were gone: re-announce our members and ask for theirs in every room
+                if self.rejoin is not None:
+                    for room in list(self.rooms):
+                        try:
+                            await self.rejoin(room)
+                        except Exception:
+                            logger.exception("backplane rejoin failed")
+                while True:
+                    packet = await read_packet(reader)
+                    if self.deliver is None:
+                        continue
+                    try:
+                        await self.deliver(packet["room"], packet["envelope"])
+                    except Exception:
+                        logger.exception("backplane delivery failed")
+            except (asyncio.IncompleteReadError, ConnectionError, OSError):
+                logger.warning("lost backplane broker connection, reconnecting")
+            finally:
+                self._close_writer()
+                self._connected.clear()
+            await asyncio.sleep(self.retry_delay)
+
+    async def _register(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Introduce this node to the broker and reserve its message id node number"""
+        global _process_node
+        requested = self.fixed_node if self.fixed_node is not None else _process_node
+        while True:
+            write_packet(writer, {"op": "hello", "node": self.node_id, "process": PROCESS_ID, "message_node": requested})
+            await writer.drain()
+            reply = await read_packet(reader)
+            if reply.get("op") == "welcome":
+                break
+            if self.fixed_node is not None or requested is None:
+                raise NodeIdConflict(f"message id node {requested} is already used by another process: {reply.get('reason')}")
+            # Our number was handed to another process while the broker was away: take a fresh one.
+            # Ids already issued stay unique, since the other process issues later timestamps under it.
+            requested = None
+        _process_node = reply["message_node"]
+        set_node(_process_node)
+
+    def _close_writer(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def create_backplane(url: str, message_node: Optional[int] = None) -> Backplane:
+    """Build a backplane from a CHAT_BACKPLANE url ("" or "local", or "unix:///path/to/broker.sock")"""
+    if message_node is not None:
+        set_node(message_node)
+    if not url or url == "local":
+        return LocalBackplane()
+    if url.startswith("unix://"):
+        return UnixSocketBackplane(url[len("unix://"):], message_node=message_node)
+    raise ValueError(f"Unsupported backplane url: {url}")
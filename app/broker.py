@@ -0,0 +1,126 @@
+"""Pub/sub broker for running several chat workers on one host.
+
+Start it before the workers and point them at the same socket:
+
+    python -m app.broker /tmp/chat-broker.sock
+    CHAT_BACKPLANE=unix:///tmp/chat-broker.sock uvicorn app.main:app --workers 4
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+from typing import Dict, Optional, Set
+
+from . import config
+from .backplane import read_packet, write_packet
+from .records import NODE_COUNT
+
+logger = logging.getLogger(__name__)
+
+
+class Broker:
+    """Forwards each published envelope to the other nodes subscribed to its room.
+
+    A node that stops reading is disconnected once `max_buffer` bytes are waiting for it,
+    rather than letting its backlog grow without bound; it resynchronises when it reconnects.
+    """
+
+    def __init__(self, max_buffer: int = config.BROKER_MAX_BUFFER):
+        self.max_buffer = max_buffer
+        self.subscribers: Dict[str, Set[asyncio.StreamWriter]] = {}  # room ➞ node connections
+        self.nodes: Dict[asyncio.StreamWriter, str] = {}  # node connection ➞ node id
+        # Message id node numbers: number ➞ owning process, and the connections holding it
+        self.message_nodes: Dict[int, str] = {}
+        self.holders: Dict[int, Set[asyncio.StreamWriter]] = {}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        rooms: Set[str] = set()
+        try:
+            while True:
+                packet = await read_packet(reader)
+                op = packet.get("op")
+                if op == "hello":
+                    self.nodes[writer] = packet["node"]
+                    write_packet(writer, self._reserve(packet.get("message_node"), packet.get("process"), writer))
+                elif op == "sub":
+                    rooms.add(packet["room"])
+                    self.subscribers.setdefault(packet["room"], set()).add(writer)
+                elif op == "unsub":
+                    rooms.discard(packet["room"])
+                    self._unsubscribe(packet["room"], writer)
+                elif op == "pub":
+                    self._forward(packet["room"], {"room": packet["room"], "envelope": packet["envelope"]}, writer)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            node_id = self.nodes.pop(writer, None)
+            self._release(writer)
+            for room in rooms:
+                self._unsubscribe(room, writer)
+                if node_id is not None:
+                    # Let the remaining nodes forget the departed node's members
+                    self._forward(room, {"room": room, "envelope": {"kind": "node_down", "node": node_id}}, writer)
+            writer.close()
+
+    def _reserve(self, requested: Optional[int], process: Optional[str], writer: asyncio.StreamWriter) -> dict:
+        """Grant a node number for message ids: the requested one unless another process holds it,
+        else a free one. The connections of one process (its shards) share a number."""
+        if requested is None:
+            free = [number for number in range(NODE_COUNT) if number not in self.message_nodes]
+            if not free:
+                return {"op": "refused", "reason": "no free node numbers"}
+            # Random rather than lowest free, so a number that a node still uses while it
+            # reconnects after a broker restart is unlikely to be handed to a newcomer
+            requested = random.choice(free)
+        elif not isinstance(requested, int) or not 0 <= requested < NODE_COUNT:
+            return {"op": "refused", "reason": "node number out of range"}
+        elif self.message_nodes.get(requested, process) != process:
+            return {"op": "refused", "reason": "node number in use"}
+        self._release(writer)
+        self.message_nodes[requested] = process
+        self.holders.setdefault(requested, set()).add(writer)
+        return {"op": "welcome", "message_node": requested}
+
+    def _release(self, writer: asyncio.StreamWriter) -> None:
+        for number, holders in list(self.holders.items()):
+            holders.discard(writer)
+            if not holders:
+                del self.holders[number]
+                del self.message_nodes[number]
+
+    def _unsubscribe(self, room: str, writer: asyncio.StreamWriter) -> None:
+        subscribers = self.subscribers.get(room)
+        if subscribers is not None:
+            subscribers.discard(writer)
+            if not subscribers:
+                del self.subscribers[room]
+
+    def _forward(self, room: str, packet: dict, sender: Optional[asyncio.StreamWriter]) -> None:
+        for subscriber in list(self.subscribers.get(room, ())):
+            if subscriber is sender or subscriber.is_closing():
+                continue
+            try:
+                write_packet(subscriber, packet)
+            except (ConnectionError, OSError):
+                continue
+            if subscriber.transport.get_write_buffer_size() > self.max_buffer:
+                logger.warning("node %s is not keeping up, disconnecting it", self.nodes.get(subscriber, "?"))
+                # abort() discards the backlog instead of flushing it; the node's handler then cleans up
+                subscriber.transport.abort()
+
+
+async def serve(path: str) -> None:
+    """Run the broker on a Unix domain socket until cancelled"""
+    if os.path.exists(path):
+        os.unlink(path)
+    broker = Broker()
+    server = await asyncio.start_unix_server(broker.handle, path)
+    logger.info("backplane broker listening on %s", path)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(sys.argv[1] if len(sys.argv) > 1 else "/tmp/chat-broker.sock"))
@@ -0,0 +1,113 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .timers import RoomTimers
+
+# Called with (room, event) when a room's pending batch is flushed
+Flush = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class ReactionChange:
+    """Net effect of the reaction changes to one (message, emoji) within a flush window"""
+
+    __slots__ = ("users", "count")
+
+    def __init__(self):
+        self.users: Dict[str, int] = {}  # username ➞ net delta (+1 added, -1 removed)
+        self.count = 0  # count after the latest change
+
+    def apply(self, username: str, delta: int, count: int) -> None:
+        net = self.users.get(username, 0) + delta
+        if net:
+            self.users[username] = net
+        else:
+            self.users.pop(username, None)  # added and removed again: nothing to report
+        self.count = count
+
+    def event(self, message_id: str, emoji: str) -> Optional[Dict[str, Any]]:
+        """Merged reaction_delta event, or None if the changes cancelled out"""
+        if not self.users:
+            return None
+        event: Dict[str, Any] = {
+            "type": "reaction_delta",
+            "message_id": message_id,
+            "emoji": emoji,
+            "delta": sum(self.users.values()),
+            "count": self.count,
+        }
+        if len(self.users) == 1:
+            (event["user"],) = self.users
+        else:
+            event["added"] = [user for user, net in self.users.items() if net > 0]
+            event["removed"] = [user for user, net in self.users.items() if net < 0]
+        return event
+
+
+class PendingBatch:
+    """Events waiting for a room's next flush"""
+
+    __slots__ = ("messages", "reactions")
+
+    def __init__(self):
+        self.messages: List[Dict[str, Any]] = []
+        self.reactions: Dict[Tuple[str, str], ReactionChange] = {}  # (message_id, emoji) ➞ change
+
+
+class Coalescer:
+    """Merges a room's reaction changes (and optionally chat messages) into one frame per flush tick.
+
+    Broadcasts per room are bounded by 1 / interval regardless of input rate. Chat messages
+    are never held longer than `message_delay`, even when that flushes before the tick.
+    """
+
+    def __init__(self, interval: float, message_delay: float, flush: Flush):
+        self.interval = interval
+        self.message_delay = min(message_delay, interval)
+        self.flush = flush
+        self.pending: Dict[str, PendingBatch] = {}
+        self.timers = RoomTimers(self._flush, "coalesced event")
+        self.flushes = 0
+        self.coalesced = 0  # inputs merged into an earlier pending change
+
+    def add_reaction(self, room: str, message_id: str, emoji: str, username: str, delta: int, count: int) -> None:
+        batch = self._batch(room, self.interval)
+        change = batch.reactions.get((message_id, emoji))
+        if change is None:
+            change = batch.reactions[(message_id, emoji)] = ReactionChange()
+        else:
+            self.coalesced += 1
+        change.apply(username, delta, count)
+
+    def add_message(self, room: str, event: Dict[str, Any]) -> None:
+        self._batch(room, self.message_delay).messages.append(event)
+
+    def _batch(self, room: str, delay: float) -> PendingBatch:
+        """The room's pending batch, making sure it is flushed within `delay`"""
+        deadline = asyncio.get_running_loop().time() + delay
+        batch = self.pending.get(room)
+        if batch is None:
+            batch = self.pending[room] = PendingBatch()
+        scheduled = self.timers.deadline(room)
+        if scheduled is None or deadline < scheduled:
+            self.timers.schedule_at(room, deadline)
+        return batch
+
+    async def flush_now(self, room: str) -> None:
+        """Send a room's pending batch immediately, e.g. before the room is torn down"""
+        self.timers.cancel(room)
+        await self._flush(room)
+
+    async def _flush(self, room: str) -> None:
+        batch = self.pending.pop(room, None)
+        if batch is None:
+            return
+        # Messages first: a reaction in this batch may be for a message in this batch
+        events = list(batch.messages)
+        for (message_id, emoji), change in batch.reactions.items():
+            event = change.event(message_id, emoji)
+            if event is not None:
+                events.append(event)
+        if not events:
+            return
+        self.flushes += 1
+        await self.flush(room, events[0] if len(events) == 1 else {"type": "batch", "events": events})
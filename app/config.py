@@ -0,0 +1,75 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment"""
+    value = os.environ.get(name, "").strip()
+    return int(value) if value else default
+
+
+def _env_str(name: str, default: str) -> str:
+    """Read a string setting from the environment"""
+    return os.environ.get(name, "").strip() or default
+
+
+# Outbound fan-out
+SEND_QUEUE_SIZE = _env_int("CHAT_SEND_QUEUE_SIZE", 256)  # frames buffered per connection
+SLOW_CONSUMER_POLICY = _env_str("CHAT_SLOW_CONSUMER_POLICY", "drop-oldest")  # drop-oldest | drop-ephemeral | disconnect
+
+# Message history
+HISTORY_ROOM_DEPTH = _env_int("CHAT_HISTORY_ROOM_DEPTH", 500)  # messages kept per room
+HISTORY_MAX_BYTES = _env_int("CHAT_HISTORY_MAX_BYTES", 64 * 1024 * 1024)  # approximate budget across all rooms
+
+# Multi-worker backplane: "local" (single process) or "unix:///path/to/broker.sock"
+BACKPLANE_URL = _env_str("CHAT_BACKPLANE", "local")
+NODE_ID = _env_int("CHAT_NODE_ID", -1)  # node number in message ids (0-1023); -1 lets the broker assign one
+BROKER_MAX_BUFFER = _env_int("CHAT_BROKER_MAX_BUFFER", 16 * 1024 * 1024)  # unsent bytes the broker holds per node before disconnecting it
+
+# Durable message log (disabled unless a directory is set)
+LOG_DIR = _env_str("CHAT_LOG_DIR", "")
+LOG_BATCH_MS = _env_int("CHAT_LOG_BATCH_MS", 5)  # group commit window
+LOG_FSYNC = _env_int("CHAT_LOG_FSYNC", 1) == 1
+COLD_DIR = _env_str("CHAT_COLD_DIR", "")  # where idle rooms are spilled; unset keeps every room in memory
+COLD_AFTER_S = _env_int("CHAT_COLD_AFTER_S", 600)  # idle time before a room without local members is spilled
+SEARCH_INDEX = _env_int("CHAT_SEARCH_INDEX", 1) == 1  # keep a full-text index of held messages
+HISTORY_PAGE_CACHE = _env_int("CHAT_HISTORY_PAGE_CACHE", 256)  # encoded history pages kept for reuse (0 disables)
+EXPORT_CHUNK = _env_int("CHAT_EXPORT_CHUNK", 500)  # messages read per step of a streaming export
+JOIN_HISTORY = _env_int("CHAT_JOIN_HISTORY", 50)  # messages sent to a client when it joins (0 disables)
+
+# Reconnect replay
+REPLAY_WINDOW = _env_int("CHAT_REPLAY_WINDOW", 200)  # recent events kept per room for ?since= resumes
+REPLAY_MAX_ROOMS = _env_int("CHAT_REPLAY_MAX_ROOMS", 2000)  # rooms whose replay windows are kept
+REPLAY_MAX_BYTES = _env_int("CHAT_REPLAY_MAX_BYTES", 32 * 1024 * 1024)  # approximate budget across all replay windows
+REPLAY_IDLE_TTL_S = _env_int("CHAT_REPLAY_IDLE_TTL_S", 300)  # how long a window outlives its room's last member
+
+# Per-room flush window: merge reaction changes (and optionally chat messages) into one frame per tick
+FLUSH_INTERVAL_MS = _env_int("CHAT_FLUSH_INTERVAL_MS", 0)  # 0 broadcasts every change immediately
+FLUSH_MESSAGES = _env_int("CHAT_FLUSH_MESSAGES", 0) == 1  # also batch chat messages
+MESSAGE_MAX_DELAY_MS = _env_int("CHAT_MESSAGE_MAX_DELAY_MS", 20)  # latency ceiling for batched chat messages
+
+# Presence: join/leave changes within this window are announced as one delta
+PRESENCE_BATCH_MS = _env_int("CHAT_PRESENCE_BATCH_MS", 50)
+# Typing and seen signals: latest per user within this window, sent as one frame (0 sends each immediately)
+SIGNAL_BATCH_MS = _env_int("CHAT_SIGNAL_BATCH_MS", 100)
+
+# Heartbeat: ping connections quiet for HEARTBEAT_INTERVAL_S, close them if nothing arrives within HEARTBEAT_TIMEOUT_S
+HEARTBEAT_INTERVAL_S = _env_int("CHAT_HEARTBEAT_INTERVAL_S", 25)  # 0 disables
+HEARTBEAT_TIMEOUT_S = _env_int("CHAT_HEARTBEAT_TIMEOUT_S", 20)
+
+# Inbound: most operations a client may send in one {"type": "batch", "ops": [...]} frame
+BATCH_MAX_OPS = _env_int("CHAT_BATCH_MAX_OPS", 100)
+
+# Flood protection. Limits are "rate/burst" per second; per-type limits are "type=rate/burst,..."
+# where add_reaction/remove_reaction share "reaction" and "*" covers any type without its own limit
+RATE_LIMIT_ACTION = _env_str("CHAT_RATE_LIMIT_ACTION", "throttle")  # throttle | disconnect
+MAX_FRAME_BYTES = _env_int("CHAT_MAX_FRAME_BYTES", 64 * 1024)  # larger frames are dropped before decoding
+MAX_MESSAGE_CHARS = _env_int("CHAT_MAX_MESSAGE_CHARS", 4000)
+FRAME_RATE_LIMIT = _env_str("CHAT_FRAME_RATE_LIMIT", "50/100")  # frames per connection, before decoding
+CONNECTION_RATE_LIMITS = _env_str("CHAT_CONNECTION_RATE_LIMITS", "message=5/20,reaction=20/50,signal=5/10,*=20/50")
+ROOM_RATE_LIMITS = _env_str("CHAT_ROOM_RATE_LIMITS", "message=200/400,reaction=1000/2000")
+
+# Sharding: run rooms on this many event loop threads (0 or 1 keeps everything on the server's loop)
+SHARDS = _env_int("CHAT_SHARDS", 0)
+
+# Diagnostics: allow GET /debug/profile to sample the event loop's stacks
+PROFILER_ENABLED = _env_int("CHAT_PROFILER", 0) == 1
@@ -0,0 +1,104 @@
+import time
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Optional, Union
+
+from .metrics import INBOUND, INBOUND_INVALID, INBOUND_SECONDS
+
+# A field spec is the Python type a value must have, or the set of values it may take
+FieldSpec = Union[type, FrozenSet[Any]]
+Handler = Callable[[Any, Dict[str, Any]], Awaitable[None]]
+# Called with (context, type) before each operation is validated; returns False to drop it
+Admit = Callable[[Any, str], bool]
+
+# Client frame carrying several operations: {"type": "batch", "ops": [{"type": ...}, ...]}
+BATCH_TYPE = "batch"
+
+
+class InvalidFrame(Exception):
+    """Raised by a handler for a frame that passed the structural check but is still unusable"""
+
+
+class Route:
+    """A registered handler and the fields its frames must carry"""
+
+    __slots__ = ("handler", "required", "optional")
+
+    def __init__(self, handler: Handler, required: Dict[str, FieldSpec], optional: Dict[str, FieldSpec]):
+        self.handler = handler
+        self.required = required
+        self.optional = optional
+
+    def accepts(self, frame: Dict[str, Any]) -> bool:
+        """Cheap structural check: required fields present, every known field of the right type or value"""
+        for name, spec in self.required.items():
+            if name not in frame or not _matches(frame[name], spec):
+                return False
+        for name, spec in self.optional.items():
+            value = frame.get(name)
+            if value is not None and not _matches(value, spec):
+                return False
+        return True
+
+
+def _matches(value: Any, spec: FieldSpec) -> bool:
+    if isinstance(spec, frozenset):
+        return isinstance(value, str) and value in spec
+    if spec is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, spec)
+
+
+class Dispatcher:
+    """Routes inbound client frames to handlers registered by `type`.
+
+    Frames are checked against their route's field specs instead of being parsed into
+    models, and a `batch` frame runs many operations for one receive and decode.
+    """
+
+    def __init__(self, max_batch: int, admit: Optional[Admit] = None):
+        self.routes: Dict[str, Route] = {}
+        self.max_batch = max_batch
+        self.admit = admit
+
+    def route(self, frame_type: str, optional: Optional[Dict[str, FieldSpec]] = None, **required: FieldSpec) -> Callable[[Handler], Handler]:
+        """Decorator registering a handler for a frame type, with its required fields as keyword specs"""
+        def register(handler: Handler) -> Handler:
+            if frame_type in self.routes or frame_type == BATCH_TYPE:
+                raise ValueError(f"handler for {frame_type!r} already registered")
+            self.routes[frame_type] = Route(handler, required, optional or {})
+            return handler
+        return register
+
+    async def dispatch(self, context: Any, frame: Any) -> None:
+        """Handle one decoded frame, which may be a batch of operations"""
+        if isinstance(frame, dict) and frame.get("type") == BATCH_TYPE:
+            ops = frame.get("ops")
+            INBOUND.labels(BATCH_TYPE).inc()
+            if not isinstance(ops, list) or len(ops) > self.max_batch:
+                INBOUND_INVALID.labels(BATCH_TYPE).inc()
+                return
+            for op in ops:
+                # Batches do not nest: an inner batch is just an unknown op
+                await self._dispatch_one(context, op)
+            return
+        await self._dispatch_one(context, frame)
+
+    async def _dispatch_one(self, context: Any, frame: Any) -> None:
+        frame_type = frame.get("type") if isinstance(frame, dict) else None
+        route = self.routes.get(frame_type) if isinstance(frame_type, str) else None
+        if route is None:
+            INBOUND.labels("unknown").inc()
+            INBOUND_INVALID.labels("unknown").inc()
+            return
+        INBOUND.labels(frame_type).inc()
+        if self.admit is not None and not self.admit(context, frame_type):
+            return  # Rate limited
+        if not route.accepts(frame):
+            INBOUND_INVALID.labels(frame_type).inc()
+            return  # Skip invalid frames
+        started = time.perf_counter()
+        try:
+            await route.handler(context, frame)
+        except InvalidFrame:
+            INBOUND_INVALID.labels(frame_type).inc()
+        finally:
+            INBOUND_SECONDS.labels(frame_type).observe(time.perf_counter() - started)
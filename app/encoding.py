@@ -0,0 +1,141 @@
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import msgpack
+
+from .reactions import ReactionIndex
+from .records import StoredMessage, format_timestamp
+
+# WebSocket subprotocols a client can request. JSON text frames are the default.
+JSON_SUBPROTOCOL = "chat.json"
+MSGPACK_SUBPROTOCOL = "chat.msgpack"
+
+
+class Frame:
+    """An outbound event encoded at most once per wire format and shared by every recipient"""
+
+    __slots__ = ("event", "ephemeral", "_text", "_binary")
+
+    def __init__(self, event: Dict[str, Any], ephemeral: bool = False):
+        self.event = event
+        self.ephemeral = ephemeral
+        self._text: Optional[str] = None
+        self._binary: Optional[bytes] = None
+
+    @property
+    def text(self) -> str:
+        """JSON encoding, for text frames"""
+        if self._text is None:
+            self._text = json.dumps(self.event, separators=(",", ":"), ensure_ascii=False)
+        return self._text
+
+    @property
+    def binary(self) -> bytes:
+        """MessagePack encoding, for binary frames"""
+        if self._binary is None:
+            self._binary = msgpack.packb(self.event, use_bin_type=True)
+        return self._binary
+
+    def encode(self, binary: bool) -> Union[str, bytes]:
+        """The frame's encoding for a connection, MessagePack if `binary` else JSON, cached for the next recipient"""
+        return self.binary if binary else self.text
+
+    def encoded_size(self) -> int:
+        """Length of an encoding the frame already has, producing the cheaper MessagePack one if it has none"""
+        if self._binary is not None:
+            return len(self._binary)
+        if self._text is not None:
+            return len(self._text)
+        return len(self.binary)
+
+
+def select_subprotocol(requested: List[str]) -> Optional[str]:
+    """Pick the wire format from the subprotocols offered by the client"""
+    if MSGPACK_SUBPROTOCOL in requested:
+        return MSGPACK_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in requested:
+        return JSON_SUBPROTOCOL
+    return None
+
+
+def decode_frame(text: Optional[str], data: Optional[bytes]) -> Any:
+    """Decode an inbound frame: text frames are JSON, binary frames are MessagePack"""
+    if text is not None:
+        return json.loads(text)
+    return msgpack.unpackb(data, raw=False)
+
+
+def message_event(message: StoredMessage, reactions: Optional[ReactionIndex] = None) -> Dict[str, Any]:
+    """Build the broadcast event for a stored chat message. Reactions are sent as per-emoji counts."""
+    return {
+        "type": "message",
+        "user": message.user,
+        "content": message.content,
+        "message_id": message.message_id,
+        "reactions": reactions.counts() if reactions else {},
+        "timestamp": format_timestamp(message.timestamp),
+    }
+
+
+def history_event(page: List[Tuple[int, StoredMessage]], reactions: Callable[[int], Optional[ReactionIndex]]) -> Dict[str, Any]:
+    """Build a history page event; `next_cursor` requests the page before this one"""
+    messages = []
+    for cursor, message in page:
+        event = message_event(message, reactions(message.id))
+        event["cursor"] = cursor
+        messages.append(event)
+    next_cursor = page[0][0] if page and page[0][0] > 0 else None
+    return {"type": "history", "messages": messages, "next_cursor": next_cursor}
+
+
+def export_lines(page: List[Tuple[int, StoredMessage]], reactions: Callable[[int], Optional[ReactionIndex]]) -> bytes:
+    """Encode messages as NDJSON: one JSON message event (with its cursor) per line"""
+    lines = []
+    for cursor, message in page:
+        event = message_event(message, reactions(message.id))
+        event["cursor"] = cursor
+        lines.append(json.dumps(event, separators=(",", ":"), ensure_ascii=False))
+        lines.append("\n")
+    return "".join(lines).encode()
+
+
+def search_event(query: str, hits: List[Tuple[int, StoredMessage, float]], total: int, offset: int,
+                 reactions: Callable[[int], Optional[ReactionIndex]]) -> Dict[str, Any]:
+    """Build a page of search results, best match first; `next_offset` requests the following page"""
+    messages = []
+    for cursor, message, score in hits:
+        event = message_event(message, reactions(message.id))
+        event["cursor"] = cursor
+        event["score"] = round(score, 3)
+        messages.append(event)
+    next_offset = offset + len(hits) if offset + len(hits) < total else None
+    return {"type": "search", "query": query, "messages": messages, "total": total, "next_offset": next_offset}
+
+
+def reaction_delta_event(message_id: str, emoji: str, username: str, delta: int, count: int) -> Dict[str, Any]:
+    """Build the broadcast event sent after a reaction is added (delta 1) or removed (delta -1)"""
+    return {
+        "type": "reaction_delta",
+        "user": username,
+        "message_id": message_id,
+        "emoji": emoji,
+        "delta": delta,
+        "count": count,
+    }
+
+
+def reactors_event(message_id: str, emoji: str, users: List[str]) -> Dict[str, Any]:
+    """Build the reply to an on-demand request for everyone who reacted with an emoji"""
+    return {"type": "reactors", "message_id": message_id, "emoji": emoji, "users": users}
+
+
+def rate_limited_event(operation: str, retry_after: float) -> Dict[str, Any]:
+    """Tell a client its operations of one type are being dropped until `retry_after` seconds pass"""
+    return {"type": "rate_limited", "op": operation, "retry_after_ms": round(retry_after * 1000)}
+
+
+def to_frame(message: Union[dict, Frame]) -> Frame:
+    """Normalize anything accepted by ConnectionManager.broadcast into a Frame"""
+    if isinstance(message, Frame):
+        return message
+    return Frame(message)
@@ -0,0 +1,227 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import msgpack
+
+from .records import StoredMessage, pack_id, parse_timestamp, unpack_id
+
+logger = logging.getLogger(__name__)
+
+# Records are a 4-byte length prefix followed by a MessagePack body
+_RECORD_HEADER = struct.Struct("<I")
+# The index holds one 8-byte file offset per record, so record n lives at index[8 * n]
+_INDEX_ENTRY = struct.Struct("<Q")
+
+
+def message_record(message: StoredMessage) -> Dict[str, Any]:
+    """Compact log representation of a message"""
+    return {"id": pack_id(message.id), "user": message.user, "content": message.content, "ts": message.timestamp}
+
+
+def record_message(record: Dict[str, Any]) -> StoredMessage:
+    """Rebuild a message from its log record. Older records carry uuid string ids and ISO 8601 timestamps."""
+    return StoredMessage(unpack_id(record["id"]), record["user"], record["content"], parse_timestamp(record["ts"]))
+
+
+class MessageLog:
+    """Durable append-only per-room message log with group commit and an offset index for cursor seeks"""
+
+    def __init__(self, directory: str, batch_delay: float = 0.005, fsync: bool = True):
+        self.directory = Path(directory)
+        self.batch_delay = batch_delay
+        self.fsync = fsync
+        self.pending: Dict[str, List[bytes]] = {}  # room ➞ encoded records waiting for the next commit
+        self.pending_count = 0
+        self.batches = 0
+        self._appended = 0   # records appended so far
+        self._committed = 0  # records known to be on disk
+        self._wakeup = asyncio.Event()
+        self._flushed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _paths(self, room: str) -> Tuple[Path, Path]:
+        name = hashlib.sha1(room.encode("utf-8")).hexdigest()
+        return self.directory / f"{name}.log", self.directory / f"{name}.idx"
+
+    async def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(self.repair)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still pending, then stop the writer"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.pending:
+            batch, self.pending, self.pending_count = self.pending, {}, 0
+            await asyncio.to_thread(self._write_batch, batch)
+
+    def append(self, room: str, message: StoredMessage) -> None:
+        """Queue a message for the next group commit. Never blocks the caller."""
+        self.pending.setdefault(room, []).append(msgpack.packb(message_record(message), use_bin_type=True))
+        self.pending_count += 1
+        self._appended += 1
+        self._wakeup.set()
+
+    async def flush(self) -> None:
+        """Wait until everything appended so far is on disk"""
+        target = self._appended
+        while self._committed < target and self._task is not None:
+            self._flushed.clear()
+            await self._flushed.wait()
+
+    async def _run(self) -> None:
+        """Commit pending records in batches: one write and fsync per room per batch"""
+        while True:
+            await self._wakeup.wait()
+            if self.batch_delay:
+                await asyncio.sleep(self.batch_delay)  # let more appends join this batch
+            self._wakeup.clear()
+            batch, self.pending, self.pending_count = self.pending, {}, 0
+            target = self._appended
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+                self.batches += 1
+            except OSError:
+                logger.exception("failed to commit %d message log records", sum(map(len, batch.values())))
+            self._committed = target
+            self._flushed.set()
+
+    def _write_batch(self, batch: Dict[str, List[bytes]]) -> None:
+        for room, records in batch.items():
+            log_path, index_path = self._paths(room)
+            with open(log_path, "ab") as log_file, open(index_path, "ab") as index_file:
+                # Other workers may append to the same room; the lock keeps log and index in step
+                fcntl.flock(log_file, fcntl.LOCK_EX)
+                try:
+                    offset = log_file.seek(0, os.SEEK_END)
+                    index_offset = index_file.seek(0, os.SEEK_END)
+                    data = bytearray()
+                    index = bytearray()
+                    for body in records:
+                        index += _INDEX_ENTRY.pack(offset + len(data))
+                        data += _RECORD_HEADER.pack(len(body))
+                        data += body
+                    try:
+                        # Records reach the disk before the index entries that point at them, so a crash
+                        # can leave unindexed bytes at the log's end but never an entry past it
+                        log_file.write(data)
+                        log_file.flush()
+                        if self.fsync:
+                            os.fsync(log_file.fileno())
+                        index_file.write(index)
+                        index_file.flush()
+                        if self.fsync:
+                            os.fsync(index_file.fileno())
+                    except OSError:
+                        # Don't leave part of a batch where the next one would be appended after it
+                        os.ftruncate(index_file.fileno(), index_offset)
+                        os.ftruncate(log_file.fileno(), offset)
+                        raise
+                finally:
+                    fcntl.flock(log_file, fcntl.LOCK_UN)
+
+    def repair(self) -> int:
+        """Make every room's log and index agree after a crash: drop index entries that point past the
+        end of the log and torn partial entries, then cut unindexed bytes off the log's end so new
+        records follow the last indexed one. Returns the number of index entries dropped."""
+        dropped = 0
+        for index_path in self.directory.glob("*.idx"):
+            log_path = index_path.with_suffix(".log")
+            try:
+                with open(log_path, "ab") as log_file:
+                    fcntl.flock(log_file, fcntl.LOCK_EX)
+                    try:
+                        dropped += self._repair_index(log_path, index_path)
+                    finally:
+                        fcntl.flock(log_file, fcntl.LOCK_UN)
+            except OSError:
+                logger.exception("could not check message log index %s", index_path)
+        return dropped
+
+    @staticmethod
+    def _repair_index(log_path: Path, index_path: Path) -> int:
+        log_size = log_path.stat().st_size
+        index_size = index_path.stat().st_size
+        entries = index_size // _INDEX_ENTRY.size
+        valid = entries
+        indexed_end = 0  # where the last complete indexed record ends
+        with open(log_path, "rb") as log_file, open(index_path, "rb") as index_file:
+            # Offsets only grow, so the bad entries are a suffix: walk back to the last complete record
+            while valid:
+                index_file.seek((valid - 1) * _INDEX_ENTRY.size)
+                offset, = _INDEX_ENTRY.unpack(index_file.read(_INDEX_ENTRY.size))
+                log_file.seek(offset)
+                header = log_file.read(_RECORD_HEADER.size)
+                if len(header) == _RECORD_HEADER.size:
+                    indexed_end = offset + len(header) + _RECORD_HEADER.unpack(header)[0]
+                    if indexed_end <= log_size:
+                        break
+                indexed_end = 0
+                valid -= 1
+        if valid * _INDEX_ENTRY.size != index_size:
+            os.truncate(index_path, valid * _INDEX_ENTRY.size)
+            logger.warning("dropped %d message log index entries past the end of %s", entries - valid, log_path.name)
+        if log_size > indexed_end:
+            os.truncate(log_path, indexed_end)
+        return entries - valid
+
+    def count(self, room: str) -> int:
+        """Number of committed records for a room"""
+        _, index_path = self._paths(room)
+        try:
+            return index_path.stat().st_size // _INDEX_ENTRY.size
+        except FileNotFoundError:
+            return 0
+
+    def read_page(self, room: str, limit: int, before: Optional[int] = None) -> Tuple[List[Tuple[int, StoredMessage]], int]:
+        """Return up to `limit` (cursor, message) pairs older than `before` (newest page if None), oldest first,
+        plus the total record count. Cursors are record numbers."""
+        total = self.count(room)
+        end = total if before is None else max(0, min(before, total))
+        return self._read(room, max(0, end - limit), end), total
+
+    def read_from(self, room: str, start: int, limit: int) -> Tuple[List[Tuple[int, StoredMessage]], int]:
+        """Return up to `limit` (cursor, message) pairs from cursor `start` on, oldest first, plus the total record count"""
+        total = self.count(room)
+        start = max(0, start)
+        return self._read(room, start, min(total, start + limit)), total
+
+    def _read(self, room: str, start: int, end: int) -> List[Tuple[int, StoredMessage]]:
+        """Read records [start, end) with one index lookup and one sequential scan of the log"""
+        if start >= end:
+            return []
+        log_path, index_path = self._paths(room)
+        with open(index_path, "rb") as index_file:
+            index_file.seek(start * _INDEX_ENTRY.size)
+            entry = index_file.read(_INDEX_ENTRY.size)
+        if len(entry) < _INDEX_ENTRY.size:
+            return []
+        first_offset, = _INDEX_ENTRY.unpack(entry)
+
+        page: List[Tuple[int, StoredMessage]] = []
+        with open(log_path, "rb") as log_file:
+            log_file.seek(first_offset)
+            for cursor in range(start, end):
+                # A short read is a torn tail: the log ends at the last complete record
+                header = log_file.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                length, = _RECORD_HEADER.unpack(header)
+                body = log_file.read(length)
+                if len(body) < length:
+                    break
+                page.append((cursor, record_message(msgpack.unpackb(body, raw=False))))
+        return page
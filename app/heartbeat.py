@@ -0,0 +1,85 @@
+import asyncio
+import time
+from typing import Optional
+
+from .encoding import Frame
+from .metrics import HEARTBEAT_PINGS, HEARTBEAT_TIMEOUTS
+from .outbound import Connection
+from .timers import TimingWheel
+
+# One shared frame: encoded once, queued to every quiet connection. Not ephemeral, so it is
+# not shed from a backed-up queue, which would get a slow but live client expired.
+PING_FRAME = Frame({"type": "ping"})
+# Connections checked between yields to the event loop
+CHECKS_PER_YIELD = 1000
+
+
+class Heartbeat:
+    """Pings quiet connections and closes the ones that stop answering.
+
+    Any inbound frame counts as a sign of life (the receive loop sets `last_seen`), so busy
+    clients are never pinged. Connections wait on one timing wheel driven by a single task,
+    so there is no timer per connection and each tick only looks at the connections due.
+    """
+
+    def __init__(self, interval: float, timeout: float, tick: float = 1.0):
+        self.interval = interval  # quiet time before a ping
+        self.timeout = timeout    # time allowed for any reply after the ping
+        self.tick = tick
+        self.wheel = TimingWheel(tick, int((interval + timeout) / tick) + 2)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def watch(self, connection: Connection) -> None:
+        if self.enabled:
+            connection.last_seen = time.monotonic()
+            self.wheel.schedule(connection, self.interval)
+
+    def forget(self, connection: Connection) -> None:
+        self.wheel.cancel(connection)
+
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            await self.check(time.monotonic())
+
+    async def check(self, now: float) -> None:
+        """Ping or expire the connections that came due, and reschedule the rest"""
+        expired = []
+        for checked, connection in enumerate(self.wheel.advance(now), 1):
+            if checked % CHECKS_PER_YIELD == 0:
+                # Clients that connected together come due together; don't stall the loop for all of them
+                await asyncio.sleep(0)
+            if connection.closed:
+                continue
+            quiet = now - connection.last_seen
+            if quiet >= self.interval + self.timeout:
+                expired.append(connection)
+            elif quiet >= self.interval:
+                # No frame for a whole interval: ping, and check again when the reply is due
+                connection.enqueue(PING_FRAME)
+                HEARTBEAT_PINGS.inc()
+                self.wheel.schedule(connection, self.interval + self.timeout - quiet)
+            else:
+                self.wheel.schedule(connection, self.interval - quiet)
+        # Each expiry is an ordinary disconnect, awaited in turn rather than from inside another
+        # one; leaves go through the presence batcher, so a mass expiry is announced as a few deltas.
+        for connection in expired:
+            HEARTBEAT_TIMEOUTS.inc()
+            await connection.expire()
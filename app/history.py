@@ -0,0 +1,299 @@
+import itertools
+import time
+from collections import OrderedDict, deque
+from typing import Container, Deque, Dict, List, Optional, Tuple
+
+from .reactions import ReactionIndex
+from .records import StoredMessage
+from .search import MAX_QUERY_TERMS, RoomIndex, tokenize
+from .tiering import ColdStore, encode_room
+
+# Rough per-message cost of the slotted record, its id and timestamp ints, the content
+# string header and its ring buffer and index slots, added to the content's length
+# (usernames are interned, so they are shared rather than counted per message)
+MESSAGE_OVERHEAD_BYTES = 240
+# Rough cost of one reactor entry in a ReactionIndex set
+REACTION_BYTES = 100
+# Rough cost of one term of a message in the search index
+SEARCH_TERM_BYTES = 16
+
+
+def estimate_size(message: StoredMessage) -> int:
+    """Approximate memory held by a stored message"""
+    return MESSAGE_OVERHEAD_BYTES + len(message.content or "")
+
+
+class RoomHistory:
+    """Ring buffer of a room's most recent messages, indexed by message id"""
+
+    __slots__ = ("messages", "index", "reactions", "search", "size", "appended", "active", "version")
+
+    def __init__(self, version: int, search: bool = False):
+        self.messages: Deque[StoredMessage] = deque()  # oldest first; messages[i] has cursor appended - len + i
+        self.index: Dict[int, StoredMessage] = {}  # message id ➞ message
+        self.reactions: Dict[int, ReactionIndex] = {}  # message id ➞ reactions, only for messages that have any
+        self.search: Optional[RoomIndex] = RoomIndex() if search else None
+        self.size = 0
+        self.appended = 0  # messages ever stored; the newest message's cursor is appended - 1
+        self.active = time.monotonic()  # last write, for spilling idle rooms
+        self.version = version  # changes whenever the messages or their reactions do
+
+
+class HistoryStore:
+    """Bounded message history: per-room depth, a global memory budget and LRU room eviction.
+
+    With a cold store, rooms leaving memory (idle, or over the budget) are spilled to it
+    instead of dropped, and any lookup brings them back. Without one, rooms in `pinned`
+    (those with connected members) are never dropped: their clients hold message ids and
+    cursors from this history, and a rebuilt room would number its messages from 0 again.
+    """
+
+    def __init__(self, room_depth: int, max_bytes: int, cold: Optional[ColdStore] = None, search: bool = False):
+        self.room_depth = room_depth
+        self.max_bytes = max_bytes
+        self.cold = cold
+        self.search_enabled = search
+        self.rooms: "OrderedDict[str, RoomHistory]" = OrderedDict()  # least recently active first
+        self.total_size = 0
+        self.total_messages = 0
+        self.evicted_messages = 0  # dropped by the per-room ring buffer
+        self.evicted_rooms = 0     # whole rooms dropped to stay under the memory budget
+        self.evicted_room_messages = 0
+        # Versions are never reused, so a room that is dropped and rebuilt cannot match an old one
+        self._versions = itertools.count(1)
+        self.cold_versions: Dict[str, int] = {}  # spilled room ➞ its version, unchanged while it is cold
+        self.pinned: Container[str] = ()  # rooms the budget must not drop; the manager passes its live rooms
+
+    def add(self, room: str, message: StoredMessage) -> None:
+        """Store a message, evicting old messages and idle rooms as needed. A message already held is ignored."""
+        history = self._hot(room)
+        if history is None:
+            history = self.rooms[room] = RoomHistory(next(self._versions), self.search_enabled)
+        else:
+            self.rooms.move_to_end(room)
+            history.active = time.monotonic()
+        if message.id in history.index:
+            return
+
+        size = estimate_size(message)
+        if history.search is not None:
+            size += history.search.add(history.appended, message.content) * SEARCH_TERM_BYTES
+        history.messages.append(message)
+        history.index[message.id] = message
+        history.appended += 1
+        history.version = next(self._versions)
+        history.size += size
+        self.total_size += size
+        self.total_messages += 1
+
+        while len(history.messages) > self.room_depth:
+            cursor = history.appended - len(history.messages)
+            self._forget(history, history.messages.popleft(), cursor)
+            self.evicted_messages += 1
+
+        self._enforce_budget(keep=room)
+
+    def get(self, room: str, message_id: Optional[int]) -> Optional[StoredMessage]:
+        """Look up a message by id in O(1)"""
+        history = self._hot(room)
+        if history is None:
+            return None
+        return history.index.get(message_id)
+
+    def reactions(self, room: str, message_id: Optional[int]) -> Optional[ReactionIndex]:
+        """Reactions on a message, or None if it has none (or is not held)"""
+        history = self._hot(room)
+        if history is None:
+            return None
+        return history.reactions.get(message_id)
+
+    def add_reaction(self, room: str, message_id: Optional[int], emoji: str, username: str) -> Optional[int]:
+        """Add a reaction to a held message. Returns the new count, or None if nothing changed."""
+        history = self._hot(room)
+        if history is None or message_id not in history.index:
+            return None
+        index = history.reactions.get(message_id)
+        if index is None:
+            index = history.reactions[message_id] = ReactionIndex()
+        count = index.add(emoji, username)
+        if count is not None:
+            history.version = next(self._versions)
+            history.size += REACTION_BYTES
+            self.total_size += REACTION_BYTES
+            self.rooms.move_to_end(room)
+            history.active = time.monotonic()
+        return count
+
+    def remove_reaction(self, room: str, message_id: Optional[int], emoji: str, username: str) -> Optional[int]:
+        """Remove a reaction from a held message. Returns the new count, or None if nothing changed."""
+        history = self._hot(room)
+        index = history.reactions.get(message_id) if history is not None else None
+        if index is None:
+            return None
+        count = index.remove(emoji, username)
+        if count is not None:
+            history.version = next(self._versions)
+            history.size -= REACTION_BYTES
+            self.total_size -= REACTION_BYTES
+            self.rooms.move_to_end(room)
+            history.active = time.monotonic()
+            if not index.users:
+                del history.reactions[message_id]
+        return count
+
+    def holds(self, room: str) -> bool:
+        """Whether a room has history here, in memory or spilled"""
+        return room in self.rooms or (self.cold is not None and room in self.cold.rooms)
+
+    def version(self, room: str) -> int:
+        """Changes whenever a room's held messages or reactions do (0 if it has none), without rehydrating it"""
+        history = self.rooms.get(room)
+        if history is not None:
+            return history.version
+        return self.cold_versions.get(room, 0)
+
+    def page(self, room: str, limit: int, before: Optional[int] = None) -> Tuple[List[Tuple[int, StoredMessage]], int]:
+        """Return up to `limit` (cursor, message) pairs older than `before`, oldest first, plus the room's
+        total message count. Cursors number a room's messages from 0, matching the message log."""
+        history = self._hot(room)
+        if history is None:
+            return [], 0
+        first = history.appended - len(history.messages)  # cursor of the oldest message still held
+        end = history.appended if before is None else max(first, min(before, history.appended))
+        start = max(first, end - limit)
+        messages = history.messages
+        return [(cursor, messages[cursor - first]) for cursor in range(start, end)], history.appended
+
+    def read_from(self, room: str, start: int, limit: int) -> Tuple[List[Tuple[int, StoredMessage]], int]:
+        """Return up to `limit` (cursor, message) pairs from cursor `start` on (or the oldest held), oldest
+        first, plus the room's total message count"""
+        history = self._hot(room)
+        if history is None:
+            return [], 0
+        first = history.appended - len(history.messages)
+        start = max(first, start)
+        end = min(history.appended, start + limit)
+        messages = history.messages
+        return [(cursor, messages[cursor - first]) for cursor in range(start, end)], history.appended
+
+    def search(self, room: str, query: str, limit: int, offset: int = 0) -> Tuple[List[Tuple[int, StoredMessage, float]], int]:
+        """Rank a room's held messages against a query. Returns a page of (cursor, message, score), best
+        first, plus the total number of matching messages."""
+        history = self._hot(room)
+        terms = set(sorted(tokenize(query))[:MAX_QUERY_TERMS])
+        if history is None or history.search is None or not terms:
+            return [], 0
+        ranked, total = history.search.search(terms, len(history.messages), offset + limit)
+        first = history.appended - len(history.messages)
+        return [(cursor, history.messages[cursor - first], score) for score, cursor in ranked[offset:]], total
+
+    def load(self, room: str, page: List[Tuple[int, StoredMessage]], total: int) -> None:
+        """Seed an empty room from persisted history so cursors continue where the log left off"""
+        if not page or room in self.rooms:
+            return
+        history = self.rooms[room] = RoomHistory(next(self._versions), self.search_enabled)
+        history.appended = total - len(page)
+        for _, message in page:
+            self.add(room, message)
+
+    def drop_room(self, room: str) -> None:
+        """Forget a room's history entirely"""
+        history = self.rooms.pop(room, None)
+        if history is not None:
+            self.total_size -= history.size
+            self.total_messages -= len(history.messages)
+
+    def spill(self, room: str) -> None:
+        """Move a room's history from memory to the cold store"""
+        history = self.rooms.get(room)
+        if history is None or self.cold is None:
+            return
+        self.cold.spill(room, encode_room(history.appended, history.messages, history.reactions))
+        self.cold_versions[room] = history.version
+        self.drop_room(room)
+
+    def spill_idle(self, idle_before: float, keep: Container[str] = ()) -> int:
+        """Spill rooms not active since `idle_before` (a monotonic time), except those in `keep`"""
+        idle = []
+        for room, history in self.rooms.items():  # least recently active first
+            if history.active >= idle_before:
+                break
+            if room not in keep:
+                idle.append(room)
+        for room in idle:
+            self.spill(room)
+        return len(idle)
+
+    def _hot(self, room: str) -> Optional[RoomHistory]:
+        """A room's in-memory history, rehydrating it from the cold store if it was spilled"""
+        history = self.rooms.get(room)
+        if history is not None or self.cold is None or room not in self.cold.rooms:
+            return history
+        appended, messages = self.cold.take(room)
+        history = self.rooms[room] = RoomHistory(self.cold_versions.pop(room), self.search_enabled)
+        for cursor, (message, reactions) in enumerate(messages, appended - len(messages)):
+            history.messages.append(message)
+            history.index[message.id] = message
+            size = estimate_size(message)
+            if history.search is not None:
+                size += history.search.add(cursor, message.content) * SEARCH_TERM_BYTES
+            if reactions:
+                index = history.reactions[message.id] = ReactionIndex()
+                for emoji, users in reactions.items():
+                    for username in users:
+                        index.add(emoji, username)
+                size += len(index) * REACTION_BYTES
+            history.size += size
+        history.appended = appended
+        self.total_size += history.size
+        self.total_messages += len(history.messages)
+        self._enforce_budget(keep=room)
+        return history
+
+    def _forget(self, history: RoomHistory, message: StoredMessage, cursor: int) -> None:
+        size = estimate_size(message)
+        if history.search is not None:
+            size += history.search.remove(cursor, message.content) * SEARCH_TERM_BYTES
+        del history.index[message.id]
+        index = history.reactions.pop(message.id, None)
+        if index is not None:
+            size += len(index) * REACTION_BYTES
+        history.size -= size
+        self.total_size -= size
+        self.total_messages -= 1
+
+    def _enforce_budget(self, keep: str) -> None:
+        """Evict least recently active rooms until the store fits its memory budget.
+
+        Pinned rooms that cannot be spilled are moved to the most recent end as they are passed,
+        so when they alone exceed the budget the store stays over it rather than dropping them.
+        """
+        skipped = 0
+        while self.total_size > self.max_bytes and skipped < len(self.rooms):
+            room, history = next(iter(self.rooms.items()))
+            if room == keep or (self.cold is None and room in self.pinned):
+                self.rooms.move_to_end(room)
+                skipped += 1
+                continue
+            if self.cold is not None:
+                self.spill(room)
+                continue
+            self.evicted_room_messages += len(history.messages)
+            self.drop_room(room)
+            self.evicted_rooms += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Sizing counters for the history budget"""
+        return {
+            "rooms": len(self.rooms),
+            "messages": self.total_messages,
+            "bytes": self.total_size,
+            "max_bytes": self.max_bytes,
+            "room_depth": self.room_depth,
+            "evicted_messages": self.evicted_messages,
+            "evicted_rooms": self.evicted_rooms,
+            "evicted_room_messages": self.evicted_room_messages,
+            "cold_rooms": len(self.cold.rooms) if self.cold is not None else 0,
+            "spilled_rooms": self.cold.spilled if self.cold is not None else 0,
+            "rehydrated_rooms": self.cold.rehydrated if self.cold is not None else 0,
+        }
@@ -1,116 +1,549 @@
 import os
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Query, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from typing import Dict, List, Union, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple, Union, Optional
+from contextlib import asynccontextmanager
 from starlette.requests import Request
-from datetime import datetime
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
 from pathlib import Path
-import uvicorn, json, uuid
-from pydantic import ValidationError
-from .schemas import Message, MessageBroadcast, ReactionRequest, MessageRequest, ReactionData, AddReactionRequest, RemoveReactionRequest
+import asyncio, logging, threading, time, uvicorn
+from .records import StoredMessage, decode_id
+from .outbound import Connection, SlowConsumerPolicy
+from .history import HistoryStore
+from .eventlog import MessageLog
+from .tiering import ColdStore
+from .pagecache import CachedPage, PageCache
+from .replay import ReplayWindows
+from .coalesce import Coalescer
+from .presence import Presence, PresenceBatcher
+from .backplane import Backplane, create_backplane
+from .shards import LoopRelay, ShardedManager
+from .encoding import Frame, MSGPACK_SUBPROTOCOL, decode_frame, export_lines, history_event, message_event, rate_limited_event, reaction_delta_event, reactors_event, search_event, select_subprotocol, to_frame
+from .metrics import REGISTRY, RATE_LIMIT_CLOSES, BROADCASTS, BROADCAST_RECIPIENTS, BROADCAST_SECONDS, CONNECTS, CONNECT_SECONDS, DISCONNECTS, DISCONNECT_SECONDS, HISTORY_PAGES, INBOUND_INVALID, MESSAGES_STORED, STORE_SECONDS
+from .dispatch import Dispatcher, InvalidFrame
+from .ratelimit import RateLimiter, RateLimitExceeded
+from .profiler import SamplingProfiler
+from .heartbeat import Heartbeat
+from .signals import SignalBatcher
+from . import config
 
 BASE_DIR = Path(__file__).resolve().parent.parent
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await manager.start()
+    await heartbeat.start()
+    yield
+    await heartbeat.stop()
+    await manager.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
 class ConnectionManager:
-    def __init__(self):
-        self.rooms: Dict[str, List[WebSocket]] = {}
-        self.users: Dict[str, Dict[str, str]] = {}   # room ➞ {ws_id: username}
-        self.messages: Dict[str, Dict[str, Message]] = {}  # room ➞ {message_id: Message}
-
-    async def connect(self, room: str, username: str, websocket: WebSocket):
-        await websocket.accept()
-        self.rooms.setdefault(room, []).append(websocket)
-        self.users.setdefault(room, {})[id(websocket)] = username
-        await self.broadcast(room, {"type": "join", "user": username, "online": list(self.users[room].values())})
-
-    async def disconnect(self, room: str, websocket: WebSocket):
-        if room in self.rooms and websocket in self.rooms[room]:
-            self.rooms[room].remove(websocket)
-            if room in self.users and id(websocket) in self.users[room]:
-                username = self.users[room].pop(id(websocket))
-                await self.broadcast(room, {"type": "leave", "user": username, "online": list(self.users[room].values())})
-            if not self.rooms[room]:
+    def __init__(self, max_queue: int = config.SEND_QUEUE_SIZE, policy: str = config.SLOW_CONSUMER_POLICY, backplane: Optional[Backplane] = None, limiter: Optional[RateLimiter] = None):
+        self.rooms: Dict[str, Dict[int, Connection]] = {}  # room ➞ {ws_id: Connection}
+        self.presence = Presence()
+        self.presence_batcher = PresenceBatcher(config.PRESENCE_BATCH_MS / 1000, self.presence, self._announce_presence)
+        self.history = HistoryStore(
+            config.HISTORY_ROOM_DEPTH, config.HISTORY_MAX_BYTES,
+            ColdStore(config.COLD_DIR) if config.COLD_DIR else None, config.SEARCH_INDEX,
+        )
+        self.history.pinned = self.rooms  # never drop the history of a room whose clients are connected
+        self.cold_sweeper: Optional[asyncio.Task] = None
+        self.pages = PageCache(config.HISTORY_PAGE_CACHE)
+        self.signals = SignalBatcher(config.SIGNAL_BATCH_MS / 1000, self._send_signals)
+        self.replay = ReplayWindows(config.REPLAY_WINDOW, config.REPLAY_MAX_ROOMS, config.REPLAY_MAX_BYTES, config.REPLAY_IDLE_TTL_S)
+        self.coalescer: Optional[Coalescer] = None
+        if config.FLUSH_INTERVAL_MS:
+            self.coalescer = Coalescer(config.FLUSH_INTERVAL_MS / 1000, config.MESSAGE_MAX_DELAY_MS / 1000, self.broadcast)
+        self.log: Optional[MessageLog] = MessageLog(config.LOG_DIR, config.LOG_BATCH_MS / 1000, config.LOG_FSYNC) if config.LOG_DIR else None
+        self.max_queue = max_queue
+        # Set on a shard: its connections' frames are queued on the accepting loop, which counts the recipients
+        self.relay: Optional[LoopRelay] = None
+        self.policy = SlowConsumerPolicy(policy)
+        self.backplane = backplane or create_backplane(config.BACKPLANE_URL, config.NODE_ID if config.NODE_ID >= 0 else None)
+        self.limiter = limiter or RateLimiter(
+            config.RATE_LIMIT_ACTION, config.MAX_FRAME_BYTES, config.FRAME_RATE_LIMIT,
+            config.CONNECTION_RATE_LIMITS, config.ROOM_RATE_LIMITS,
+        )
+
+    async def start(self) -> None:
+        """Start relaying room events to and from other nodes, the message log writer and the cold room sweeper"""
+        if self.log is not None:
+            await self.log.start()
+        if self.history.cold is not None:
+            self.history.cold.open()
+            self.cold_sweeper = asyncio.create_task(self._sweep_cold_rooms())
+        await self.backplane.start(self._deliver_remote, self._rejoin_remote)
+
+    async def stop(self) -> None:
+        await self.backplane.stop()
+        if self.cold_sweeper is not None:
+            self.cold_sweeper.cancel()
+            self.cold_sweeper = None
+            self.history.cold.close()
+        if self.log is not None:
+            await self.log.stop()
+
+    async def _sweep_cold_rooms(self) -> None:
+        """Spill rooms without local members that have been idle for CHAT_COLD_AFTER_S, then write them out"""
+        interval = min(60.0, max(1.0, config.COLD_AFTER_S / 4))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Snapshots are encoded on the loop, where the history lives, and written in a thread
+                self.history.spill_idle(time.monotonic() - config.COLD_AFTER_S, keep=self.rooms)
+                if self.history.cold.pending:
+                    await self.history.cold.write_pending()
+            except Exception:
+                logger.exception("cold room sweep failed")
+
+    async def connect(self, room: str, username: str, websocket: WebSocket, since: Optional[int] = None, epoch: Optional[str] = None) -> Connection:
+        """Accept a client. A reconnecting client passes the epoch and last seq it saw to receive only what it missed."""
+        started = time.perf_counter()
+        connection = await self.accept(room, username, websocket)
+        await self.attach(connection, since, epoch)
+        CONNECTS.inc()
+        CONNECT_SECONDS.observe(time.perf_counter() - started)
+        return connection
+
+    async def accept(self, room: str, username: str, websocket: WebSocket, on_close: Optional[Callable[[Connection], Awaitable[None]]] = None) -> Connection:
+        """Complete the WebSocket handshake and start the connection's writer on the current loop"""
+        subprotocol = select_subprotocol(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
+        connection = Connection(
+            websocket, room, username, self.max_queue, self.policy,
+            binary=subprotocol == MSGPACK_SUBPROTOCOL, on_close=on_close or self._on_connection_closed,
+        )
+        connection.limits = self.limiter.for_connection()
+        connection.manager = self
+        connection.start()
+        return connection
+
+    async def attach(self, connection: Connection, since: Optional[int] = None, epoch: Optional[str] = None) -> None:
+        """Send an accepted client its join state and add it to the room"""
+        room, username, websocket = connection.room, connection.username, connection.websocket
+        if self.log is not None and not self.history.holds(room):
+            # Bring persisted messages back into memory so reactions and lookups work after a restart
+            page, total = await asyncio.to_thread(self.log.read_page, room, self.history.room_depth)
+            if not self.history.holds(room):
+                self.history.load(room, page, total)
+
+        # No awaits from here until the connection is registered, so nothing falls between replay and live events
+        window = self.replay.get(room)
+        connection.enqueue(Frame({"type": "session", "epoch": window.epoch, "seq": window.seq}))
+        missed = window.since(epoch, since) if since is not None and epoch is not None else None
+        if missed is not None:
+            for frame in missed:
+                connection.enqueue(frame)
+        else:
+            if since is not None:
+                # Gap too large (or the window was reset): the client must drop its state and refetch
+                connection.enqueue(Frame({"type": "resync", "seq": window.seq}))
+            if config.JOIN_HISTORY:
+                page, _ = self.history.page(room, config.JOIN_HISTORY)
+                event = history_event(page, lambda message_id: self.history.reactions(room, message_id))
+                connection.enqueue(Frame(self.with_own_reactions(room, event, username)))
+        first_local_member = room not in self.rooms
+        self.rooms.setdefault(room, {})[id(websocket)] = connection
+        was_online = self.presence.is_online(room, username)
+        first_local_connection = self.presence.add_local(room, username)
+        # Only the joining client gets the full roster; everyone else gets a delta
+        connection.enqueue(Frame({"type": "roster", "online": self.presence.online(room)}))
+        if first_local_member:
+            # Subscribe and ask the other nodes in the room for their members
+            await self.backplane.subscribe(room)
+            await self.backplane.publish(room, {"kind": "hello", "node": self.backplane.node_id})
+        if first_local_connection:
+            await self.backplane.publish(room, {"kind": "join", "node": self.backplane.node_id, "user": username})
+            await self.presence_batcher.changed(room, username, was_online)
+
+    async def disconnect(self, room: str, websocket: WebSocket, reason: str = "client"):
+        if room in self.rooms and id(websocket) in self.rooms[room]:
+            started = time.perf_counter()
+            connection = self.rooms[room].pop(id(websocket))
+            last_local_member = not self.rooms[room]
+            if last_local_member:
                 del self.rooms[room]
-                if room in self.users:
-                    del self.users[room]
+            was_online = self.presence.is_online(room, connection.username)
+            last_local_connection = self.presence.remove_local(room, connection.username)
+            await connection.stop()
+            if last_local_connection:
+                await self.backplane.publish(room, {"kind": "leave", "node": self.backplane.node_id, "user": connection.username})
+                await self.presence_batcher.changed(room, connection.username, was_online)
+            if last_local_member:
+                # Send what is still batched for the room now rather than leave timers running for it
+                if self.coalescer is not None:
+                    await self.coalescer.flush_now(room)
+                await self.signals.flush_now(room)
+                await self.presence_batcher.flush_now(room)
+            if last_local_member and room not in self.rooms:
+                self.replay.release(room)
+                self.presence.drop_remote(room)
+                self.limiter.forget_room(room)
+                await self.backplane.unsubscribe(room)
+            DISCONNECTS.labels(reason).inc()
+            DISCONNECT_SECONDS.observe(time.perf_counter() - started)
+
+    async def dispatch(self, connection: Connection, frame: Any) -> None:
+        """Handle one decoded inbound frame from a client"""
+        await dispatcher.dispatch(connection, frame)
+
+    async def _on_connection_closed(self, connection: Connection) -> None:
+        """Called by a connection when its socket fails, it is dropped as a slow consumer or its heartbeat times out"""
+        await self.disconnect(connection.room, connection.websocket, reason=connection.close_reason)
+
+    def online(self, room: str) -> List[str]:
+        """Usernames connected to a room on this node and on every other node"""
+        return self.presence.online(room)
+
+    async def _announce_presence(self, room: str, event: Dict[str, Any]) -> None:
+        # Presence is derived by each node from its own view, so it is never republished
+        await self.broadcast(room, event, publish=False)
+
+    async def _deliver_remote(self, room: str, envelope: Dict[str, Any]) -> None:
+        """Handle an envelope published by another node for a room we have members in"""
+        kind = envelope["kind"]
+        node = envelope["node"]
+        if kind == "event":
+            event = envelope["event"]
+            self._apply_remote_event(room, node, event)
+            await self.broadcast(room, event, publish=False)
+        elif kind == "signal":
+            await self._send_signals(room, envelope["event"], publish=False)
+        elif kind == "join":
+            was_online = self.presence.is_online(room, envelope["user"])
+            self.presence.add_remote(room, node, envelope["user"])
+            await self.presence_batcher.changed(room, envelope["user"], was_online)
+        elif kind == "leave":
+            was_online = self.presence.is_online(room, envelope["user"])
+            self.presence.remove_remote(room, node, envelope["user"])
+            await self.presence_batcher.changed(room, envelope["user"], was_online)
+        elif kind == "hello":
+            await self._publish_roster(room)
+        elif kind in ("roster", "node_down"):
+            # A node answered our hello, or vanished without sending leave events for its members
+            affected = set(self.presence.remote.get(room, {}).get(node, ())) | set(envelope.get("users", ()))
+            before = {username: self.presence.is_online(room, username) for username in affected}
+            if kind == "roster":
+                self.presence.set_remote(room, node, envelope["users"])
+            else:
+                self.presence.drop_node(room, node)
+            for username, was_online in before.items():
+                await self.presence_batcher.changed(room, username, was_online)
+
+    async def _rejoin_remote(self, room: str) -> None:
+        """After the backplane (re)connects: tell the other nodes who is here and ask who is there"""
+        await self._publish_roster(room)
+        await self.backplane.publish(room, {"kind": "hello", "node": self.backplane.node_id})
 
-    def store_message(self, room: str, message: Message) -> None:
+    async def _publish_roster(self, room: str) -> None:
+        await self.backplane.publish(room, {
+            "kind": "roster", "node": self.backplane.node_id,
+            "users": self.presence.local_users(room),
+        })
+
+    async def _send_signals(self, room: str, event: Dict[str, Any], publish: bool = True) -> None:
+        """Deliver ephemeral signals to a room's members: not stored, not replayed, shed first under pressure"""
+        frame = Frame(event, ephemeral=True)
+        if room in self.rooms:
+            for connection in list(self.rooms[room].values()):
+                connection.enqueue(frame)
+        if publish:
+            await self.backplane.publish(room, {"kind": "signal", "node": self.backplane.node_id, "event": event})
+
+    def _apply_remote_event(self, room: str, node: str, event: Dict[str, Any]) -> None:
+        """Mirror another node's state change so this node can serve the room too"""
+        event_type = event["type"]
+        if event_type == "batch":
+            for inner in event["events"]:
+                self._apply_remote_event(room, node, inner)
+        elif event_type == "message":
+            message = StoredMessage.from_event(event)
+            if message is not None:
+                self.history.add(room, message)
+        elif event_type == "reaction_delta":
+            # Reactions are sets, so replaying the originating node's changes converges
+            if "user" in event:
+                added, removed = ([event["user"]], []) if event["delta"] > 0 else ([], [event["user"]])
+            else:
+                added, removed = event["added"], event["removed"]
+            message_id = decode_id(event["message_id"])
+            for username in added:
+                self.history.add_reaction(room, message_id, event["emoji"], username)
+            for username in removed:
+                self.history.remove_reaction(room, message_id, event["emoji"], username)
+
+    def store_message(self, room: str, message: StoredMessage) -> None:
         """Store a message in the room's message history"""
-        self.messages.setdefault(room, {})[message.id] = message
+        started = time.perf_counter()
+        self.history.add(room, message)
+        if self.log is not None:
+            self.log.append(room, message)
+        MESSAGES_STORED.inc()
+        STORE_SECONDS.observe(time.perf_counter() - started)
+
+    async def history_page(self, room: str, limit: int, before: Optional[int] = None) -> Dict[str, Any]:
+        """Build a history event with up to `limit` messages older than the `before` cursor"""
+        if self.log is None:
+            page, _ = self.history.page(room, limit, before)
+        else:
+            page, _ = await self._read_log(room, self.log.read_page, limit, before)
+        return history_event(page, lambda message_id: self.history.reactions(room, message_id))
+
+    async def cached_history_page(self, room: str, limit: int, before: Optional[int] = None) -> CachedPage:
+        """A history page, encoded once and reused until the room gets a new message or reaction"""
+        # The log's record count catches messages other nodes appended to a shared log directory
+        validator = (self.history.version(room), self.log.count(room) if self.log is not None else 0)
+        key = (room, limit, before)
+        page = self.pages.get(key, validator)
+        if page is not None:
+            HISTORY_PAGES.labels("hit").inc()
+            return page
+        HISTORY_PAGES.labels("miss").inc()
+        return self.pages.put(key, validator, Frame(await self.history_page(room, limit, before)))
+
+    def with_own_reactions(self, room: str, event: Dict[str, Any], username: str) -> Dict[str, Any]:
+        """A history event for one user: messages they reacted to get `mine`, their own emoji.
+
+        Pages are cached and shared, so the event itself is returned unchanged when the
+        user has no reactions on it and only the affected messages are copied otherwise.
+        """
+        messages = event["messages"]
+        for position, message in enumerate(messages):
+            if not message["reactions"]:
+                continue
+            index = self.history.reactions(room, decode_id(message["message_id"]))
+            mine = index.reacted(username) if index is not None else []
+            if mine:
+                if messages is event["messages"]:
+                    messages = list(messages)
+                messages[position] = dict(message, mine=mine)
+        return event if messages is event["messages"] else dict(event, messages=messages)
+
+    async def export_chunk(self, room: str, start: int, limit: int) -> Tuple[bytes, Optional[int]]:
+        """Up to `limit` messages from cursor `start` on as NDJSON lines, plus the cursor to continue from (None at the end)"""
+        if self.log is None:
+            page, total = self.history.read_from(room, start, limit)
+        else:
+            page, total = await self._read_log(room, self.log.read_from, start, limit)
+        resume = page[-1][0] + 1 if page else total
+        return export_lines(page, lambda message_id: self.history.reactions(room, message_id)), resume if resume < total else None
+
+    async def _read_log(self, room: str, read: Callable[..., Any], *args: Any) -> Tuple[List[Tuple[int, StoredMessage]], int]:
+        """Read persisted history in a worker thread, once everything appended so far is on disk"""
+        await self.log.flush()
+        page, total = await asyncio.to_thread(read, room, *args)
+        # Reactions only live in memory; prefer the in-memory copy when it is still held
+        return [(cursor, self.history.get(room, message.id) or message) for cursor, message in page], total
     
-    def get_message(self, room: str, message_id: str) -> Optional[Message]:
+    async def search(self, room: str, query: str, limit: int, offset: int = 0) -> Dict[str, Any]:
+        """Build a page of a room's held messages ranked against a full-text query"""
+        hits, total = self.history.search(room, query, limit, offset)
+        return search_event(query, hits, total, offset, lambda message_id: self.history.reactions(room, message_id))
+
+    def get_message(self, room: str, message_id: str) -> Optional[StoredMessage]:
         """Get a specific message by ID"""
-        return self.messages.get(room, {}).get(message_id)
+        return self.history.get(room, decode_id(message_id))
     
     def verify_user_in_room(self, room: str, username: str) -> bool:
         """Verify that a user is currently connected to the room"""
-        if room not in self.users:
-            return False
-        return username in self.users[room].values()
+        return self.presence.is_local(room, username)
     
-    def add_reaction(self, room: str, message_id: str, emoji: str, username: str) -> bool:
-        """Add a reaction to a message. Returns True if successful."""
-        message = self.get_message(room, message_id)
-        if not message:
-            return False
-        
-        if emoji not in message.reactions.emoji:
-            message.reactions.emoji[emoji] = []
-        
-        if username not in message.reactions.emoji[emoji]:
-            message.reactions.emoji[emoji].append(username)
-        
-        return True
+    def add_reaction(self, room: str, message_id: str, emoji: str, username: str) -> Optional[int]:
+        """Add a reaction to a message. Returns the new count, or None if nothing changed."""
+        return self.history.add_reaction(room, decode_id(message_id), emoji, username)
     
-    def remove_reaction(self, room: str, message_id: str, emoji: str, username: str) -> bool:
-        """Remove a reaction from a message. Returns True if successful."""
-        message = self.get_message(room, message_id)
-        if not message:
-            return False
-        
-        if emoji in message.reactions.emoji and username in message.reactions.emoji[emoji]:
-            message.reactions.emoji[emoji].remove(username)
-            # Remove emoji key if no users have this reaction
-            if not message.reactions.emoji[emoji]:
-                del message.reactions.emoji[emoji]
-            return True
-        
-        return False
+    def remove_reaction(self, room: str, message_id: str, emoji: str, username: str) -> Optional[int]:
+        """Remove a reaction from a message. Returns the new count, or None if nothing changed."""
+        return self.history.remove_reaction(room, decode_id(message_id), emoji, username)
+
+    async def broadcast_message(self, room: str, message: StoredMessage) -> None:
+        """Broadcast a new chat message, batched with the room's next flush when message coalescing is on"""
+        if self.coalescer is not None and config.FLUSH_MESSAGES:
+            self.coalescer.add_message(room, message_event(message))
+        else:
+            await self.broadcast(room, message_event(message))
+
+    async def react(self, room: str, message_id: str, emoji: str, username: str, add: bool) -> None:
+        """Apply a reaction change and broadcast it as a count delta (merged per flush tick when coalescing)"""
+        if add:
+            count = self.add_reaction(room, message_id, emoji, username)
+        else:
+            count = self.remove_reaction(room, message_id, emoji, username)
+        if count is None:
+            return
+        delta = 1 if add else -1
+        if self.coalescer is not None:
+            self.coalescer.add_reaction(room, message_id, emoji, username, delta, count)
+        else:
+            await self.broadcast(room, reaction_delta_event(message_id, emoji, username, delta, count))
 
-    async def broadcast(self, room: str, message: Union[dict, MessageBroadcast]):
-        """Broadcast a message to all clients in a room"""
+    def reactors(self, room: str, message_id: str, emoji: str) -> List[str]:
+        """Everyone who reacted to a message with an emoji"""
+        index = self.history.reactions(room, decode_id(message_id))
+        return index.reactors(emoji) if index is not None else []
+
+    async def broadcast(self, room: str, message: Union[dict, Frame], publish: bool = True):
+        """Broadcast a message to all clients in a room, on this node and (if publish) on other nodes"""
+        started = time.perf_counter()
+        # Encoded at most once per wire format, then shared by every recipient
+        frame = to_frame(message)
+        self.replay.stamp(room, frame, occupied=room in self.rooms)
+        recipients = 0
         if room in self.rooms:
-            # Convert to dict if it's a Pydantic model
-            if isinstance(message, MessageBroadcast):
-                message_data = message.model_dump(exclude_none=True)
-                # Convert datetime to ISO string for JSON serialization
-                if "timestamp" in message_data and message_data["timestamp"]:
-                    message_data["timestamp"] = message_data["timestamp"].isoformat()
-                # Convert reactions to dict format
-                if "reactions" in message_data and message_data["reactions"]:
-                    message_data["reactions"] = message_data["reactions"]["emoji"]
-            else:
-                message_data = message
-            
-            message_text = json.dumps(message_data)
-            disconnected = []
-            for websocket in self.rooms[room]:
-                try:
-                    await websocket.send_text(message_text)
-                except:
-                    disconnected.append(websocket)
-            
-            # Clean up disconnected websockets
-            for websocket in disconnected:
-                await self.disconnect(room, websocket)
-
-manager = ConnectionManager()
+            # Enqueue only: each connection's writer task does the actual send,
+            # so a slow client never delays delivery to the rest of the room
+            for connection in list(self.rooms[room].values()):
+                recipients += connection.enqueue(frame)
+        self.replay.keep(room, frame)
+        BROADCASTS.inc()
+        if self.relay is None:
+            BROADCAST_RECIPIENTS.observe(recipients)
+        else:
+            self.relay.end_broadcast()
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
+        if publish:
+            await self.backplane.publish(room, {"kind": "event", "node": self.backplane.node_id, "event": frame.event})
+
+    async def stats(self) -> Dict[str, Any]:
+        return {"history": self.history.stats(), "replay": self.replay.stats()}
+
+    async def gauges(self) -> Dict[str, float]:
+        """Current sizes for the /metrics gauges"""
+        connections = [connection for members in self.rooms.values() for connection in members.values()]
+        return {
+            "rooms": len(self.rooms),
+            "connections": len(connections),
+            "history_rooms": len(self.history.rooms),
+            "history_messages": self.history.total_messages,
+            "history_bytes": self.history.total_size,
+            "history_cold_rooms": len(self.history.cold.rooms) if self.history.cold is not None else 0,
+            "replay_rooms": len(self.replay.rooms),
+            "replay_bytes": self.replay.total_size,
+            "queued_frames": sum(len(connection.queue) for connection in connections),
+            "max_queue_depth": max((len(connection.queue) for connection in connections), default=0),
+        }
+
+def create_manager(**options: Any) -> Union[ConnectionManager, ShardedManager]:
+    """A ConnectionManager, or with CHAT_SHARDS > 1 a ShardedManager running that many of them"""
+    if config.SHARDS > 1:
+        limiter = options.pop("limiter", None) or RateLimiter(
+            config.RATE_LIMIT_ACTION, config.MAX_FRAME_BYTES, config.FRAME_RATE_LIMIT,
+            config.CONNECTION_RATE_LIMITS, config.ROOM_RATE_LIMITS,
+        )
+
+        def shard_manager() -> ConnectionManager:
+            # The shards share one limiter (each room's buckets are only touched by the shard that
+            # owns it) and split the history and replay budgets
+            shard = ConnectionManager(limiter=limiter, **options)
+            shard.history.max_bytes = config.HISTORY_MAX_BYTES // config.SHARDS
+            shard.replay.max_bytes = config.REPLAY_MAX_BYTES // config.SHARDS
+            return shard
+
+        return ShardedManager(config.SHARDS, shard_manager)
+    return ConnectionManager(**options)
+
+manager = create_manager()
+# One heartbeat for every connection, on the loop that owns the sockets (also when sharded)
+heartbeat = Heartbeat(config.HEARTBEAT_INTERVAL_S, config.HEARTBEAT_TIMEOUT_S)
+
+# Gauges are refreshed from live state when /metrics is scraped, so they cost nothing per event
+GAUGES = {
+    "rooms": REGISTRY.gauge("chat_rooms", "Rooms with members connected to this node"),
+    "connections": REGISTRY.gauge("chat_connections", "Open WebSocket connections"),
+    "history_rooms": REGISTRY.gauge("chat_history_rooms", "Rooms with messages held in memory"),
+    "history_messages": REGISTRY.gauge("chat_history_messages", "Messages held in memory"),
+    "history_bytes": REGISTRY.gauge("chat_history_bytes", "Estimated size of the in-memory history"),
+    "history_cold_rooms": REGISTRY.gauge("chat_history_cold_rooms", "Rooms whose history is spilled to the cold store"),
+    "replay_rooms": REGISTRY.gauge("chat_replay_rooms", "Rooms with a replay window for reconnecting clients"),
+    "replay_bytes": REGISTRY.gauge("chat_replay_bytes", "Estimated size of the replay windows"),
+    "queued_frames": REGISTRY.gauge("chat_queued_frames", "Outbound frames waiting in connection queues"),
+    "max_queue_depth": REGISTRY.gauge("chat_max_queue_depth", "Deepest outbound connection queue"),
+}
+
+profiler_lock = asyncio.Lock()
+
+def admit_operation(connection: Connection, frame_type: str) -> bool:
+    """Apply the sender's and the room's rate limits to one inbound operation"""
+    bucket = connection.limits.admit(connection.room, frame_type)
+    if bucket is None:
+        return True
+    if bucket not in connection.limits.warned:
+        # Tell the client once per limited stretch rather than once per dropped operation
+        connection.limits.warned.add(bucket)
+        connection.enqueue(Frame(rate_limited_event(frame_type, bucket.wait_time(time.monotonic())), ephemeral=True))
+    return False
+
+# Inbound client frames, keyed by "type". Handlers receive the sender's Connection and
+# use the manager that owns its room, which is a shard's manager in sharded mode.
+dispatcher = Dispatcher(config.BATCH_MAX_OPS, admit=admit_operation)
+
+@dispatcher.route("message", content=str)
+async def handle_message(connection: Connection, frame: Dict[str, Any]) -> None:
+    if len(frame["content"]) > config.MAX_MESSAGE_CHARS:
+        raise InvalidFrame("message too long")
+    message = StoredMessage.new(connection.username, frame["content"])
+    connection.manager.store_message(connection.room, message)
+    await connection.manager.broadcast_message(connection.room, message)
+
+@dispatcher.route("history", optional={"before": int, "limit": int})
+async def handle_history(connection: Connection, frame: Dict[str, Any]) -> None:
+    before = frame.get("before")
+    limit = frame.get("limit", 50)
+    if not 1 <= limit <= 200 or (before is not None and before < 0):
+        raise InvalidFrame("limit must be 1-200 and before a cursor")
+    # Reply to the requesting client only
+    page = await connection.manager.cached_history_page(connection.room, limit, before)
+    event = connection.manager.with_own_reactions(connection.room, page.frame.event, connection.username)
+    connection.enqueue(page.frame if event is page.frame.event else Frame(event))
+
+@dispatcher.route("search", query=str, optional={"limit": int, "offset": int})
+async def handle_search(connection: Connection, frame: Dict[str, Any]) -> None:
+    limit = frame.get("limit", 20)
+    offset = frame.get("offset", 0)
+    if not 1 <= limit <= 100 or not 0 <= offset <= config.HISTORY_ROOM_DEPTH or len(frame["query"]) > 200:
+        raise InvalidFrame("limit must be 1-100, offset within the history and query at most 200 characters")
+    connection.enqueue(Frame(await connection.manager.search(connection.room, frame["query"], limit, offset)))
+
+@dispatcher.route("ping")
+async def handle_ping(connection: Connection, frame: Dict[str, Any]) -> None:
+    connection.enqueue(Frame({"type": "pong"}, ephemeral=True))
+
+@dispatcher.route("pong")
+async def handle_pong(connection: Connection, frame: Dict[str, Any]) -> None:
+    pass  # the receive loop has already recorded the sign of life
+
+@dispatcher.route("typing", active=bool)
+async def handle_typing(connection: Connection, frame: Dict[str, Any]) -> None:
+    await connection.manager.signals.post(connection.room, {"type": "typing", "user": connection.username, "active": frame["active"]})
+
+@dispatcher.route("seen", message_id=str)
+async def handle_seen(connection: Connection, frame: Dict[str, Any]) -> None:
+    if len(frame["message_id"]) > 64:
+        raise InvalidFrame("not a message id")
+    await connection.manager.signals.post(connection.room, {"type": "seen", "user": connection.username, "message_id": frame["message_id"]})
+
+@dispatcher.route("add_reaction", message_id=str, emoji=str)
+@dispatcher.route("remove_reaction", message_id=str, emoji=str)
+@dispatcher.route("reaction", message_id=str, emoji=str, action=frozenset({"add", "remove"}))
+async def handle_reaction(connection: Connection, frame: Dict[str, Any]) -> None:
+    # Verify user is in the room
+    if not connection.manager.verify_user_in_room(connection.room, connection.username):
+        return
+    add = frame["type"] == "add_reaction" or frame.get("action") == "add"
+    await connection.manager.react(connection.room, frame["message_id"], frame["emoji"], connection.username, add=add)
+
+@dispatcher.route("reactors", message_id=str, emoji=str)
+async def handle_reactors(connection: Connection, frame: Dict[str, Any]) -> None:
+    # Reply to the requesting client only
+    users = connection.manager.reactors(connection.room, frame["message_id"], frame["emoji"])
+    connection.enqueue(Frame(reactors_event(frame["message_id"], frame["emoji"], users)))
 
 @app.get("/")
 async def get_index(request: Request):
@@ -122,151 +555,103 @@ async def get_index(request: Request):
         },
     )
 
+@app.get("/stats")
+async def get_stats():
+    return await manager.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    for name, value in (await manager.gauges()).items():
+        GAUGES[name].set(value)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profile")
+async def get_profile(seconds: float = Query(5.0, gt=0, le=60), interval_ms: float = Query(5.0, ge=1, le=1000)):
+    """Sample the event loop thread's stacks for a while and return them in collapsed-stack format"""
+    if not config.PROFILER_ENABLED:
+        return PlainTextResponse("profiler disabled; set CHAT_PROFILER=1\n", status_code=404)
+    if profiler_lock.locked():
+        return PlainTextResponse("a profile is already being taken\n", status_code=409)
+    async with profiler_lock:
+        profiler = SamplingProfiler(threading.get_ident(), interval_ms / 1000)
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+    return PlainTextResponse(profiler.collapsed())
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already names this entity tag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+@app.get("/rooms/{room}/history")
+async def get_history(request: Request, room: str, limit: int = Query(50, ge=1, le=200), before: Optional[int] = Query(None, ge=0)):
+    """A page of a room's history. Pollers that send back the ETag get a bodiless 304 until the room changes."""
+    page = await manager.cached_history_page(room, limit, before)
+    headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, page.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(page.body, media_type="application/json", headers=headers)
+
+@app.get("/rooms/{room}/export")
+async def get_export(room: str):
+    """Stream a room's whole history, oldest first, as NDJSON, reading it a chunk at a time"""
+    async def lines() -> AsyncIterator[bytes]:
+        start: Optional[int] = 0
+        while start is not None:
+            chunk, start = await manager.export_chunk(room, start, config.EXPORT_CHUNK)
+            if chunk:
+                yield chunk
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/rooms/{room}/search")
+async def get_search(room: str, q: str = Query(..., min_length=1, max_length=200), limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0)):
+    return await manager.search(room, q, limit, offset)
+
 @app.websocket("/ws/{room}/{username}")
-async def websocket_endpoint(websocket: WebSocket, room: str, username: str):
-    await manager.connect(room, username, websocket)
+async def websocket_endpoint(websocket: WebSocket, room: str, username: str, since: Optional[int] = None, epoch: Optional[str] = None):
+    connection = await manager.connect(room, username, websocket, since, epoch)
+    heartbeat.watch(connection)
     try:
         while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
-            
-            if message_data["type"] == "message":
-                try:
-                    # Validate and create message
-                    message_request = MessageRequest(**message_data)
-                except ValidationError:
-                    continue  # Skip invalid messages
-                
-                # Create and store message with reactions
-                message_id = str(uuid.uuid4())
-                message = Message(
-                    id=message_id,
-                    type="message",
-                    user=username,
-                    content=message_request.content,
-                    timestamp=datetime.now(),
-                    reactions=ReactionData()
-                )
-                
-                manager.store_message(room, message)
-                
-                # Broadcast message to all clients
-                broadcast_message = MessageBroadcast(
-                    type="message",
-                    user=username,
-                    content=message_request.content,
-                    message_id=message_id,
-                    reactions=message.reactions,
-                    timestamp=message.timestamp
-                )
-                
-                await manager.broadcast(room, broadcast_message)
-                
-            elif message_data["type"] == "add_reaction":
-                try:
-                    # Validate add_reaction request
-                    add_reaction_request = AddReactionRequest(**message_data)
-                except ValidationError:
-                    continue  # Skip invalid add_reaction
-
-                # Verify user is in the room
-                if not manager.verify_user_in_room(room, username):
-                    continue  # Skip if user not verified
-
-                # Add reaction and broadcast
-                success = manager.add_reaction(
-                    room, add_reaction_request.message_id, 
-                    add_reaction_request.emoji, username
-                )
-
-                if success:
-                    updated_message = manager.get_message(room, add_reaction_request.message_id)
-                    if updated_message:
-                        # Get users for this specific emoji
-                        users_for_emoji = updated_message.reactions.emoji.get(add_reaction_request.emoji, [])
-                        
-                        reaction_update = MessageBroadcast(
-                            type="reaction_update",
-                            user=username,
-                            message_id=add_reaction_request.message_id,
-                            emoji=add_reaction_request.emoji,
-                            users=users_for_emoji,
-                            reactions=updated_message.reactions
-                        )
-                        await manager.broadcast(room, reaction_update)
-
-            elif message_data["type"] == "remove_reaction":
-                try:
-                    # Validate remove_reaction request
-                    remove_reaction_request = RemoveReactionRequest(**message_data)
-                except ValidationError:
-                    continue  # Skip invalid remove_reaction
-
-                # Verify user is in the room
-                if not manager.verify_user_in_room(room, username):
-                    continue  # Skip if user not verified
-
-                # Remove reaction and broadcast
-                success = manager.remove_reaction(
-                    room, remove_reaction_request.message_id,
-                    remove_reaction_request.emoji, username
-                )
-
-                if success:
-                    updated_message = manager.get_message(room, remove_reaction_request.message_id)
-                    if updated_message:
-                        # Get users for this specific emoji (empty list if removed completely)
-                        users_for_emoji = updated_message.reactions.emoji.get(remove_reaction_request.emoji, [])
-                        
-                        reaction_update = MessageBroadcast(
-                            type="reaction_update",
-                            user=username,
-                            message_id=remove_reaction_request.message_id,
-                            emoji=remove_reaction_request.emoji,
-                            users=users_for_emoji,
-                            reactions=updated_message.reactions
-                        )
-                        await manager.broadcast(room, reaction_update)
-                        
-            elif message_data["type"] == "reaction":
-                try:
-                    # Validate reaction request
-                    reaction_request = ReactionRequest(**message_data)
-                except ValidationError:
-                    continue  # Skip invalid reactions
-                
-                # Handle reaction add/remove
-                success = False
-                if reaction_request.action == "add":
-                    success = manager.add_reaction(
-                        room, reaction_request.message_id, 
-                        reaction_request.emoji, username
-                    )
-                elif reaction_request.action == "remove":
-                    success = manager.remove_reaction(
-                        room, reaction_request.message_id,
-                        reaction_request.emoji, username
-                    )
-                
-                if success:
-                    # Get updated message and broadcast reaction update
-                    updated_message = manager.get_message(room, reaction_request.message_id)
-                    if updated_message:
-                        # Get users for this specific emoji
-                        users_for_emoji = updated_message.reactions.emoji.get(reaction_request.emoji, [])
-                        
-                        reaction_update = MessageBroadcast(
-                            type="reaction_update",
-                            user=username,
-                            message_id=reaction_request.message_id,
-                            emoji=reaction_request.emoji,
-                            users=users_for_emoji,
-                            reactions=updated_message.reactions
-                        )
-                        await manager.broadcast(room, reaction_update)
-                        
+            data = await websocket.receive()
+            if data["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(data.get("code", 1000))
+            connection.last_seen = time.monotonic()
+            # Size and frame rate are checked before any decoding work is spent on the frame
+            text = data.get("text")
+            if text is not None:
+                admitted = connection.limits.admit_text(text)
+            else:
+                admitted = connection.limits.admit_size(len(data.get("bytes") or b""))
+            if not admitted:
+                continue  # Skip oversized frames
+            await connection.limits.pace_frames()
+            try:
+                frame = decode_frame(data.get("text"), data.get("bytes"))
+            except ValueError:
+                INBOUND_INVALID.labels("unknown").inc()
+                continue  # Skip malformed frames
+            await manager.dispatch(connection, frame)
     except WebSocketDisconnect:
-        await manager.disconnect(room, websocket)
+        if not connection.closed:
+            connection.close_reason = "client"
+    except RateLimitExceeded as exceeded:
+        RATE_LIMIT_CLOSES.inc()
+        connection.close_reason = "rate_limit"
+        try:
+            await websocket.close(code=exceeded.code)
+        except Exception:
+            pass
+    finally:
+        heartbeat.forget(connection)
+        await manager.disconnect(room, websocket, reason=connection.close_reason)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
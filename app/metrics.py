@@ -0,0 +1,209 @@
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from 10µs (an enqueue) to 2.5s (a stalled log flush)
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Base for metrics with optional labels. Labelled children are cached, so `labels()` is a dict lookup.
+
+    Shard threads update the same metrics, so every update and the creation of a child
+    takes the metric's lock; `+=` on a shared float is not atomic across threads.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], "Metric"] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str) -> "Metric":
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                # Another thread may have created it since the lookup above
+                child = self.children.get(values)
+                if child is None:
+                    child = self.children[values] = self._child()
+        return child
+
+    def _child(self) -> "Metric":
+        return self.__class__(self.name, self.documentation)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """(suffix, labels, value) triples for the exposition format"""
+        if not self.labelnames:
+            yield from self._samples("")
+        with self._lock:
+            children = sorted(self.children.items())
+        for values, child in children:
+            yield from child._samples(_format_labels(self.labelnames, values))
+
+    def _samples(self, labels: str) -> Iterable[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """A monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def _samples(self, labels):
+        yield "_total", labels, self.value
+
+
+class Gauge(Metric):
+    """A value that goes up and down, or is computed by `collect` at scrape time (free on the hot path)"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), collect: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+        self.collect = collect
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def _samples(self, labels):
+        yield "", labels, self.collect() if self.collect is not None else self.value
+
+
+class Histogram(Metric):
+    """Counts observations into fixed buckets; `observe` is a bisect and two additions"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def _samples(self, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            bucket = f'le="{_format_value(bound)}"'
+            yield "_bucket", labels[:-1] + "," + bucket + "}" if labels else "{" + bucket + "}", cumulative
+        yield "_sum", labels, self.sum
+        yield "_count", labels, cumulative
+
+    def _child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+
+class Registry:
+    """The set of metrics exposed by /metrics"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"duplicate metric {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), collect: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format, version 0.0.4"""
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Connections
+CONNECTS = REGISTRY.counter("chat_connects", "WebSocket connections accepted")
+DISCONNECTS = REGISTRY.counter("chat_disconnects", "Connections removed, by who ended them", ("reason",))
+CONNECT_SECONDS = REGISTRY.histogram("chat_connect_seconds", "Time to accept a client and send its join state")
+DISCONNECT_SECONDS = REGISTRY.histogram("chat_disconnect_seconds", "Time to remove a client and announce its departure")
+
+# Fan-out
+BROADCASTS = REGISTRY.counter("chat_broadcasts", "Room events broadcast from this node")
+BROADCAST_SECONDS = REGISTRY.histogram("chat_broadcast_seconds", "Time to encode and enqueue one event for a room")
+BROADCAST_RECIPIENTS = REGISTRY.histogram("chat_broadcast_recipients", "Local connections each broadcast was queued for", buckets=SIZE_BUCKETS)
+FRAMES_DROPPED = REGISTRY.counter("chat_frames_dropped", "Outbound frames discarded by the slow consumer policy")
+SLOW_CONSUMERS = REGISTRY.counter("chat_slow_consumers_closed", "Connections closed for not keeping up")
+SEND_FAILURES = REGISTRY.counter("chat_send_failures", "Outbound sends that raised, ending the connection")
+HEARTBEAT_PINGS = REGISTRY.counter("chat_heartbeat_pings", "Pings sent to connections that went quiet")
+HEARTBEAT_TIMEOUTS = REGISTRY.counter("chat_heartbeat_timeouts", "Connections closed for not answering a ping")
+
+# Storage
+MESSAGES_STORED = REGISTRY.counter("chat_messages_stored", "Chat messages added to history")
+STORE_SECONDS = REGISTRY.histogram("chat_store_message_seconds", "Time to add a message to history and the log queue")
+HISTORY_PAGES = REGISTRY.counter("chat_history_pages", "History pages served, by whether the encoded page was cached", ("cache",))
+
+# Inbound frames
+INBOUND = REGISTRY.counter("chat_inbound_frames", "Frames received from clients, by type", ("type",))
+INBOUND_INVALID = REGISTRY.counter("chat_inbound_invalid", "Frames skipped as malformed or failing validation, by type", ("type",))
+INBOUND_SECONDS = REGISTRY.histogram("chat_inbound_seconds", "Time to handle one inbound frame, by type", ("type",))
+
+# Flood protection
+RATE_LIMITED = REGISTRY.counter("chat_rate_limited", "Frames delayed or dropped, or operations dropped, by the limit that applied", ("limit",))
+RATE_LIMIT_CLOSES = REGISTRY.counter("chat_rate_limit_closes", "Connections closed for exceeding rate or size limits")
@@ -0,0 +1,178 @@
+import asyncio
+from collections import deque
+from enum import Enum
+from typing import Awaitable, Callable, Deque, Optional
+
+from fastapi import WebSocket
+
+from .encoding import Frame
+from .metrics import FRAMES_DROPPED, SEND_FAILURES, SLOW_CONSUMERS
+
+
+class SlowConsumerPolicy(str, Enum):
+    """What to do when a connection's outbound queue is full"""
+    DROP_OLDEST = "drop-oldest"        # discard the oldest queued frame
+    DROP_EPHEMERAL = "drop-ephemeral"  # discard ephemeral frames first, disconnect if none are left
+    DISCONNECT = "disconnect"          # close the connection
+
+
+# Close code sent to clients that cannot keep up ("Try Again Later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# Close code sent to clients that stopped answering heartbeats ("Going Away")
+HEARTBEAT_CLOSE_CODE = 1001
+
+
+class Connection:
+    """A connected client with its own bounded outbound queue and writer task"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        room: str,
+        username: str,
+        max_queue: int,
+        policy: SlowConsumerPolicy,
+        binary: bool = False,
+        on_close: Optional[Callable[["Connection"], Awaitable[None]]] = None,
+    ):
+        self.websocket = websocket
+        self.room = room
+        self.username = username
+        self.max_queue = max_queue
+        self.policy = policy
+        self.binary = binary  # negotiated MessagePack subprotocol
+        self.on_close = on_close
+        self.queue: Deque[Frame] = deque()
+        self.dropped = 0
+        self.closed = False
+        self.close_reason = "server"  # reported to the manager when the server side ends the connection
+        self.last_seen = 0.0  # monotonic time of the last inbound frame, for the heartbeat
+        self.limits = None  # inbound rate limit state (ratelimit.ConnectionLimits), set by the manager
+        self.manager = None  # the ConnectionManager that owns this connection's room
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the writer task that drains the outbound queue"""
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._run_writer())
+
+    def enqueue(self, frame: Frame) -> bool:
+        """Queue a frame for delivery without waiting. Returns False if the frame was not queued."""
+        if self.closed:
+            return False
+
+        if frame.ephemeral and len(self.queue) >= max(1, self.max_queue // 2):
+            # Under pressure ephemeral frames are shed before anything real is at risk
+            self.dropped += 1
+            FRAMES_DROPPED.inc()
+            return False
+        if len(self.queue) >= self.max_queue and not self._make_room(frame.ephemeral):
+            return False
+
+        # Encode now (cached on the frame) so the bytes reflect state at broadcast time
+        frame.encode(self.binary)
+        self.queue.append(frame)
+        self._wakeup.set()
+        return True
+
+    def _make_room(self, ephemeral: bool) -> bool:
+        """Apply the slow consumer policy to a full queue. Returns True if there is now room."""
+        if self.policy == SlowConsumerPolicy.DROP_OLDEST:
+            self.queue.popleft()
+            self.dropped += 1
+            FRAMES_DROPPED.inc()
+            return True
+
+        if self.policy == SlowConsumerPolicy.DROP_EPHEMERAL:
+            for index, queued in enumerate(self.queue):
+                if queued.ephemeral:
+                    del self.queue[index]
+                    self.dropped += 1
+                    FRAMES_DROPPED.inc()
+                    return True
+            if ephemeral:
+                self.dropped += 1
+                FRAMES_DROPPED.inc()
+                return False
+
+        self._abort()
+        return False
+
+    def _abort(self) -> None:
+        """Give up on a consumer that cannot keep up"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self._wakeup.set()
+        SLOW_CONSUMERS.inc()
+        asyncio.create_task(self._close_slow_consumer())
+
+    async def _close_slow_consumer(self) -> None:
+        try:
+            await self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            pass
+        await self._notify_closed()
+
+    async def expire(self) -> None:
+        """Drop a connection whose client stopped responding.
+
+        The manager forgets it first; the close handshake with a dead peer can take a while,
+        so it finishes in the background instead of holding up the caller.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.close_reason = "timeout"
+        self.queue.clear()
+        self._wakeup.set()
+        await self._notify_closed()
+        asyncio.create_task(self._close_expired())
+
+    async def _close_expired(self) -> None:
+        try:
+            await self.websocket.close(code=HEARTBEAT_CLOSE_CODE)
+        except Exception:
+            pass
+
+    async def _run_writer(self) -> None:
+        """Send queued frames in order until the connection closes"""
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                frame = self.queue.popleft()
+                if self.binary:
+                    await self.websocket.send_bytes(frame.binary)
+                else:
+                    await self.websocket.send_text(frame.text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The socket is gone; let the manager clean up without blocking other rooms
+            SEND_FAILURES.inc()
+            self.closed = True
+            self.queue.clear()
+            await self._notify_closed()
+
+    async def _notify_closed(self) -> None:
+        if self.on_close is not None:
+            callback, self.on_close = self.on_close, None
+            await callback(self)
+
+    async def stop(self) -> None:
+        """Stop the writer task and discard anything still queued"""
+        self.closed = True
+        self.on_close = None
+        self.queue.clear()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            try:
+                await self._writer
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._writer = None
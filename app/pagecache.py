@@ -0,0 +1,45 @@
+import hashlib
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from .encoding import Frame
+
+
+class CachedPage:
+    """A history page encoded once, with the entity tag HTTP clients revalidate it by"""
+
+    __slots__ = ("validator", "frame", "body", "etag")
+
+    def __init__(self, validator: Any, frame: Frame):
+        self.validator = validator
+        self.frame = frame  # shared with websocket clients, which reuse its cached encodings
+        self.body = frame.text.encode()
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=12).hexdigest() + '"'
+
+
+class PageCache:
+    """LRU cache of encoded history pages.
+
+    Each entry remembers the room version it was built from; a lookup with a different
+    version misses, so entries go stale the moment the room changes and never before.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Hashable, CachedPage]" = OrderedDict()
+
+    def get(self, key: Hashable, validator: Any) -> Optional[CachedPage]:
+        page = self.entries.get(key)
+        if page is None or page.validator != validator:
+            return None
+        self.entries.move_to_end(key)
+        return page
+
+    def put(self, key: Hashable, validator: Any, frame: Frame) -> CachedPage:
+        page = CachedPage(validator, frame)
+        if self.max_entries > 0:
+            self.entries[key] = page
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return page
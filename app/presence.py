@@ -0,0 +1,135 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from .timers import RoomTimers
+
+# Called with (room, event) to deliver a presence change to the room's local clients
+Flush = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class Presence:
+    """Who is online in each room: local connection counts per username plus the members of other nodes.
+
+    A user with several tabs open has several connections but is one member; they join with
+    their first connection and leave with their last.
+    """
+
+    def __init__(self):
+        self.local: Dict[str, Dict[str, int]] = {}  # room ➞ {username: open connections on this node}
+        self.remote: Dict[str, Dict[str, Set[str]]] = {}  # room ➞ {node_id: usernames online there}
+
+    def is_online(self, room: str, username: str) -> bool:
+        """O(1) in the number of members"""
+        if username in self.local.get(room, ()):
+            return True
+        return any(username in usernames for usernames in self.remote.get(room, {}).values())
+
+    def is_local(self, room: str, username: str) -> bool:
+        return username in self.local.get(room, ())
+
+    def online(self, room: str) -> List[str]:
+        """Distinct usernames online in a room on any node"""
+        online = dict.fromkeys(self.local.get(room, ()))
+        for usernames in self.remote.get(room, {}).values():
+            online.update(dict.fromkeys(usernames))
+        return list(online)
+
+    def local_users(self, room: str) -> List[str]:
+        return list(self.local.get(room, ()))
+
+    def add_local(self, room: str, username: str) -> bool:
+        """Count a new local connection. Returns True if it is the user's first on this node."""
+        counts = self.local.setdefault(room, {})
+        counts[username] = counts.get(username, 0) + 1
+        return counts[username] == 1
+
+    def remove_local(self, room: str, username: str) -> bool:
+        """Forget a local connection. Returns True if it was the user's last on this node."""
+        counts = self.local.get(room)
+        if counts is None or username not in counts:
+            return False
+        counts[username] -= 1
+        if counts[username]:
+            return False
+        del counts[username]
+        if not counts:
+            del self.local[room]
+        return True
+
+    def add_remote(self, room: str, node: str, username: str) -> None:
+        self.remote.setdefault(room, {}).setdefault(node, set()).add(username)
+
+    def remove_remote(self, room: str, node: str, username: str) -> None:
+        self.remote.get(room, {}).get(node, set()).discard(username)
+
+    def set_remote(self, room: str, node: str, usernames: Iterable[str]) -> Set[str]:
+        """Replace a node's member list. Returns the users whose membership on that node changed."""
+        previous = self.remote.setdefault(room, {}).get(node, set())
+        current = set(usernames)
+        self.remote[room][node] = current
+        return previous ^ current
+
+    def drop_node(self, room: str, node: str) -> Set[str]:
+        """Forget a node that went away. Returns its members."""
+        return self.remote.get(room, {}).pop(node, set())
+
+    def drop_remote(self, room: str) -> None:
+        """Stop tracking other nodes' members once this node has left the room"""
+        self.remote.pop(room, None)
+
+
+class PresenceBatcher:
+    """Collects a room's join/leave changes and announces them as one delta per window.
+
+    During a join storm each client receives a handful of deltas instead of one event per join.
+    Users who leave and come back within a window are not announced at all.
+    """
+
+    def __init__(self, delay: float, presence: Presence, flush: Flush):
+        self.delay = delay
+        self.presence = presence
+        self.flush = flush
+        self.pending: Dict[str, Dict[str, bool]] = {}  # room ➞ {username: online before this window}
+        self.timers = RoomTimers(self._flush, "presence")
+
+    async def changed(self, room: str, username: str, was_online: bool) -> None:
+        """Record that a user's membership may have changed"""
+        pending = self.pending.get(room)
+        if pending is None:
+            pending = self.pending[room] = {}
+            if self.delay:
+                self.timers.schedule(room, self.delay)
+        pending.setdefault(username, was_online)
+        if not self.delay:
+            await self._flush(room)
+
+    async def flush_now(self, room: str) -> None:
+        """Announce a room's pending changes immediately, e.g. before the room is torn down"""
+        self.timers.cancel(room)
+        await self._flush(room)
+
+    async def _flush(self, room: str) -> None:
+        pending = self.pending.pop(room, None)
+        if not pending:
+            return
+        joined: List[str] = []
+        left: List[str] = []
+        for username, was_online in pending.items():
+            online = self.presence.is_online(room, username)
+            if online and not was_online:
+                joined.append(username)
+            elif was_online and not online:
+                left.append(username)
+        event = presence_event(joined, left)
+        if event is not None:
+            await self.flush(room, event)
+
+
+def presence_event(joined: List[str], left: List[str]) -> Optional[Dict[str, Any]]:
+    """A single join or leave, or a presence delta when several users changed at once"""
+    if len(joined) + len(left) > 1:
+        return {"type": "presence", "joined": joined, "left": left}
+    if joined:
+        return {"type": "join", "user": joined[0]}
+    if left:
+        return {"type": "leave", "user": left[0]}
+    return None
@@ -0,0 +1,55 @@
+import sys
+import threading
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+
+def _stack(frame: Optional[FrameType]) -> str:
+    """A frame's call stack, outermost first, as `file:function` entries joined by semicolons"""
+    entries = []
+    while frame is not None:
+        code = frame.f_code
+        entries.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(entries))
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack from a background thread at a fixed interval.
+
+    Costs nothing when stopped and roughly one stack walk per interval while running, so it
+    can be switched on against a loaded server. Output is in collapsed-stack format, which
+    flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="chat-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[_stack(frame)] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
@@ -0,0 +1,209 @@
+import asyncio
+import time
+from enum import Enum
+from typing import Dict, Optional, Set, Tuple
+
+from .metrics import RATE_LIMITED
+
+# Operation types that share one limit
+LIMIT_GROUPS = {"add_reaction": "reaction", "remove_reaction": "reaction", "typing": "signal", "seen": "signal"}
+# Limit applied to operation types without one of their own
+DEFAULT_GROUP = "*"
+
+
+class RateLimitAction(str, Enum):
+    """What to do with a client that exceeds its limits"""
+    THROTTLE = "throttle"      # slow down its frames and drop operations over their limit
+    DISCONNECT = "disconnect"  # close the connection
+
+
+# Close codes: "Policy Violation" for floods, "Message Too Big" for oversized frames
+RATE_LIMIT_CLOSE_CODE = 1008
+FRAME_TOO_BIG_CLOSE_CODE = 1009
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a connection must be closed for exceeding its limits"""
+
+    def __init__(self, code: int = RATE_LIMIT_CLOSE_CODE):
+        super().__init__(code)
+        self.code = code
+
+
+def parse_limit(spec: str) -> Optional[Tuple[float, float]]:
+    """Parse "rate/burst" (or just "rate", burst = rate) into operations per second and bucket size"""
+    spec = spec.strip()
+    if not spec:
+        return None
+    rate, _, burst = spec.partition("/")
+    return float(rate), float(burst or rate)
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "message=5/10,reaction=20/40,*=50/100" into {group: (rate, burst)}"""
+    limits: Dict[str, Tuple[float, float]] = {}
+    for item in spec.split(","):
+        if item.strip():
+            group, _, limit = item.partition("=")
+            parsed = parse_limit(limit)
+            if parsed is not None:
+                limits[group.strip()] = parsed
+    return limits
+
+
+class TokenBucket:
+    """Allows `rate` operations per second on average and bursts of up to `burst`"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        # A bucket created after the caller read the clock must not see time run backwards
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def ready(self, now: float) -> bool:
+        """Whether a token is available, without taking it"""
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self, now: float) -> bool:
+        if self.ready(now):
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available"""
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class Buckets:
+    """Lazily created token buckets, one per limit group"""
+
+    __slots__ = ("limits", "buckets")
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]]):
+        self.limits = limits
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def get(self, frame_type: str) -> Optional[TokenBucket]:
+        group = LIMIT_GROUPS.get(frame_type, frame_type)
+        if group not in self.limits:
+            group = DEFAULT_GROUP
+            if group not in self.limits:
+                return None
+        bucket = self.buckets.get(group)
+        if bucket is None:
+            bucket = self.buckets[group] = TokenBucket(*self.limits[group])
+        return bucket
+
+
+class RateLimiter:
+    """Inbound limits: frames per connection, operations per connection and per room, and frame size"""
+
+    def __init__(self, action: str, max_frame_bytes: int, frame_limit: str, connection_limits: str, room_limits: str):
+        self.action = RateLimitAction(action)
+        self.max_frame_bytes = max_frame_bytes
+        self.frame_limit = parse_limit(frame_limit)
+        self.connection_limits = parse_limits(connection_limits)
+        self.room_limits = parse_limits(room_limits)
+        self.rooms: Dict[str, Buckets] = {}
+
+    def for_connection(self) -> "ConnectionLimits":
+        return ConnectionLimits(self)
+
+    def room_bucket(self, room: str, frame_type: str) -> Optional[TokenBucket]:
+        buckets = self.rooms.get(room)
+        if buckets is None:
+            if not self.room_limits:
+                return None
+            buckets = self.rooms[room] = Buckets(self.room_limits)
+        return buckets.get(frame_type)
+
+    def forget_room(self, room: str) -> None:
+        """Drop a room's buckets once it has no local members"""
+        self.rooms.pop(room, None)
+
+
+class ConnectionLimits:
+    """One connection's buckets"""
+
+    __slots__ = ("limiter", "frames", "operations", "warned")
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+        self.frames = TokenBucket(*limiter.frame_limit) if limiter.frame_limit else None
+        self.operations = Buckets(limiter.connection_limits)
+        # Buckets (its own or its room's) this client has been told it is limited by since its last
+        # admitted operation under them. Kept per connection: a room bucket is shared by every member.
+        self.warned: Set[TokenBucket] = set()
+
+    def admit_text(self, text: str) -> bool:
+        """Check a received text frame's UTF-8 size, encoding it only when its length leaves it in doubt"""
+        limit = self.limiter.max_frame_bytes
+        if len(text) * 4 <= limit:
+            return True  # even four bytes per character fits
+        if len(text) > limit:
+            return self.admit_size(len(text))  # at least one byte per character does not
+        return self.admit_size(len(text.encode()))
+
+    def admit_size(self, size: int) -> bool:
+        """Check a received frame's size before it is decoded"""
+        if size <= self.limiter.max_frame_bytes:
+            return True
+        RATE_LIMITED.labels("size").inc()
+        if self.limiter.action == RateLimitAction.DISCONNECT:
+            raise RateLimitExceeded(FRAME_TOO_BIG_CLOSE_CODE)
+        return False
+
+    async def pace_frames(self) -> None:
+        """Take a frame token before decoding, waiting for one when throttling.
+
+        While the receive loop waits, the server stops reading the socket, so a flooding client
+        is held back by TCP flow control instead of costing decode and dispatch CPU.
+        """
+        if self.frames is None:
+            return
+        now = time.monotonic()
+        if self.frames.take(now):
+            return
+        RATE_LIMITED.labels("frames").inc()
+        if self.limiter.action == RateLimitAction.DISCONNECT:
+            raise RateLimitExceeded()
+        await asyncio.sleep(self.frames.wait_time(now))
+        # Spend the token we waited for, even if clock rounding left it just short of 1
+        self.frames._refill(time.monotonic())
+        self.frames.tokens -= 1
+
+    def admit(self, room: str, frame_type: str) -> Optional[TokenBucket]:
+        """Take a token for one operation from the connection's and the room's buckets.
+
+        Both are checked before either is charged, so an operation the room refuses does not
+        also use up the sender's own allowance. Returns None if the operation may run, or the
+        exhausted bucket if it must be dropped. Only the connection's own limit can close it:
+        a room bucket is shared, and whoever sends after a flooder drained it is not to blame.
+        """
+        now = time.monotonic()
+        connection_bucket = self.operations.get(frame_type)
+        room_bucket = self.limiter.room_bucket(room, frame_type)
+        if connection_bucket is not None and not connection_bucket.ready(now):
+            RATE_LIMITED.labels("connection").inc()
+            if self.limiter.action == RateLimitAction.DISCONNECT:
+                raise RateLimitExceeded()
+            return connection_bucket
+        if room_bucket is not None and not room_bucket.ready(now):
+            RATE_LIMITED.labels("room").inc()
+            return room_bucket
+        for bucket in (connection_bucket, room_bucket):
+            if bucket is not None:
+                bucket.take(now)
+                self.warned.discard(bucket)
+        return None
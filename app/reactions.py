@@ -0,0 +1,53 @@
+import sys
+from typing import Dict, List, Optional, Set
+
+
+class ReactionIndex:
+    """Reactions on one message: emoji ➞ set of usernames, with O(1) membership tests and counts.
+
+    Emoji and usernames are interned, so the same few strings are shared by every message.
+    """
+
+    __slots__ = ("users",)
+
+    def __init__(self):
+        self.users: Dict[str, Set[str]] = {}
+
+    def add(self, emoji: str, username: str) -> Optional[int]:
+        """Add a reaction. Returns the new count, or None if the user had already reacted."""
+        users = self.users.get(emoji)
+        if users is None:
+            users = self.users[sys.intern(emoji)] = set()
+        elif username in users:
+            return None
+        users.add(sys.intern(username))
+        return len(users)
+
+    def remove(self, emoji: str, username: str) -> Optional[int]:
+        """Remove a reaction. Returns the new count, or None if the user had not reacted."""
+        users = self.users.get(emoji)
+        if users is None or username not in users:
+            return None
+        users.remove(username)
+        if not users:
+            del self.users[emoji]
+            return 0
+        return len(users)
+
+    def count(self, emoji: str) -> int:
+        return len(self.users.get(emoji, ()))
+
+    def counts(self) -> Dict[str, int]:
+        """Per-emoji counts, as sent to clients"""
+        return {emoji: len(users) for emoji, users in self.users.items()}
+
+    def reacted(self, username: str) -> List[str]:
+        """Emoji a user reacted with, so their own reactions can be shown after a reload"""
+        return [emoji for emoji, users in self.users.items() if username in users]
+
+    def reactors(self, emoji: str) -> List[str]:
+        """Users who reacted with an emoji, for on-demand requests"""
+        return sorted(self.users.get(emoji, ()))
+
+    def __len__(self) -> int:
+        return sum(len(users) for users in self.users.values())
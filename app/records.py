@@ -0,0 +1,147 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional, Union
+
+# Message ids are 63-bit integers: milliseconds since ID_EPOCH_MS, a node number and a
+# per-millisecond sequence, so they sort by time and need no coordination per message.
+# Node numbers must be unique among nodes sharing rooms: they come from CHAT_NODE_ID or
+# are handed out by the backplane broker when a node registers. The pid-derived number
+# is only a placeholder until then (and for single-node setups).
+ID_EPOCH_MS = 1_700_000_000_000
+_NODE_BITS = 10
+_SEQUENCE_BITS = 12
+NODE_COUNT = 1 << _NODE_BITS
+_NODE = os.getpid() % NODE_COUNT
+
+# Ids are sent to clients in base 62; ids too large for that are legacy uuid4 strings
+_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_DIGITS = {character: value for value, character in enumerate(_ALPHABET)}
+_MAX_COMPACT_ID = 1 << 64
+_MAX_COMPACT_CHARS = 11
+
+
+def encode_id(message_id: int) -> str:
+    """The external (client-facing) form of a message id"""
+    if message_id >= _MAX_COMPACT_ID:
+        return str(uuid.UUID(int=message_id))
+    if message_id == 0:
+        return "0"
+    characters = []
+    while message_id:
+        message_id, digit = divmod(message_id, 62)
+        characters.append(_ALPHABET[digit])
+    return "".join(reversed(characters))
+
+
+def decode_id(text: Any) -> Optional[int]:
+    """Parse an external message id; None if it is not one this server could have issued"""
+    if not isinstance(text, str) or not text:
+        return None
+    if len(text) == 36:
+        try:
+            return uuid.UUID(text).int
+        except ValueError:
+            return None
+    if len(text) > _MAX_COMPACT_CHARS or (text[0] == "0" and len(text) > 1):
+        return None  # leading zeros would give one id several spellings
+    value = 0
+    for character in text:
+        digit = _DIGITS.get(character)
+        if digit is None:
+            return None
+        value = value * 62 + digit
+    return value if value < _MAX_COMPACT_ID else None
+
+
+def pack_id(message_id: int) -> Union[int, str]:
+    """A message id as stored on disk: an integer where MessagePack can hold one"""
+    return message_id if message_id < _MAX_COMPACT_ID else encode_id(message_id)
+
+
+def unpack_id(value: Union[int, str]) -> Optional[int]:
+    return value if isinstance(value, int) else decode_id(value)
+
+
+class IdGenerator:
+    """Time-ordered message ids, unique within the process across threads"""
+
+    def __init__(self, node: int = _NODE):
+        self.node = node
+        self.last_ms = 0
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def next(self) -> int:
+        with self.lock:
+            now = int(time.time() * 1000) - ID_EPOCH_MS
+            if now > self.last_ms:
+                self.last_ms, self.sequence = now, 0
+            else:
+                # Same millisecond (or the clock stepped back): keep counting, borrowing the next millisecond if full
+                self.sequence += 1
+                if self.sequence >> _SEQUENCE_BITS:
+                    self.last_ms, self.sequence = self.last_ms + 1, 0
+            return (self.last_ms << (_NODE_BITS + _SEQUENCE_BITS)) | (self.node << _SEQUENCE_BITS) | self.sequence
+
+
+message_ids = IdGenerator()
+
+
+def set_node(node: int) -> None:
+    """Switch this process's message ids to a node number reserved for it"""
+    if not 0 <= node < NODE_COUNT:
+        raise ValueError(f"node number must be in 0..{NODE_COUNT - 1}, got {node}")
+    with message_ids.lock:
+        message_ids.node = node
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def format_timestamp(timestamp_ms: int) -> str:
+    """Client-facing timestamp: local time in ISO 8601, as messages have always carried"""
+    return datetime.fromtimestamp(timestamp_ms / 1000).isoformat()
+
+
+def parse_timestamp(value: Union[int, str]) -> int:
+    """Epoch milliseconds from a stored or received timestamp (milliseconds or ISO 8601)"""
+    if isinstance(value, int):
+        return value
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+class StoredMessage:
+    """A chat message as held in memory: four slots and no per-message dicts.
+
+    Usernames are interned so every message from a user shares one string, and reactions
+    live in the history store only for messages that have any.
+    """
+
+    __slots__ = ("id", "user", "content", "timestamp")
+
+    def __init__(self, message_id: int, user: str, content: Optional[str], timestamp: int):
+        self.id = message_id
+        self.user = sys.intern(user)
+        self.content = content
+        self.timestamp = timestamp  # epoch milliseconds
+
+    @classmethod
+    def new(cls, user: str, content: str) -> "StoredMessage":
+        return cls(message_ids.next(), user, content, now_ms())
+
+    @classmethod
+    def from_event(cls, event: Dict[str, Any]) -> Optional["StoredMessage"]:
+        """Rebuild a message from another node's broadcast event; None if its id is malformed"""
+        message_id = decode_id(event.get("message_id"))
+        if message_id is None:
+            return None
+        return cls(message_id, event["user"], event.get("content"), parse_timestamp(event["timestamp"]))
+
+    @property
+    def message_id(self) -> str:
+        return encode_id(self.id)
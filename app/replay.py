@@ -0,0 +1,158 @@
+import secrets
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+
+from .encoding import Frame
+
+# Rough cost of a remembered frame beyond its encoding: the event dict and its keys and
+# values (about the encoding's size again, since the dict holds the same strings) plus slots
+FRAME_OVERHEAD_BYTES = 300
+
+
+def frame_size(frame: Frame) -> int:
+    """Approximate memory held by a frame kept for replay (the event and its cached encodings).
+
+    Sized from whichever encoding the recipients already produced, so a room of MessagePack
+    clients never pays for a JSON encoding just to be measured.
+    """
+    return FRAME_OVERHEAD_BYTES + 2 * frame.encoded_size()
+
+
+class ReplayWindow:
+    """Numbers a room's broadcast events and keeps the most recent ones for reconnecting clients"""
+
+    __slots__ = ("epoch", "seq", "frames", "sizes", "size")
+
+    def __init__(self, size: int):
+        # Sequence numbers restart when a window is recreated (new process, evicted room),
+        # so clients resume with the epoch they were given as well as the last seq they saw
+        self.epoch = secrets.token_hex(6)
+        self.seq = 0  # sequence number of the newest event
+        self.frames: Deque[Frame] = deque(maxlen=size)
+        self.sizes: Deque[int] = deque(maxlen=size)  # frame_size of each remembered frame, as charged
+        self.size = 0  # approximate bytes held by `frames`
+
+    def stamp(self, frame: Frame) -> None:
+        """Assign the next sequence number to an event, before it is encoded"""
+        self.seq += 1
+        frame.event["seq"] = self.seq
+
+    def keep(self, frame: Frame) -> int:
+        """Remember the newest stamped event once it is encoded. Returns the change in bytes held."""
+        if self.frames.maxlen == 0:
+            return 0
+        size = frame_size(frame)
+        change = size
+        if len(self.frames) == self.frames.maxlen:
+            self.frames.popleft()
+            change -= self.sizes.popleft()
+        self.frames.append(frame)
+        self.sizes.append(size)
+        self.size += change
+        return change
+
+    def trim(self) -> int:
+        """Forget the oldest remembered event. Returns the bytes freed."""
+        self.frames.popleft()
+        freed = self.sizes.popleft()
+        self.size -= freed
+        return freed
+
+    def since(self, epoch: str, seq: int) -> Optional[List[Frame]]:
+        """Events after `seq`, or None when the client cannot catch up from this window"""
+        if epoch != self.epoch or seq > self.seq:
+            return None
+        missed = self.seq - seq
+        if missed > len(self.frames):
+            return None
+        return list(self.frames)[len(self.frames) - missed:] if missed else []
+
+
+class ReplayWindows:
+    """Replay windows for recently active rooms, under a byte budget of their own.
+
+    A window is kept for `idle_ttl` seconds after its room empties, so a reconnect storm
+    can resume, then dropped. Over the budget, least recently active windows go first.
+    """
+
+    def __init__(self, size: int, max_rooms: int, max_bytes: int, idle_ttl: float):
+        self.size = size
+        self.max_rooms = max_rooms
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.rooms: "OrderedDict[str, ReplayWindow]" = OrderedDict()  # least recently active first
+        self.idle: "OrderedDict[str, float]" = OrderedDict()  # emptied room ➞ monotonic time it emptied
+        self.total_size = 0
+        self.evicted_rooms = 0  # windows dropped for the room or byte limits
+
+    def get(self, room: str) -> ReplayWindow:
+        """A room's window, created if needed, for a member joining it: its idle clock stops"""
+        self.expire(time.monotonic())
+        self.idle.pop(room, None)
+        window = self.rooms.get(room)
+        if window is None:
+            window = self.rooms[room] = ReplayWindow(self.size)
+            while len(self.rooms) > self.max_rooms:
+                self._drop(next(iter(self.rooms)))
+                self.evicted_rooms += 1
+        else:
+            self.rooms.move_to_end(room)
+        return window
+
+    def stamp(self, room: str, frame: Frame, occupied: bool = True) -> None:
+        """Number a room's event before it is encoded. In a room without local members (a last
+        leave still being announced) it only goes into a window already kept for resumes, and
+        that window's idle clock keeps running."""
+        if occupied:
+            window = self.get(room)
+        else:
+            self.expire(time.monotonic())
+            window = self.rooms.get(room)
+            if window is None:
+                return
+        window.stamp(frame)
+
+    def keep(self, room: str, frame: Frame) -> None:
+        """Remember a stamped event once its recipients have encoded it, within the byte budget"""
+        window = self.rooms.get(room)
+        if window is None or frame.event.get("seq") != window.seq:
+            return
+        self.total_size += window.keep(frame)
+        while self.total_size > self.max_bytes:
+            oldest = next(iter(self.rooms))
+            if oldest != room:
+                self._drop(oldest)
+                self.evicted_rooms += 1
+            elif window.frames:
+                self.total_size -= window.trim()
+            else:
+                break
+
+    def release(self, room: str) -> None:
+        """Start the idle clock of a room that has no members left"""
+        if room in self.rooms:
+            self.idle[room] = time.monotonic()
+            self.idle.move_to_end(room)
+
+    def expire(self, now: float) -> None:
+        """Drop the windows of rooms that have been empty for longer than the idle TTL"""
+        while self.idle:
+            room, since = next(iter(self.idle.items()))
+            if since > now - self.idle_ttl:
+                break
+            self._drop(room)
+
+    def _drop(self, room: str) -> None:
+        window = self.rooms.pop(room, None)
+        self.idle.pop(room, None)
+        if window is not None:
+            self.total_size -= window.size
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rooms": len(self.rooms),
+            "bytes": self.total_size,
+            "max_bytes": self.max_bytes,
+            "evicted_rooms": self.evicted_rooms,
+        }
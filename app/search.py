@@ -0,0 +1,100 @@
+import heapq
+import itertools
+import math
+import re
+import unicodedata
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+
+_TOKEN = re.compile(r"\w+")
+# Longer tokens are truncated, so a pasted blob cannot grow the vocabulary without bound
+MAX_TOKEN_CHARS = 32
+# Query terms beyond this are ignored
+MAX_QUERY_TERMS = 8
+
+
+def tokenize(text: Optional[str]) -> Set[str]:
+    """Distinct search terms in a text: NFKC-normalized, case-folded words of two or more characters"""
+    if not text:
+        return set()
+    return {
+        token[:MAX_TOKEN_CHARS]
+        for token in _TOKEN.findall(unicodedata.normalize("NFKC", text).casefold())
+        if len(token) > 1
+    }
+
+
+class RoomIndex:
+    """Inverted index over one room's held messages: term ➞ cursors of the messages containing it.
+
+    Cursors are appended in order and the history evicts oldest first, so a posting list
+    only ever grows at the end and shrinks at the front.
+    """
+
+    __slots__ = ("postings",)
+
+    def __init__(self):
+        self.postings: Dict[str, array] = {}
+
+    def add(self, cursor: int, text: Optional[str]) -> int:
+        """Index a message. Returns the number of terms indexed."""
+        terms = tokenize(text)
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = array("q")
+            postings.append(cursor)
+        return len(terms)
+
+    def remove(self, cursor: int, text: Optional[str]) -> int:
+        """Unindex an evicted message. Returns the number of terms it had."""
+        terms = tokenize(text)
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            if postings and postings[0] == cursor:
+                del postings[0]
+            else:
+                try:
+                    postings.remove(cursor)
+                except ValueError:
+                    pass
+            if not postings:
+                del self.postings[term]
+        return len(terms)
+
+    def search(self, terms: Set[str], documents: int, limit: int) -> Tuple[List[Tuple[float, int]], int]:
+        """Top `limit` (score, cursor) pairs, best first, plus the number of matching messages.
+
+        A message scores the sum of the inverse document frequencies of the terms it
+        contains, so messages with more (and rarer) terms rank first; ties go to the newest.
+        Scoring works on whole posting sets, one region per combination of terms, so the
+        cost does not grow with a Python loop over every matching message.
+        """
+        postings = {term: self.postings[term] for term in terms if term in self.postings}
+        if not postings:
+            return [], 0
+        weights = {term: math.log(1 + documents / len(cursors)) for term, cursors in postings.items()}
+        if len(postings) == 1:
+            (term, cursors), = postings.items()
+            return [(weights[term], cursor) for cursor in reversed(cursors[-limit:])], len(cursors)
+
+        sets = {term: set(cursors) for term, cursors in postings.items()}
+        combinations = [
+            combination
+            for size in range(len(sets), 0, -1)
+            for combination in itertools.combinations(sorted(sets), size)
+        ]
+        combinations.sort(key=lambda combination: -sum(weights[term] for term in combination))
+        ranked: List[Tuple[float, int]] = []
+        for combination in combinations:
+            # Messages containing exactly these terms
+            region = set.intersection(*(sets[term] for term in combination))
+            region.difference_update(*(sets[term] for term in sets if term not in combination))
+            if region:
+                score = sum(weights[term] for term in combination)
+                ranked.extend((score, cursor) for cursor in heapq.nlargest(limit - len(ranked), region))
+                if len(ranked) >= limit:
+                    break
+        return ranked, len(set.union(*sets.values()))
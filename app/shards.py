@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from fastapi import WebSocket
+
+from .encoding import Frame
+from .metrics import BROADCAST_RECIPIENTS, CONNECTS, CONNECT_SECONDS
+from .outbound import Connection
+from .pagecache import CachedPage
+
+
+class LoopRelay:
+    """Runs callbacks on another thread's event loop, one wakeup per burst instead of one per call"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.pending: Deque[Tuple[Callable[..., Any], tuple]] = deque()
+        self.scheduled = False
+        self.recipients = 0  # connections that queued the current broadcast's frame, counted on `loop`
+
+    def post(self, callback: Callable[..., Any], *args: Any) -> None:
+        self.pending.append((callback, args))
+        if not self.scheduled:
+            self.scheduled = True
+            self.loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self) -> None:
+        # Cleared before draining: anything posted from now on schedules another drain
+        self.scheduled = False
+        while self.pending:
+            callback, args = self.pending.popleft()
+            callback(*args)
+
+    def enqueue(self, connection: Connection, frame: Frame) -> None:
+        """Queue a frame on a connection of the target loop, counting it if the connection takes it"""
+        self.post(self._enqueue, connection, frame)
+
+    def _enqueue(self, connection: Connection, frame: Frame) -> None:
+        self.recipients += connection.enqueue(frame)
+
+    def end_broadcast(self) -> None:
+        """Record the recipients of the frames relayed since the last broadcast, once they are queued"""
+        self.post(self._observe_recipients)
+
+    def _observe_recipients(self) -> None:
+        BROADCAST_RECIPIENTS.observe(self.recipients)
+        self.recipients = 0
+
+
+class RelayedConnection:
+    """A shard's view of a connection whose socket and writer live on the accepting loop.
+
+    Frames are encoded on the shard, then handed to the real connection's queue through
+    the relay; everything else reads through to the real connection.
+    """
+
+    def __init__(self, connection: Connection, manager: Any, relay: LoopRelay):
+        self.connection = connection
+        self.manager = manager
+        self.relay = relay
+        self.detached = False
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.connection, name)
+
+    def enqueue(self, frame: Frame) -> bool:
+        if self.detached or self.connection.closed:
+            return False
+        # Encode here so the work is spread across shards and reflects state at broadcast time
+        frame.encode(self.connection.binary)
+        self.relay.enqueue(self.connection, frame)
+        return True  # handed over; the relay counts whether the connection actually queued it
+
+    async def stop(self) -> None:
+        """The shard is done with this connection; the accepting loop stops its writer"""
+        self.detached = True
+
+
+class Shard:
+    """An event loop thread running its own ConnectionManager for a subset of rooms"""
+
+    def __init__(self, index: int, factory: Callable[[], Any]):
+        self.index = index
+        self.factory = factory
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name=f"chat-shard-{index}", daemon=True)
+        self.manager: Any = None
+        self.relay: Optional[LoopRelay] = None  # back to the accepting loop
+
+    def run(self, coroutine: Awaitable[Any]) -> Awaitable[Any]:
+        """Run a coroutine on this shard's loop and await its result from the calling loop"""
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self.loop))
+
+    async def start(self, accepting_loop: asyncio.AbstractEventLoop) -> None:
+        self.relay = LoopRelay(accepting_loop)
+        self.thread.start()
+        self.manager = await self.run(self._create())
+
+    async def _create(self) -> Any:
+        # Created on the shard's loop so its timers, locks and tasks belong to that loop
+        manager = self.factory()
+        manager.relay = self.relay
+        await manager.start()
+        return manager
+
+    async def stop(self) -> None:
+        await self.run(self.manager.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        await asyncio.to_thread(self.thread.join)
+        self.loop.close()
+
+
+class ShardedManager:
+    """Spreads rooms over N shard event loops by hash of the room name.
+
+    The server's loop keeps the sockets: it accepts clients, decodes their frames and runs
+    their writers, while the owning shard holds the room's state and does its fan-out.
+    Shards are threads, so on a GIL build of CPython they overlap only where the work
+    releases the GIL; see benchmarks/shards.py for the measured curve.
+    """
+
+    def __init__(self, shards: int, factory: Callable[[], Any]):
+        self.shards = [Shard(index, factory) for index in range(shards)]
+        self.connections: Dict[int, Tuple[Shard, RelayedConnection]] = {}  # ws_id ➞ owning shard and its view
+
+    def shard_for(self, room: str) -> Shard:
+        # crc32 rather than hash(): stable across processes and restarts
+        return self.shards[zlib.crc32(room.encode()) % len(self.shards)]
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        for shard in self.shards:
+            await shard.start(loop)
+
+    async def stop(self) -> None:
+        for shard in self.shards:
+            await shard.stop()
+
+    async def connect(self, room: str, username: str, websocket: WebSocket, since: Optional[int] = None, epoch: Optional[str] = None) -> Connection:
+        started = time.perf_counter()
+        shard = self.shard_for(room)
+        # The handshake and writer stay on this loop, which owns the socket
+        connection = await shard.manager.accept(room, username, websocket, on_close=self._on_connection_closed)
+        relayed = RelayedConnection(connection, shard.manager, shard.relay)
+        self.connections[id(websocket)] = (shard, relayed)
+        await shard.run(shard.manager.attach(relayed, since, epoch))
+        CONNECTS.inc()
+        CONNECT_SECONDS.observe(time.perf_counter() - started)
+        return connection
+
+    async def dispatch(self, connection: Connection, frame: Any) -> None:
+        entry = self.connections.get(id(connection.websocket))
+        if entry is not None:
+            shard, relayed = entry
+            # Awaited so each client's frames are handled in order
+            await shard.run(shard.manager.dispatch(relayed, frame))
+
+    async def disconnect(self, room: str, websocket: WebSocket, reason: str = "client") -> None:
+        entry = self.connections.pop(id(websocket), None)
+        if entry is None:
+            return
+        shard, relayed = entry
+        await shard.run(shard.manager.disconnect(room, websocket, reason))
+        await relayed.connection.stop()
+
+    async def _on_connection_closed(self, connection: Connection) -> None:
+        await self.disconnect(connection.room, connection.websocket, reason=connection.close_reason)
+
+    async def history_page(self, room: str, limit: int, before: Optional[int] = None) -> Dict[str, Any]:
+        shard = self.shard_for(room)
+        return await shard.run(shard.manager.history_page(room, limit, before))
+
+    async def cached_history_page(self, room: str, limit: int, before: Optional[int] = None) -> CachedPage:
+        shard = self.shard_for(room)
+        return await shard.run(shard.manager.cached_history_page(room, limit, before))
+
+    async def export_chunk(self, room: str, start: int, limit: int) -> Tuple[bytes, Optional[int]]:
+        shard = self.shard_for(room)
+        return await shard.run(shard.manager.export_chunk(room, start, limit))
+
+    async def search(self, room: str, query: str, limit: int, offset: int = 0) -> Dict[str, Any]:
+        shard = self.shard_for(room)
+        return await shard.run(shard.manager.search(room, query, limit, offset))
+
+    async def stats(self) -> Dict[str, Any]:
+        shards: List[Dict[str, Any]] = [await shard.run(shard.manager.stats()) for shard in self.shards]
+        history: Dict[str, int] = {}
+        replay: Dict[str, int] = {}
+        for stats in shards:
+            for key, value in stats["history"].items():
+                history[key] = value if key == "room_depth" else history.get(key, 0) + value
+            for key, value in stats["replay"].items():
+                replay[key] = replay.get(key, 0) + value
+        return {"history": history, "replay": replay, "shards": shards}
+
+    async def gauges(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for shard in self.shards:
+            for name, value in (await shard.run(shard.manager.gauges())).items():
+                totals[name] = max(totals.get(name, 0), value) if name == "max_queue_depth" else totals.get(name, 0) + value
+        return totals
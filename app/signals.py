@@ -0,0 +1,47 @@
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from .timers import RoomTimers
+
+# Called with (room, event) when a room's pending signals are flushed
+Flush = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class SignalBatcher:
+    """Ephemeral per-user signals (typing indicators, seen markers) merged into one frame per window.
+
+    Signals are never stored or replayed. Within a window only the latest signal of each
+    type from each user survives, so a burst of keystrokes costs a room one small frame.
+    """
+
+    def __init__(self, delay: float, flush: Flush):
+        self.delay = delay
+        self.flush = flush
+        self.pending: Dict[str, Dict[Tuple[str, str], Dict[str, Any]]] = {}  # room ➞ {(user, type): latest event}
+        self.coalesced = 0  # signals replaced by a later one before being sent
+        self.timers = RoomTimers(self._flush, "signal")
+
+    async def post(self, room: str, event: Dict[str, Any]) -> None:
+        pending = self.pending.get(room)
+        if pending is None:
+            pending = self.pending[room] = {}
+            if self.delay:
+                self.timers.schedule(room, self.delay)
+        key = (event["user"], event["type"])
+        if key in pending:
+            self.coalesced += 1
+            del pending[key]  # re-inserted below, so events keep the order of their latest update
+        pending[key] = event
+        if not self.delay:
+            await self._flush(room)
+
+    async def flush_now(self, room: str) -> None:
+        """Send a room's pending signals immediately, e.g. before the room is torn down"""
+        self.timers.cancel(room)
+        await self._flush(room)
+
+    async def _flush(self, room: str) -> None:
+        pending = self.pending.pop(room, None)
+        if not pending:
+            return
+        events = list(pending.values())
+        await self.flush(room, events[0] if len(events) == 1 else {"type": "batch", "events": events})
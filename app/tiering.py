@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import mmap
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+import msgpack
+
+from .reactions import ReactionIndex
+from .records import StoredMessage, pack_id, unpack_id
+
+logger = logging.getLogger(__name__)
+
+
+def encode_room(appended: int, messages: Iterable[StoredMessage], reactions: Dict[int, ReactionIndex]) -> bytes:
+    """Compact snapshot of a room: [appended, [[id, user, content, timestamp, {emoji: [users]} | None], ...]]"""
+    rows = []
+    for message in messages:
+        index = reactions.get(message.id)
+        rows.append([
+            pack_id(message.id), message.user, message.content, message.timestamp,
+            {emoji: list(users) for emoji, users in index.users.items()} if index is not None else None,
+        ])
+    return msgpack.packb([appended, rows], use_bin_type=True)
+
+
+def decode_room(data: Any) -> Tuple[int, List[Tuple[StoredMessage, Dict[str, List[str]]]]]:
+    """Inverse of encode_room. Accepts any buffer, including an mmap."""
+    appended, rows = msgpack.unpackb(data, raw=False)
+    messages = []
+    for message_id, user, content, timestamp, reactions in rows:
+        messages.append((StoredMessage(unpack_id(message_id), user, content, timestamp), reactions or {}))
+    return appended, messages
+
+
+class ColdStore:
+    """Snapshots of idle rooms, spilled out of memory and read back on first use.
+
+    Spilling is two-phase: `spill` keeps the encoded snapshot in memory (a fraction of the
+    objects it replaces) until `write_pending` moves it to disk off the event loop. Files
+    live in a directory private to this process, so workers never share or race on them;
+    durability across restarts is the message log's job, not this store's.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory) / uuid.uuid4().hex
+        self.rooms: Set[str] = set()  # rooms whose snapshot is pending or on disk
+        self.pending: Dict[str, bytes] = {}
+        self.spilled = 0
+        self.rehydrated = 0
+
+    def _path(self, room: str) -> Path:
+        return self.directory / f"{uuid.uuid5(uuid.NAMESPACE_URL, room).hex}.room"
+
+    def open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def close(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.rooms.clear()
+        self.pending.clear()
+
+    def spill(self, room: str, snapshot: bytes) -> None:
+        self.rooms.add(room)
+        self.pending[room] = snapshot
+        self.spilled += 1
+
+    def take(self, room: str) -> Tuple[int, List[Tuple[StoredMessage, Dict[str, List[str]]]]]:
+        """Remove a room from the cold tier and return its decoded snapshot"""
+        self.rooms.discard(room)
+        self.rehydrated += 1
+        snapshot = self.pending.pop(room, None)
+        if snapshot is not None:
+            # A file left from an earlier spill of this room is out of date
+            self._path(room).unlink(missing_ok=True)
+            return decode_room(snapshot)
+        path = self._path(room)
+        # Decoded straight from the page cache, without first copying the file into a bytes object
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            decoded = decode_room(data)
+        os.unlink(path)
+        return decoded
+
+    async def write_pending(self) -> int:
+        """Write pending snapshots to disk in a worker thread. Returns how many were written.
+
+        The thread only writes files; `pending` and `rooms` are changed on the event loop
+        alone, once the writes are done, so spills and rehydrations meanwhile are seen.
+        """
+        written = await asyncio.to_thread(self._write_files, dict(self.pending))
+        for room, snapshot in written:
+            if self.pending.get(room) is snapshot:
+                del self.pending[room]
+            elif room not in self.rooms:
+                # Rehydrated while we were writing: the file is stale
+                self._path(room).unlink(missing_ok=True)
+            # else spilled again meanwhile: the newer snapshot stays pending and will overwrite the file
+        return len(written)
+
+    def _write_files(self, snapshots: Dict[str, bytes]) -> List[Tuple[str, bytes]]:
+        """Write snapshots to their files. Touches no shared state, so it can run in a worker thread."""
+        written = []
+        for room, snapshot in snapshots.items():
+            path = self._path(room)
+            temporary = path.with_suffix(".tmp")
+            try:
+                with open(temporary, "wb") as file:
+                    file.write(snapshot)
+                os.replace(temporary, path)
+            except OSError:
+                logger.exception("failed to spill room snapshot to %s", path)
+                continue
+            written.append((room, snapshot))
+        return written
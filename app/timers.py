@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class TimingWheel:
+    """Hashed timing wheel: O(1) schedule and cancel, and each tick only touches the items due in it.
+
+    Delays longer than the wheel's span are clamped, so an item may come due early; callers
+    re-check their own deadline and reschedule rather than trusting the wheel to be exact.
+    """
+
+    def __init__(self, tick: float, slots: int, now: Optional[float] = None):
+        self.tick = tick
+        self.slots: List[Set[Any]] = [set() for _ in range(max(2, slots))]
+        self.positions: Dict[Any, int] = {}  # item ➞ slot it is waiting in
+        self.started = time.monotonic() if now is None else now
+        self.current = 0  # ticks processed so far
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def schedule(self, item: Any, delay: float) -> None:
+        """(Re)schedule an item to come due after `delay` seconds, rounded up to whole ticks"""
+        self.cancel(item)
+        ticks = min(len(self.slots) - 1, max(1, math.ceil(delay / self.tick)))
+        slot = (self.current + ticks) % len(self.slots)
+        self.slots[slot].add(item)
+        self.positions[item] = slot
+
+    def cancel(self, item: Any) -> None:
+        slot = self.positions.pop(item, None)
+        if slot is not None:
+            self.slots[slot].discard(item)
+
+    def advance(self, now: float) -> List[Any]:
+        """Move the wheel up to `now` and return the items that came due, unscheduled"""
+        due: List[Any] = []
+        target = int((now - self.started) / self.tick)
+        while self.current < target:
+            self.current += 1
+            slot = self.current % len(self.slots)
+            items = self.slots[slot]
+            if items:
+                self.slots[slot] = set()
+                for item in items:
+                    del self.positions[item]
+                due.extend(items)
+        return due
+
+
+class RoomTimers:
+    """At most one pending delayed call per room, running `callback(room)` as a task.
+
+    Handles are kept so a room's timer can be moved or cancelled when the room is torn
+    down, the tasks are kept until they finish, and a failure is logged instead of being
+    lost as an unretrieved task exception.
+    """
+
+    def __init__(self, callback: Callable[[str], Awaitable[None]], name: str):
+        self.callback = callback
+        self.name = name  # for the log
+        self.timers: Dict[str, asyncio.TimerHandle] = {}
+        self.deadlines: Dict[str, float] = {}  # room ➞ loop time its timer fires
+        self.tasks: Set[asyncio.Task] = set()
+
+    def __contains__(self, room: str) -> bool:
+        return room in self.timers
+
+    def schedule_at(self, room: str, deadline: float) -> None:
+        """Run the callback for a room at loop time `deadline`, replacing any timer it has"""
+        self.cancel(room)
+        self.timers[room] = asyncio.get_running_loop().call_at(deadline, self._fire, room)
+        self.deadlines[room] = deadline
+
+    def schedule(self, room: str, delay: float) -> None:
+        self.schedule_at(room, asyncio.get_running_loop().time() + delay)
+
+    def deadline(self, room: str) -> Optional[float]:
+        return self.deadlines.get(room)
+
+    def cancel(self, room: str) -> None:
+        timer = self.timers.pop(room, None)
+        self.deadlines.pop(room, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _fire(self, room: str) -> None:
+        self.timers.pop(room, None)
+        self.deadlines.pop(room, None)
+        task = asyncio.ensure_future(self._run(room))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, room: str) -> None:
+        try:
+            await self.callback(room)
+        except Exception:
+            logger.exception("%s flush for room %r failed", self.name, room)
@@ -0,0 +1 @@
+"""Load-test and micro-benchmark suite for the chat server"""
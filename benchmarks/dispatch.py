@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Per-event cost of inbound frame handling.
+
+Two measurements, reported as JSON:
+
+  validate   decode + validate one reaction frame, the old way (json.loads and a Pydantic
+             request model per frame) against the dispatcher's field checks, and against
+             one `batch` frame carrying many operations
+  endpoint   CPU per operation through the whole websocket endpoint in-process, sending
+             each reaction as its own frame versus in `batch` frames of --batch-size ops
+
+    python -m benchmarks.dispatch --ops 20000 --batch-size 50
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, List, Literal
+
+from pydantic import BaseModel
+
+import app.main as server
+from app.ratelimit import RateLimiter
+from .harness import InProcessClient, Recorder
+
+
+class AddReactionRequest(BaseModel):
+    """The legacy per-frame model for add_reaction requests"""
+    type: Literal["add_reaction"]
+    message_id: str
+    emoji: str
+
+
+class RemoveReactionRequest(BaseModel):
+    """The legacy per-frame model for remove_reaction requests"""
+    type: Literal["remove_reaction"]
+    message_id: str
+    emoji: str
+
+
+def reaction_ops(count: int, message_id: str) -> List[Dict[str, Any]]:
+    """Alternating add/remove so every operation changes state and is broadcast"""
+    return [
+        {"type": "add_reaction" if index % 2 == 0 else "remove_reaction", "message_id": message_id, "emoji": "👍"}
+        for index in range(count)
+    ]
+
+
+def per_op_ns(function: Callable[[], Any], ops: int, repeat: int = 5) -> float:
+    """Best-of-`repeat` nanoseconds per operation"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        function()
+        best = min(best, time.perf_counter_ns() - started)
+    return round(best / ops, 1)
+
+
+def bench_validate(args: argparse.Namespace) -> Dict[str, Any]:
+    ops = reaction_ops(args.ops, "0" * 36)
+    frames = [json.dumps(op) for op in ops]
+    batches = [
+        json.dumps({"type": "batch", "ops": ops[offset:offset + args.batch_size]})
+        for offset in range(0, len(ops), args.batch_size)
+    ]
+    models = {"add_reaction": AddReactionRequest, "remove_reaction": RemoveReactionRequest}
+    routes = server.dispatcher.routes
+
+    def legacy() -> None:
+        for text in frames:
+            data = json.loads(text)
+            models[data["type"]](**data)
+
+    def dispatcher() -> None:
+        for text in frames:
+            data = json.loads(text)
+            routes[data["type"]].accepts(data)
+
+    def batched() -> None:
+        for text in batches:
+            for data in json.loads(text)["ops"]:
+                routes[data["type"]].accepts(data)
+
+    legacy_ns = per_op_ns(legacy, args.ops)
+    results = {
+        "legacy_pydantic_ns_per_op": legacy_ns,
+        "dispatcher_ns_per_op": per_op_ns(dispatcher, args.ops),
+        "dispatcher_batch_ns_per_op": per_op_ns(batched, args.ops),
+    }
+    results["speedup"] = round(legacy_ns / results["dispatcher_ns_per_op"], 2)
+    results["batch_speedup"] = round(legacy_ns / results["dispatcher_batch_ns_per_op"], 2)
+    return results
+
+
+async def bench_endpoint(args: argparse.Namespace, batch_size: int) -> Dict[str, Any]:
+    """CPU per operation for a client sending reaction changes, one per frame or `batch_size` per frame"""
+    # Queues large enough that no reaction_delta is dropped before the sender sees it, and no rate limits
+    server.manager = server.ConnectionManager(max_queue=args.ops + 100, limiter=RateLimiter("throttle", 1 << 30, "", "", ""))
+    await server.manager.start()
+    recorder = Recorder()
+    sender = InProcessClient(server.app, "bench", "sender", recorder)
+    listeners = [InProcessClient(server.app, "bench", f"listener{index}", Recorder()) for index in range(args.listeners)]
+    try:
+        for client in [sender] + listeners:
+            await client.connect()
+        await sender.send({"type": "message", "content": "react to me"})
+        while not sender.messages:
+            await asyncio.sleep(0.01)
+        ops = reaction_ops(args.ops, sender.messages[0]["message_id"])
+        expected = recorder.by_type.get("reaction_delta", 0) + len(ops)
+
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        for offset in range(0, len(ops), batch_size):
+            chunk = ops[offset:offset + batch_size]
+            await sender.send(chunk[0] if batch_size == 1 else {"type": "batch", "ops": chunk})
+        # Every operation produces a reaction_delta back to the sender
+        while recorder.by_type.get("reaction_delta", 0) < expected:
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        return {
+            "batch_size": batch_size,
+            "frames": -(-len(ops) // batch_size),
+            "ops_per_sec": round(len(ops) / elapsed, 1),
+            "cpu_us_per_op": round(cpu * 1e6 / len(ops), 2),
+        }
+    finally:
+        for client in [sender] + listeners:
+            await client.close()
+        await server.manager.stop()
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--listeners", type=int, default=0, help="other clients in the room receiving every delta")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    single = asyncio.run(bench_endpoint(args, 1))
+    batched = asyncio.run(bench_endpoint(args, args.batch_size))
+    report = {
+        "benchmark": "dispatch",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "parameters": vars(args),
+        "validate": bench_validate(args),
+        "endpoint": {
+            "single": single,
+            "batched": batched,
+            "cpu_reduction": round(1 - batched["cpu_us_per_op"] / single["cpu_us_per_op"], 3),
+        },
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
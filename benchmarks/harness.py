@@ -0,0 +1,183 @@
+"""
+Simulated WebSocket clients for benchmarking the chat server.
+
+InProcessClient speaks ASGI directly to the FastAPI app (no sockets), LoopbackClient
+connects to a real uvicorn server over 127.0.0.1. Both record when each frame
+arrives so workloads can compute fan-out latency.
+"""
+
+import asyncio
+import json
+import math
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import uvicorn
+import websockets
+
+# Probe messages carry their send time so receivers can measure fan-out latency
+PROBE_PREFIX = "probe:"
+
+
+def probe_content(sent_ns: Optional[int] = None) -> str:
+    return f"{PROBE_PREFIX}{sent_ns if sent_ns is not None else time.perf_counter_ns()}"
+
+
+class Recorder:
+    """Collects arrival statistics shared by every simulated client"""
+
+    def __init__(self):
+        self.latencies_ms: List[float] = []
+        self.frames = 0
+        self.events = 0
+        self.bytes = 0
+        self.by_type: Dict[str, int] = {}
+
+    def record(self, payload: Any, received_ns: int) -> Optional[Dict[str, Any]]:
+        self.frames += 1
+        self.bytes += len(payload)
+        event = json.loads(payload)
+        events = event["events"] if event.get("type") == "batch" else [event]
+        for inner in events:
+            self.events += 1
+            event_type = inner.get("type", "?")
+            self.by_type[event_type] = self.by_type.get(event_type, 0) + 1
+            if event_type == "message" and str(inner.get("content", "")).startswith(PROBE_PREFIX):
+                sent_ns = int(inner["content"][len(PROBE_PREFIX):])
+                self.latencies_ms.append((received_ns - sent_ns) / 1e6)
+        return event
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        return {
+            "frames": self.frames,
+            "events": self.events,
+            "bytes": self.bytes,
+            "events_per_sec": round(self.events / duration, 1) if duration else 0,
+            "frames_per_sec": round(self.frames / duration, 1) if duration else 0,
+            "latency_ms": percentiles(self.latencies_ms),
+            "by_type": dict(sorted(self.by_type.items())),
+        }
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p90/p99/max of a sample, in the sample's unit"""
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)], 3)
+
+    return {"count": len(ordered), "p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": round(ordered[-1], 3)}
+
+
+class InProcessClient:
+    """Drives the app's websocket route through ASGI calls on the current event loop"""
+
+    def __init__(self, app: Callable, room: str, username: str, recorder: Recorder, slow: float = 0.0, query: str = ""):
+        self.app = app
+        self.path = f"/ws/{room}/{username}"
+        self.query = query
+        self.recorder = recorder
+        self.slow = slow  # seconds spent "processing" each received frame
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.closed = asyncio.Event()
+        self.messages: List[Dict[str, Any]] = []  # received chat messages, for workloads that react to them
+        self.task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        scope = {
+            "type": "websocket", "path": self.path, "raw_path": self.path.encode(), "query_string": self.query.encode(),
+            "headers": [], "subprotocols": [], "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80),
+            "scheme": "ws", "root_path": "", "asgi": {"version": "3.0"},
+        }
+        await self.inbox.put({"type": "websocket.connect"})
+        self.task = asyncio.create_task(self.app(scope, self.inbox.get, self._send))
+
+    async def _send(self, message: Dict[str, Any]) -> None:
+        if message["type"] == "websocket.send":
+            payload = message.get("text") or message.get("bytes")
+            event = self.recorder.record(payload, time.perf_counter_ns())
+            if event.get("type") == "message":
+                self.messages.append(event)
+            elif event.get("type") == "ping":
+                await self.send({"type": "pong"})
+            if self.slow:
+                await asyncio.sleep(self.slow)
+        elif message["type"] == "websocket.close":
+            self.closed.set()
+
+    async def send(self, event: Dict[str, Any]) -> None:
+        await self.inbox.put({"type": "websocket.receive", "text": json.dumps(event)})
+
+    async def close(self) -> None:
+        await self.inbox.put({"type": "websocket.disconnect", "code": 1000})
+        if self.task is not None:
+            try:
+                await asyncio.wait_for(self.task, timeout=5)
+            except (asyncio.TimeoutError, Exception):
+                self.task.cancel()
+
+
+class LoopbackClient:
+    """A real WebSocket client connected to a uvicorn server on 127.0.0.1"""
+
+    def __init__(self, base_url: str, room: str, username: str, recorder: Recorder, slow: float = 0.0, query: str = ""):
+        self.url = f"{base_url}/ws/{room}/{username}" + (f"?{query}" if query else "")
+        self.recorder = recorder
+        self.slow = slow
+        self.messages: List[Dict[str, Any]] = []
+        self.websocket = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        self.websocket = await websockets.connect(self.url, max_queue=None)
+        self.task = asyncio.create_task(self._receive())
+
+    async def _receive(self) -> None:
+        try:
+            async for payload in self.websocket:
+                event = self.recorder.record(payload, time.perf_counter_ns())
+                if event.get("type") == "message":
+                    self.messages.append(event)
+                elif event.get("type") == "ping":
+                    await self.send({"type": "pong"})
+                if self.slow:
+                    await asyncio.sleep(self.slow)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def send(self, event: Dict[str, Any]) -> None:
+        await self.websocket.send(json.dumps(event))
+
+    async def close(self) -> None:
+        await self.websocket.close()
+        if self.task is not None:
+            await self.task
+
+
+class LoopbackServer:
+    """Runs the app under uvicorn in a background thread on a free port"""
+
+    def __init__(self, app: Callable):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", ws_max_queue=1024))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "LoopbackServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Load test for the chat server: thousands of simulated clients across many rooms.
+
+Runs one or more workloads against the FastAPI app, either in-process (ASGI calls, no
+sockets) or over loopback (uvicorn on 127.0.0.1), and prints a JSON report with fan-out
+latency percentiles, events/sec, CPU per delivered event and memory per connection.
+
+    python -m benchmarks.loadtest --workload chat --clients 2000 --rooms 20
+    python -m benchmarks.loadtest --workload all --output bench_output.txt
+    python -m benchmarks.loadtest --workload reactions --set FLUSH_INTERVAL_MS=50
+
+Server-side settings from app/config.py can be overridden per run with --set NAME=VALUE.
+Both the simulated clients and the server share this process, so CPU and memory
+figures include the client side; compare runs against each other, not against production.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from app import config, metrics
+import app.main as server
+from .harness import InProcessClient, LoopbackClient, LoopbackServer, Recorder, probe_content
+
+WORKLOADS = ("chat", "reactions", "churn", "slow")
+EMOJI = ("👍", "❤️", "😂", "🎉", "🚀", "👀")
+
+
+class Run:
+    """One workload execution: a fresh ConnectionManager, its clients and their recorders"""
+
+    def __init__(self, args: argparse.Namespace, workload: str, base_url: str = ""):
+        self.args = args
+        self.workload = workload
+        self.base_url = base_url
+        self.random = random.Random(args.seed)
+        self.recorder = Recorder()
+        self.slow_recorder = Recorder()
+        self.clients: List[Any] = []
+        self.running = True
+        self.sent = 0
+
+    def room_of(self, index: int) -> str:
+        return f"room{index % self.args.rooms}"
+
+    def picked(self, index: int, fraction: float) -> bool:
+        """Selects about `fraction` of the clients, spread evenly over the rooms"""
+        return (index // self.args.rooms) % max(1, round(1 / fraction)) == 0
+
+    def is_slow(self, index: int) -> bool:
+        return self.workload == "slow" and self.picked(index, self.args.slow_fraction)
+
+    def make_client(self, index: int, generation: int = 0):
+        username = f"user{index}" if not generation else f"user{index}-{generation}"
+        slow = self.args.slow_delay if self.is_slow(index) else 0.0
+        recorder = self.slow_recorder if slow else self.recorder
+        if self.base_url:
+            return LoopbackClient(self.base_url, self.room_of(index), username, recorder, slow)
+        return InProcessClient(server.app, self.room_of(index), username, recorder, slow)
+
+    async def connect_all(self) -> Dict[str, Any]:
+        """Connect every client in batches, measuring connect time and traced memory per connection"""
+        trace = not self.args.no_memory
+        if trace:
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        for offset in range(0, self.args.clients, self.args.connect_batch):
+            batch = [self.make_client(index) for index in range(offset, min(offset + self.args.connect_batch, self.args.clients))]
+            await asyncio.gather(*(client.connect() for client in batch))
+            self.clients.extend(batch)
+        await self.settle()
+        elapsed = time.perf_counter() - started
+        report: Dict[str, Any] = {
+            "seconds": round(elapsed, 3),
+            "per_sec": round(self.args.clients / elapsed, 1),
+            "server_connections": (await server.manager.gauges())["connections"],
+        }
+        if trace:
+            report["memory_per_connection_bytes"] = round((tracemalloc.get_traced_memory()[0] - baseline) / self.args.clients)
+            tracemalloc.stop()
+        return report
+
+    async def settle(self) -> None:
+        """Wait until every outbound queue has drained, or the settle timeout passes"""
+        deadline = time.perf_counter() + self.args.settle
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+            if not (await server.manager.gauges())["queued_frames"]:
+                return
+
+    async def pace(self, rate: float) -> None:
+        """Sleep for one randomized interval of a Poisson process with the given rate"""
+        await asyncio.sleep(self.random.expovariate(rate))
+
+    async def chat(self, client) -> None:
+        while self.running:
+            await self.pace(self.args.rate)
+            if self.running:
+                await client.send({"type": "message", "content": probe_content()})
+                self.sent += 1
+
+    async def probe(self, client) -> None:
+        """Latency probes for workloads whose main traffic is not chat messages"""
+        while self.running:
+            await self.pace(self.args.probe_rate)
+            if self.running:
+                await client.send({"type": "message", "content": probe_content()})
+                self.sent += 1
+
+    async def react(self, client) -> None:
+        while self.running:
+            await self.pace(self.args.rate)
+            if not self.running or not client.messages:
+                continue
+            message = self.random.choice(client.messages[-20:])
+            add = self.random.random() < 0.6
+            await client.send({
+                "type": "add_reaction" if add else "remove_reaction",
+                "message_id": message["message_id"],
+                "emoji": self.random.choice(EMOJI),
+            })
+            self.sent += 1
+
+    async def churn(self, index: int) -> None:
+        """Repeatedly disconnect one client and reconnect it under a new name"""
+        generation = 0
+        while self.running:
+            await self.pace(self.args.rate)
+            if not self.running:
+                break
+            generation += 1
+            await self.clients[index].close()
+            client = self.make_client(index, generation)
+            await client.connect()
+            self.clients[index] = client
+            self.sent += 2
+
+    def tasks(self) -> List[asyncio.Task]:
+        if self.workload in ("chat", "slow"):
+            return [asyncio.create_task(self.chat(client)) for index, client in enumerate(self.clients) if not self.is_slow(index)]
+        # The first client of each room sends latency probes
+        prober_count = min(self.args.rooms, len(self.clients))
+        probers = [asyncio.create_task(self.probe(client)) for client in self.clients[:prober_count]]
+        if self.workload == "reactions":
+            return probers + [asyncio.create_task(self.react(client)) for client in self.clients[prober_count:]]
+        churners = [index for index in range(prober_count, len(self.clients)) if self.picked(index, self.args.churn_fraction)]
+        return probers + [asyncio.create_task(self.churn(index)) for index in churners]
+
+    async def execute(self) -> Dict[str, Any]:
+        server.manager = server.create_manager(max_queue=self.args.queue_size, policy=self.args.policy)
+        await server.manager.start()
+        self.counters_at_start = (metrics.FRAMES_DROPPED.value, metrics.SLOW_CONSUMERS.value)
+        try:
+            connect = await self.connect_all()
+            # Connection-time events (session, history, roster, presence) are not workload traffic
+            self.recorder = Recorder()
+            self.slow_recorder = Recorder()
+            for client in self.clients:
+                client.recorder = self.slow_recorder if client.slow else self.recorder
+
+            cpu_started = time.process_time()
+            started = time.perf_counter()
+            tasks = self.tasks()
+            await asyncio.sleep(self.args.duration)
+            self.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.settle()
+            duration = time.perf_counter() - started
+            cpu = time.process_time() - cpu_started
+
+            delivered = self.recorder.events + self.slow_recorder.events
+            report: Dict[str, Any] = {
+                "workload": self.workload,
+                "connect": connect,
+                "duration_s": round(duration, 3),
+                "sent": self.sent,
+                "sent_per_sec": round(self.sent / duration, 1),
+                "delivery": self.recorder.summary(duration),
+                "cpu": {
+                    "process_seconds": round(cpu, 3),
+                    "utilization": round(cpu / duration, 3),
+                    "us_per_delivered_event": round(cpu * 1e6 / delivered, 2) if delivered else None,
+                },
+                "server": await self.server_stats(),
+            }
+            if self.workload == "slow":
+                report["slow_delivery"] = self.slow_recorder.summary(duration)
+            return report
+        finally:
+            await asyncio.gather(*(client.close() for client in self.clients), return_exceptions=True)
+            await server.manager.stop()
+
+    async def server_stats(self) -> Dict[str, Any]:
+        gauges = await server.manager.gauges()
+        dropped, closed = self.counters_at_start
+        return {
+            "rooms": gauges["rooms"],
+            "connections": gauges["connections"],
+            "dropped_frames": int(metrics.FRAMES_DROPPED.value - dropped),
+            "closed_slow_consumers": int(metrics.SLOW_CONSUMERS.value - closed),
+            "max_queue_depth": gauges["max_queue_depth"],
+            "history": (await server.manager.stats())["history"],
+        }
+
+
+async def run_workload(args: argparse.Namespace, workload: str, base_url: str = "") -> Dict[str, Any]:
+    return await Run(args, workload, base_url).execute()
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    for setting in args.set:
+        name, _, value = setting.partition("=")
+        if not hasattr(config, name):
+            raise SystemExit(f"unknown setting {name!r}")
+        current = getattr(config, name)
+        setattr(config, name, type(current)(value))
+
+    workloads = WORKLOADS if args.workload == "all" else (args.workload,)
+    results: List[Dict[str, Any]] = []
+    if args.transport == "loopback":
+        # Two file descriptors per simulated client
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        for workload in workloads:
+            with LoopbackServer(server.app) as loopback:
+                results.append(asyncio.run(run_workload(args, workload, loopback.base_url)))
+    else:
+        for workload in workloads:
+            results.append(asyncio.run(run_workload(args, workload)))
+
+    return {
+        "benchmark": "loadtest",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "transport": args.transport,
+        "parameters": {
+            key: value for key, value in vars(args).items() if key not in ("workload", "output", "transport")
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", choices=WORKLOADS + ("all",), default="chat")
+    parser.add_argument("--transport", choices=("inprocess", "loopback"), default="inprocess")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of workload traffic")
+    parser.add_argument("--rate", type=float, default=0.2, help="actions per second per client")
+    parser.add_argument("--probe-rate", type=float, default=2.0, help="latency probes per second per room")
+    parser.add_argument("--churn-fraction", type=float, default=0.2)
+    parser.add_argument("--slow-fraction", type=float, default=0.1)
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="seconds a slow client spends per frame")
+    parser.add_argument("--queue-size", type=int, default=config.SEND_QUEUE_SIZE)
+    parser.add_argument("--policy", default=config.SLOW_CONSUMER_POLICY)
+    parser.add_argument("--connect-batch", type=int, default=200)
+    parser.add_argument("--settle", type=float, default=5.0, help="max seconds to wait for queues to drain")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc during the connect phase")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="override an app.config setting")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> None:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    report = json.dumps(run(args), indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Bytes per stored chat message in the in-memory history.
+
+Fills rooms with messages two ways and measures the heap growth with tracemalloc:
+
+  legacy    what the history used to hold per message: a Pydantic `Message` with a
+            nested `ReactionData`, a uuid4 string id and a `datetime`, in an
+            OrderedDict keyed by id, with a fresh username string per message
+  compact   the current HistoryStore: slotted records with integer ids and epoch-ms
+            timestamps, interned usernames and reactions only where there are any
+
+Content strings are allocated before measuring so only the per-message overhead and
+the structures that hold it are counted.
+
+    python -m benchmarks.memory --messages 100000 --rooms 100 --content-length 40
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+from app.history import HistoryStore
+from app.records import StoredMessage
+
+
+class ReactionData(BaseModel):
+    """The legacy history's reactions: emoji to usernames"""
+    emoji: Dict[str, List[str]] = Field(default_factory=dict)
+
+
+class Message(BaseModel):
+    """The model the legacy history held per message"""
+    id: str
+    type: Literal["message", "join", "leave", "reaction", "add_reaction", "remove_reaction"]
+    user: str
+    content: Optional[str] = None
+    timestamp: datetime
+    reactions: ReactionData = Field(default_factory=ReactionData)
+    online: Optional[List[str]] = None
+
+
+def measure(fill: Callable[[], Any]) -> int:
+    """Heap bytes still allocated by `fill` once it returns (the result is kept alive while measuring)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = fill()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--users", type=int, default=50, help="distinct senders per room")
+    parser.add_argument("--content-length", type=int, default=40)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    per_room = args.messages // args.rooms
+    contents = [f"{index:0{args.content_length}d}"[-args.content_length:] for index in range(args.messages)]
+
+    def sender(index: int) -> str:
+        # Built per message, as a decoded frame or log record would be
+        return "".join(["user", str(index % args.users)])
+
+    def legacy() -> Dict[str, "OrderedDict[str, Message]"]:
+        rooms: Dict[str, "OrderedDict[str, Message]"] = {}
+        for index, content in enumerate(contents):
+            room = rooms.setdefault(f"room{index % args.rooms}", OrderedDict())
+            message_id = str(uuid.uuid4())
+            room[message_id] = Message(
+                id=message_id, type="message", user=sender(index), content=content,
+                timestamp=datetime.now(), reactions=ReactionData(),
+            )
+        return rooms
+
+    def compact() -> HistoryStore:
+        store = HistoryStore(per_room, 1 << 62)
+        for index, content in enumerate(contents):
+            store.add(f"room{index % args.rooms}", StoredMessage.new(sender(index), content))
+        return store
+
+    results = {}
+    for name, fill in (("legacy", legacy), ("compact", compact)):
+        used = measure(fill)
+        results[name] = {"bytes": used, "bytes_per_message": round(used / args.messages, 1)}
+    results["reduction"] = round(1 - results["compact"]["bytes"] / results["legacy"]["bytes"], 3)
+
+    report = {
+        "benchmark": "memory",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "parameters": vars(args),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
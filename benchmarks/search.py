@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Full-text search cost at scale.
+
+Stores --messages synthetic messages (Zipf-distributed words, so a few terms are very
+common and most are rare) across --rooms rooms, once with the search index disabled and
+once enabled, and reports:
+
+  indexing   extra CPU per stored message that the index adds
+  query      latency percentiles for 1-3 term queries against a random room
+  index      total posting entries and distinct terms held
+
+Rooms are deep enough to hold every message, so nothing is evicted during the run.
+
+    python -m benchmarks.search --messages 1000000 --rooms 100 --queries 2000
+"""
+
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+from app.history import HistoryStore
+from app.records import StoredMessage
+from .harness import percentiles
+
+
+def synthetic_messages(args: argparse.Namespace, rng: random.Random) -> List[str]:
+    vocabulary = [f"w{rank}" for rank in range(args.vocabulary)]
+    cumulative = list(itertools.accumulate(1 / (rank + 1) for rank in range(args.vocabulary)))
+    return [
+        " ".join(rng.choices(vocabulary, cum_weights=cumulative, k=rng.randint(3, 2 * args.words - 3)))
+        for _ in range(args.messages)
+    ]
+
+
+def fill(args: argparse.Namespace, contents: List[str], search: bool) -> Dict[str, Any]:
+    store = HistoryStore(-(-args.messages // args.rooms), 1 << 62, search=search)
+    messages = [StoredMessage(index, "user", content, 0) for index, content in enumerate(contents)]
+    started = time.process_time()
+    for index, message in enumerate(messages):
+        store.add(f"room{index % args.rooms}", message)
+    return {"store": store, "cpu_s": time.process_time() - started}
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--vocabulary", type=int, default=50000, help="distinct words")
+    parser.add_argument("--words", type=int, default=10, help="average words per message")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20, help="hits per result page")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    rng = random.Random(args.seed)
+    contents = synthetic_messages(args, rng)
+    plain = fill(args, contents, search=False)
+    del plain["store"]
+    indexed = fill(args, contents, search=True)
+    store: HistoryStore = indexed["store"]
+
+    latencies_us: List[float] = []
+    hits: List[int] = []
+    for _ in range(args.queries):
+        # Query words drawn from real messages, so every query matches something
+        query = " ".join(rng.sample(rng.choice(contents).split(), rng.randint(1, 3)))
+        room = f"room{rng.randrange(args.rooms)}"
+        started = time.perf_counter()
+        _, total = store.search(room, query, args.limit)
+        latencies_us.append((time.perf_counter() - started) * 1e6)
+        hits.append(total)
+
+    indexes = [history.search for history in store.rooms.values()]
+    report = {
+        "benchmark": "search",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "parameters": vars(args),
+        "indexing": {
+            "us_per_message_without_index": round(plain["cpu_s"] * 1e6 / args.messages, 2),
+            "us_per_message_with_index": round(indexed["cpu_s"] * 1e6 / args.messages, 2),
+            "index_us_per_message": round((indexed["cpu_s"] - plain["cpu_s"]) * 1e6 / args.messages, 2),
+        },
+        "query": {
+            "latency_us": percentiles(latencies_us),
+            "matches": percentiles([float(total) for total in hits]),
+        },
+        "index": {
+            "terms": sum(len(index.postings) for index in indexes),
+            "postings": sum(len(postings) for index in indexes for postings in index.postings.values()),
+            "history_bytes_estimate": store.total_size,
+        },
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Scaling curve for sharded room execution (CHAT_SHARDS).
+
+Runs the same many-room chat workload with the server unsharded and with 1, 2, 4, ...
+shard threads, and reports delivered events/sec, CPU per event and fan-out latency for
+each. Offer more load than one core can handle (the defaults do on most machines) so
+the curve shows capacity rather than the offered rate.
+
+    python -m benchmarks.shards --shards 1,2,4,8 --clients 4000 --rooms 400
+
+On CPython builds with the GIL, shard threads only overlap where work releases it, so
+expect the curve to be flat or to fall; a free-threaded build is where it can rise.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, List
+
+from app import config
+from .loadtest import Run, parse_args as parse_loadtest_args
+
+
+def gil_enabled() -> bool:
+    check = getattr(sys, "_is_gil_enabled", None)
+    return True if check is None else check()
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", default="1,2,4", help="comma-separated shard counts; 0 (unsharded) is always run first")
+    parser.add_argument("--clients", type=int, default=4000)
+    parser.add_argument("--rooms", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=2.0, help="messages per second per client")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    workload_args = parse_loadtest_args([
+        "--clients", str(args.clients), "--rooms", str(args.rooms), "--rate", str(args.rate),
+        "--duration", str(args.duration), "--no-memory",
+        # Rate limits would cap the offered load rather than the server
+        "--set", "FRAME_RATE_LIMIT=", "--set", "CONNECTION_RATE_LIMITS=", "--set", "ROOM_RATE_LIMITS=",
+    ])
+    for setting in workload_args.set:
+        name, _, value = setting.partition("=")
+        setattr(config, name, value)
+
+    curve: List[Dict[str, Any]] = []
+    for shards in [0] + [int(count) for count in args.shards.split(",") if count.strip()]:
+        config.SHARDS = shards
+        result = asyncio.run(Run(workload_args, "chat").execute())
+        curve.append({
+            "shards": shards,
+            "events_per_sec": result["delivery"]["events_per_sec"],
+            "sent_per_sec": result["sent_per_sec"],
+            "cpu_us_per_delivered_event": result["cpu"]["us_per_delivered_event"],
+            "cpu_utilization": result["cpu"]["utilization"],
+            "latency_ms": result["delivery"]["latency_ms"],
+        })
+    baseline = curve[0]["events_per_sec"] or 1
+    for point in curve:
+        point["speedup"] = round(point["events_per_sec"] / baseline, 2)
+
+    report = {
+        "benchmark": "shards",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "gil_enabled": gil_enabled(),
+        "cpus": os.cpu_count(),
+        "parameters": vars(args),
+        "curve": curve,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
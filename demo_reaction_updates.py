@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """
-Demo script to show the reaction_update broadcasting functionality.
+Demo script to show the reaction_delta broadcasting functionality.
 This demonstrates how reaction updates are broadcast to all clients in real-time.
 """
 
@@ -29,9 +29,10 @@ async def create_client(name: str, room: str = "demo_room"):
                 await websocket.send(json.dumps(test_message))
                 print(f"[{name}] Sent test message")
                 
-                # Wait for the message to be broadcast back
-                response = await websocket.recv()
-                message_data = json.loads(response)
+                # Wait for the message to be broadcast back (skipping session/history/join events)
+                message_data = {}
+                while message_data.get("type") != "message":
+                    message_data = json.loads(await websocket.recv())
                 
                 if message_data.get("type") == "message":
                     message_id = message_data.get("message_id")
@@ -76,8 +77,8 @@ async def create_client(name: str, room: str = "demo_room"):
                     response = await asyncio.wait_for(websocket.recv(), timeout=10.0)
                     data = json.loads(response)
                     
-                    if data.get("type") == "reaction_update":
-                        print(f"[{name}] 🔄 REACTION UPDATE: message_id={data.get('message_id')}, emoji={data.get('emoji')}, users={data.get('users')}")
+                    if data.get("type") == "reaction_delta":
+                        print(f"[{name}] 🔄 REACTION DELTA: message_id={data.get('message_id')}, emoji={data.get('emoji')}, delta={data.get('delta')}, count={data.get('count')}")
                     elif data.get("type") == "message":
                         print(f"[{name}] 💬 MESSAGE: {data.get('content')}")
                     elif data.get("type") in ["join", "leave"]:
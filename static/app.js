@@ -1,11 +1,47 @@
+// Rows kept in the message pane's model (the oldest are dropped beyond this), how far past the
+// viewport rows stay mounted, and the height assumed for a row until it has been measured
+const MAX_ROWS = 5000;
+const OVERSCAN_PX = 600;
+const DEFAULT_ROW_HEIGHT = 64;
+
 class ChatApp {
     constructor() {
         this.ws = null;
         this.currentRoom = null;
         this.currentUsername = null;
         this.isConnected = false;
+        this.hasJoined = false;
         this.config = window.APP_CONFIG || {};
         
+        // Resume state: the server numbers room events so a reconnect only fetches what was missed
+        this.epoch = null;
+        this.lastSeq = null;
+        this.reconnectAttempts = 0;
+        
+        // Incoming events are queued and applied together, once per animation frame
+        this.pendingEvents = [];
+        this.flushFrame = null;
+        this.flushTimer = null;
+        
+        // Message pane model: every row is kept here, but only rows near the viewport are in the DOM
+        this.rows = [];  // {kind, id, user, content, time, reactions: Map(emoji ➞ count), height, element}
+        this.rowsById = new Map();  // message_id ➞ row
+        this.mountedRows = new Set();
+        this.measuredHeight = 0;  // summed heights of the rows measured so far, for the estimate
+        this.measuredRows = 0;
+        this.messagesDirty = false;
+        this.renderFrame = null;
+        this.stickToBottom = true;  // follow new messages unless the user has scrolled up
+        
+        // The "messageId:emoji" reactions this user has made, and username ➞ roster entry
+        this.myReactions = new Set();
+        this.onlineUsers = new Map();
+        
+        // Typing signals are lossy, so others' indicators expire on their own; ours is refreshed while typing
+        this.typingUsers = new Map();  // username ➞ expiry timer
+        this.typingSentAt = 0;
+        this.typingIdleTimer = null;
+        
         this.initializeElements();
         this.bindEvents();
     }
@@ -29,6 +65,12 @@ class ChatApp {
         this.messageForm = document.getElementById('message-form');
         this.messageInput = document.getElementById('message-input');
         this.sendBtn = document.getElementById('send-btn');
+        this.typingIndicator = document.getElementById('typing-indicator');
+        
+        // Spacers stand in for the rows above and below the mounted ones
+        this.topSpacer = document.createElement('div');
+        this.bottomSpacer = document.createElement('div');
+        this.messagesPane.append(this.topSpacer, this.bottomSpacer);
     }
     
     bindEvents() {
@@ -47,6 +89,7 @@ class ChatApp {
         // Auto-resize textarea
         this.messageInput.addEventListener('input', () => {
             this.autoResizeTextarea();
+            this.notifyTyping();
         });
         
         // Send message on Enter (but allow Shift+Enter for new line)
@@ -56,6 +99,14 @@ class ChatApp {
                 this.sendMessage();
             }
         });
+        
+        // Mount the rows scrolled into view, and stop following new messages while scrolled up
+        this.messagesPane.addEventListener('scroll', () => {
+            const pane = this.messagesPane;
+            this.stickToBottom = pane.scrollHeight - pane.scrollTop - pane.clientHeight < 40;
+            this.requestRender();
+        }, { passive: true });
+        window.addEventListener('resize', () => this.requestRender());
     }
     
     async joinRoom() {
@@ -93,11 +144,19 @@ class ChatApp {
         if (configuredBase) {
             const baseUrl = new URL(configuredBase);
             baseUrl.pathname = `/ws/${roomSegment}/${userSegment}`;
+            baseUrl.search = this.getResumeQuery();
             return baseUrl.toString();
         }
 
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        return `${protocol}//${window.location.host}/ws/${roomSegment}/${userSegment}`;
+        return `${protocol}//${window.location.host}/ws/${roomSegment}/${userSegment}${this.getResumeQuery()}`;
+    }
+    
+    getResumeQuery() {
+        if (this.epoch === null || this.lastSeq === null) {
+            return '';
+        }
+        return `?since=${this.lastSeq}&epoch=${encodeURIComponent(this.epoch)}`;
     }
 
     connectWebSocket() {
@@ -108,19 +167,34 @@ class ChatApp {
             
             this.ws.onopen = () => {
                 this.isConnected = true;
+                this.reconnectAttempts = 0;
                 this.updateConnectionStatus(true);
                 resolve();
             };
             
             this.ws.onmessage = (event) => {
                 const data = JSON.parse(event.data);
-                this.handleMessage(data);
+                if (data.type === 'ping') {
+                    // Answered at once: queued events wait for a frame, and hidden tabs may not render one for a while
+                    this.ws.send(JSON.stringify({ type: 'pong' }));
+                    return;
+                }
+                this.pendingEvents.push(data);
+                this.scheduleFlush();
             };
             
             this.ws.onclose = () => {
+                // Apply what arrived before the close, so the resume point is the last event received
+                this.flushEvents();
+                const wasConnected = this.isConnected;
                 this.isConnected = false;
                 this.updateConnectionStatus(false);
-                this.addSystemMessage('Connection closed. Please refresh to reconnect.');
+                if (this.hasJoined) {
+                    if (wasConnected) {
+                        this.addSystemMessage('Connection lost. Reconnecting...');
+                    }
+                    this.scheduleReconnect();
+                }
             };
             
             this.ws.onerror = (error) => {
@@ -137,7 +211,18 @@ class ChatApp {
         });
     }
     
+    scheduleReconnect() {
+        // Full jitter so clients dropped together do not all come back at the same moment
+        const ceiling = Math.min(30000, 500 * Math.pow(2, this.reconnectAttempts));
+        const delay = Math.random() * ceiling;
+        this.reconnectAttempts += 1;
+        setTimeout(() => {
+            this.connectWebSocket().catch(() => {});
+        }, delay);
+    }
+    
     switchToChat() {
+        this.hasJoined = true;
         this.landingPanel.style.display = 'none';
         this.chatContainer.style.display = 'flex';
         this.currentRoomDisplay.textContent = `Room: ${this.currentRoom}`;
@@ -158,36 +243,171 @@ class ChatApp {
         }
     }
     
+    scheduleFlush() {
+        if (this.flushFrame !== null) {
+            return;
+        }
+        this.flushFrame = requestAnimationFrame(() => this.flushEvents());
+        // Background tabs get no animation frames; the timer still drains the queue there
+        this.flushTimer = setTimeout(() => this.flushEvents(), 250);
+    }
+    
+    flushEvents() {
+        cancelAnimationFrame(this.flushFrame);
+        clearTimeout(this.flushTimer);
+        this.flushFrame = null;
+        this.flushTimer = null;
+        const events = this.pendingEvents;
+        this.pendingEvents = [];
+        events.forEach(event => this.handleMessage(event));
+        if (this.messagesDirty) {
+            // Render now, and drop the frame appendRow asked for so the burst is not rendered twice
+            cancelAnimationFrame(this.renderFrame);
+            this.renderFrame = null;
+            this.renderMessages();
+        }
+    }
+    
     handleMessage(data) {
+        if (typeof data.seq === 'number' && data.type !== 'session' && data.type !== 'resync') {
+            this.lastSeq = data.seq;
+        }
+        
         switch (data.type) {
+            case 'session':
+                if (data.epoch !== this.epoch) {
+                    this.epoch = data.epoch;
+                    this.lastSeq = data.seq;
+                }
+                break;
+            case 'resync':
+                // Too much was missed to replay: start over from the history that follows
+                this.clearMessages();
+                this.lastSeq = data.seq;
+                break;
             case 'message':
-                this.addChatMessage(data.user, data.content);
+                this.addChatMessage(data.user, data.content, data.message_id, data.reactions, data.timestamp);
+                break;
+            case 'history':
+                // History carries this user's own reactions as `mine`, so they stay highlighted after a reload
+                data.messages.forEach(message => this.addChatMessage(message.user, message.content, message.message_id, message.reactions, message.timestamp, message.mine));
+                break;
+            case 'reaction_delta':
+                this.applyReactionDelta(data);
+                break;
+            case 'batch':
+                // Several events coalesced by the server into one frame
+                data.events.forEach(event => this.handleMessage(event));
+                break;
+            case 'typing':
+                this.showTyping(data.user, data.active);
+                break;
+            case 'seen':
+                // Read markers from others; nothing in this view shows them yet
+                break;
+            case 'roster':
+                // Full member list, sent only to this client when it connects
+                this.setRoster(data.online);
                 break;
             case 'join':
-                this.updateUsersList(data.online);
+                this.addUser(data.user);
                 this.addSystemMessage(`${data.user} joined the room`);
                 break;
             case 'leave':
-                this.updateUsersList(data.online);
+                this.removeUser(data.user);
                 this.addSystemMessage(`${data.user} left the room`);
                 break;
+            case 'presence':
+                // Several joins/leaves announced together
+                data.joined.forEach(user => this.addUser(user));
+                data.left.forEach(user => this.removeUser(user));
+                if (data.joined.length) {
+                    this.addSystemMessage(`${data.joined.join(', ')} joined the room`);
+                }
+                if (data.left.length) {
+                    this.addSystemMessage(`${data.left.join(', ')} left the room`);
+                }
+                break;
+        }
+    }
+    
+    addChatMessage(username, content, messageId, reactions = {}, timestamp = null, mine = []) {
+        (mine || []).forEach(emoji => this.myReactions.add(`${messageId}:${emoji}`));
+        if (messageId && this.rowsById.has(messageId)) {
+            return;
+        }
+        // Show when the server stored the message, so history and replayed rows keep their own times
+        let sent = timestamp ? new Date(timestamp) : null;
+        if (!sent || isNaN(sent.getTime())) {
+            sent = new Date();
+        }
+        const row = {
+            kind: 'message',
+            id: messageId,
+            user: username,
+            content: content,
+            time: sent.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' }),
+            reactions: new Map(Object.entries(reactions || {})),
+            height: 0,
+            element: null
+        };
+        if (messageId) {
+            this.rowsById.set(messageId, row);
         }
+        this.appendRow(row);
     }
     
-    addChatMessage(username, content) {
+    addSystemMessage(content) {
+        this.appendRow({ kind: 'system', content: content, height: 0, element: null });
+    }
+    
+    appendRow(row) {
+        // Only the model changes here; the DOM catches up in the next render
+        this.rows.push(row);
+        this.messagesDirty = true;
+        this.requestRender();
+    }
+    
+    clearMessages() {
+        this.mountedRows.forEach(row => this.unmountRow(row));
+        this.rows = [];
+        this.rowsById.clear();
+        this.messagesDirty = true;
+        this.requestRender();
+    }
+    
+    createRowElement(row) {
+        // Rows are wrapped so their measured height includes the margins of what they contain
+        const rowDiv = document.createElement('div');
+        rowDiv.className = 'message-row';
+        
+        if (row.kind === 'system') {
+            const messageDiv = document.createElement('div');
+            messageDiv.className = 'system-message';
+            messageDiv.textContent = row.content;
+            rowDiv.appendChild(messageDiv);
+            return rowDiv;
+        }
+        
         const messageContainer = document.createElement('div');
         messageContainer.className = 'message-container';
+        if (row.id) {
+            messageContainer.dataset.messageId = row.id;
+        }
         
         const messageDiv = document.createElement('div');
-        messageDiv.className = `message ${username === this.currentUsername ? 'own' : 'other'}`;
+        messageDiv.className = `message ${row.user === this.currentUsername ? 'own' : 'other'}`;
         
-        const now = new Date();
-        const timeString = now.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+        const headerDiv = document.createElement('div');
+        headerDiv.className = 'message-header';
+        headerDiv.textContent = `${row.user} • ${row.time}`;
         
-        messageDiv.innerHTML = `
-            <div class="message-header">${username} • ${timeString}</div>
-            <div class="message-content">${this.escapeHtml(content)}</div>
-        `;
+        const contentDiv = document.createElement('div');
+        contentDiv.className = 'message-content';
+        contentDiv.textContent = row.content;
+        
+        messageDiv.appendChild(headerDiv);
+        messageDiv.appendChild(contentDiv);
         
         const reactionsSpan = document.createElement('span');
         reactionsSpan.className = 'reactions';
@@ -205,29 +425,149 @@ class ChatApp {
         // Add hover events for emoji picker
         this.setupEmojiPicker(messageContainer, emojiPickerBtn);
         
-        this.messagesPane.appendChild(messageContainer);
-        this.scrollToBottom();
+        row.reactions.forEach((count, emoji) => {
+            this.setReactionCount(messageContainer, emoji, count);
+        });
+        
+        rowDiv.appendChild(messageContainer);
+        return rowDiv;
     }
     
-    addSystemMessage(content) {
-        const messageDiv = document.createElement('div');
-        messageDiv.className = 'system-message';
-        messageDiv.textContent = content;
+    unmountRow(row) {
+        if (row.element) {
+            row.element.remove();
+            row.element = null;
+        }
+        this.mountedRows.delete(row);
+    }
+    
+    estimatedRowHeight() {
+        return this.measuredRows ? this.measuredHeight / this.measuredRows : DEFAULT_ROW_HEIGHT;
+    }
+    
+    requestRender() {
+        if (this.renderFrame !== null) {
+            return;
+        }
+        this.renderFrame = requestAnimationFrame(() => {
+            this.renderFrame = null;
+            this.renderMessages();
+        });
+    }
+    
+    renderMessages() {
+        // Mount only the rows in (or near) the viewport; spacers take the place of the rest
+        this.messagesDirty = false;
+        const pane = this.messagesPane;
+        
+        let removedHeight = 0;
+        if (this.rows.length > MAX_ROWS) {
+            this.rows.splice(0, this.rows.length - MAX_ROWS).forEach(row => {
+                removedHeight += row.height || this.estimatedRowHeight();
+                if (row.id) {
+                    this.rowsById.delete(row.id);
+                }
+                this.unmountRow(row);
+            });
+        }
+        
+        const estimate = this.estimatedRowHeight();
+        let total = 0;
+        for (const row of this.rows) {
+            total += row.height || estimate;
+        }
+        const viewport = pane.clientHeight;
+        const scrollTop = this.stickToBottom ? Math.max(0, total - viewport) : Math.max(0, pane.scrollTop - removedHeight);
+        const viewTop = scrollTop - OVERSCAN_PX;
+        const viewBottom = scrollTop + viewport + OVERSCAN_PX;
+        
+        let offset = 0;
+        let first = this.rows.length;
+        let last = this.rows.length;
+        let above = total;
+        let below = 0;
+        for (let i = 0; i < this.rows.length; i++) {
+            const height = this.rows[i].height || estimate;
+            if (first === this.rows.length && offset + height > viewTop) {
+                first = i;
+                above = offset;
+            }
+            if (offset >= viewBottom) {
+                last = i;
+                below = total - offset;
+                break;
+            }
+            offset += height;
+        }
+        
+        const visible = this.rows.slice(first, last);
+        const wanted = new Set(visible);
+        this.mountedRows.forEach(row => {
+            if (!wanted.has(row)) {
+                this.unmountRow(row);
+            }
+        });
+        // Rows already in place stay put; only new ones are inserted
+        let cursor = this.topSpacer.nextSibling;
+        for (const row of visible) {
+            if (!row.element) {
+                row.element = this.createRowElement(row);
+                this.mountedRows.add(row);
+            }
+            if (row.element === cursor) {
+                cursor = cursor.nextSibling;
+            } else {
+                pane.insertBefore(row.element, cursor);
+            }
+        }
+        this.topSpacer.style.height = `${above}px`;
+        this.bottomSpacer.style.height = `${below}px`;
         
-        this.messagesPane.appendChild(messageDiv);
-        this.scrollToBottom();
+        // All writes are done, so measuring costs a single layout for the whole frame
+        for (const row of visible) {
+            const height = row.element.offsetHeight;
+            if (height && !row.height) {
+                this.measuredHeight += height;
+                this.measuredRows += 1;
+            }
+            row.height = height;
+        }
+        if (this.stickToBottom) {
+            pane.scrollTop = pane.scrollHeight;
+        } else if (removedHeight) {
+            pane.scrollTop = scrollTop;
+        }
     }
     
-    updateUsersList(users) {
-        this.usersList.innerHTML = '';
-        users.forEach(user => {
-            const li = document.createElement('li');
-            li.textContent = user;
-            if (user === this.currentUsername) {
-                li.style.fontWeight = 'bold';
+    setRoster(users) {
+        const online = new Set(users);
+        Array.from(this.onlineUsers.keys()).forEach(user => {
+            if (!online.has(user)) {
+                this.removeUser(user);
             }
-            this.usersList.appendChild(li);
         });
+        users.forEach(user => this.addUser(user));
+    }
+    
+    addUser(user) {
+        if (this.onlineUsers.has(user)) {
+            return;
+        }
+        const li = document.createElement('li');
+        li.textContent = user;
+        if (user === this.currentUsername) {
+            li.style.fontWeight = 'bold';
+        }
+        this.usersList.appendChild(li);
+        this.onlineUsers.set(user, li);
+    }
+    
+    removeUser(user) {
+        const li = this.onlineUsers.get(user);
+        if (li) {
+            li.remove();
+            this.onlineUsers.delete(user);
+        }
     }
     
     sendMessage() {
@@ -245,21 +585,52 @@ class ChatApp {
         this.ws.send(JSON.stringify(message));
         this.messageInput.value = '';
         this.autoResizeTextarea();
+        this.stopTyping();
     }
     
-    autoResizeTextarea() {
-        this.messageInput.style.height = 'auto';
-        this.messageInput.style.height = Math.min(this.messageInput.scrollHeight, 100) + 'px';
+    notifyTyping() {
+        if (!this.isConnected) {
+            return;
+        }
+        // Refresh at most every 3s while typing, and clear after 4s without input
+        const now = Date.now();
+        if (now - this.typingSentAt > 3000) {
+            this.typingSentAt = now;
+            this.ws.send(JSON.stringify({ type: 'typing', active: true }));
+        }
+        clearTimeout(this.typingIdleTimer);
+        this.typingIdleTimer = setTimeout(() => this.stopTyping(), 4000);
     }
     
-    scrollToBottom() {
-        this.messagesPane.scrollTop = this.messagesPane.scrollHeight;
+    stopTyping() {
+        clearTimeout(this.typingIdleTimer);
+        if (this.typingSentAt && this.isConnected) {
+            this.ws.send(JSON.stringify({ type: 'typing', active: false }));
+        }
+        this.typingSentAt = 0;
     }
     
-    escapeHtml(text) {
-        const div = document.createElement('div');
-        div.textContent = text;
-        return div.innerHTML;
+    showTyping(username, active) {
+        if (username === this.currentUsername) {
+            return;
+        }
+        clearTimeout(this.typingUsers.get(username));
+        if (active) {
+            // Expire on our own in case the "stopped" signal is dropped
+            this.typingUsers.set(username, setTimeout(() => this.showTyping(username, false), 6000));
+        } else {
+            this.typingUsers.delete(username);
+        }
+        const names = Array.from(this.typingUsers.keys());
+        this.typingIndicator.textContent = names.length === 0 ? ''
+            : names.length === 1 ? `${names[0]} is typing…`
+            : names.length <= 3 ? `${names.join(', ')} are typing…`
+            : 'Several people are typing…';
+    }
+    
+    autoResizeTextarea() {
+        this.messageInput.style.height = 'auto';
+        this.messageInput.style.height = Math.min(this.messageInput.scrollHeight, 100) + 'px';
     }
     
     setupEmojiPicker(messageContainer, emojiPickerBtn) {
@@ -329,49 +700,95 @@ class ChatApp {
     }
     
     addReaction(messageContainer, emoji) {
-        // Emit add_reaction event to server
-        if (this.isConnected) {
-            const message = {
+        // Emit add_reaction event to server; the count is updated when the reaction_delta comes back
+        const messageId = messageContainer.dataset.messageId;
+        if (this.isConnected && messageId) {
+            this.ws.send(JSON.stringify({
                 type: 'add_reaction',
                 emoji: emoji,
-                messageId: messageContainer.dataset.messageId || Date.now().toString()
-            };
-            this.ws.send(JSON.stringify(message));
+                message_id: messageId
+            }));
+        }
+    }
+    
+    toggleReaction(messageContainer, emoji) {
+        const messageId = messageContainer.dataset.messageId;
+        if (!this.isConnected || !messageId) {
+            return;
         }
         
-        // Optimistically add reaction to UI
-        this.displayReaction(messageContainer, emoji, this.currentUsername);
+        const reacted = this.myReactions.has(`${messageId}:${emoji}`);
+        this.ws.send(JSON.stringify({
+            type: reacted ? 'remove_reaction' : 'add_reaction',
+            emoji: emoji,
+            message_id: messageId
+        }));
     }
     
-    displayReaction(messageContainer, emoji, username) {
+    applyReactionDelta(data) {
+        const key = `${data.message_id}:${data.emoji}`;
+        // Coalesced deltas list who added and removed; single changes name the user
+        const added = data.added || (data.delta > 0 ? [data.user] : []);
+        const removed = data.removed || (data.delta < 0 ? [data.user] : []);
+        if (added.includes(this.currentUsername)) {
+            this.myReactions.add(key);
+        } else if (removed.includes(this.currentUsername)) {
+            this.myReactions.delete(key);
+        }
+        
+        const row = this.rowsById.get(data.message_id);
+        if (!row) {
+            return;
+        }
+        if (data.count > 0) {
+            row.reactions.set(data.emoji, data.count);
+        } else {
+            row.reactions.delete(data.emoji);
+        }
+        // Rows out of view pick the change up from the model when they are next mounted
+        if (row.element) {
+            this.setReactionCount(row.element.firstChild, data.emoji, data.count);
+            this.messagesDirty = true;
+        }
+    }
+    
+    setReactionCount(messageContainer, emoji, count) {
         const reactionsSpan = messageContainer.querySelector('.reactions');
+        let reactionBtn = Array.from(reactionsSpan.children).find(btn => btn.dataset.emoji === emoji);
         
-        // Check if this emoji already exists
-        let existingReaction = reactionsSpan.querySelector(`[data-emoji="${emoji}"]`);
+        if (count <= 0) {
+            if (reactionBtn) {
+                reactionBtn.remove();
+            }
+            return;
+        }
         
-        if (existingReaction) {
-            // Update count and users
-            const countSpan = existingReaction.querySelector('.reaction-count');
-            const currentCount = parseInt(countSpan.textContent) || 1;
-            countSpan.textContent = currentCount + 1;
-        } else {
+        if (!reactionBtn) {
             // Create new reaction button
-            const reactionBtn = document.createElement('button');
+            reactionBtn = document.createElement('button');
             reactionBtn.className = 'reaction-btn';
             reactionBtn.dataset.emoji = emoji;
-            reactionBtn.innerHTML = `
-                <span class="reaction-emoji">${emoji}</span>
-                <span class="reaction-count">1</span>
-            `;
             
-            // Add click handler to toggle reaction
+            const emojiSpan = document.createElement('span');
+            emojiSpan.className = 'reaction-emoji';
+            emojiSpan.textContent = emoji;
+            
+            const countSpan = document.createElement('span');
+            countSpan.className = 'reaction-count';
+            
+            reactionBtn.appendChild(emojiSpan);
+            reactionBtn.appendChild(countSpan);
+            
+            // Clicking a reaction toggles the current user's reaction
             reactionBtn.addEventListener('click', () => {
-                // TODO: Implement remove reaction functionality
-                console.log('Toggle reaction:', emoji);
+                this.toggleReaction(messageContainer, emoji);
             });
             
             reactionsSpan.appendChild(reactionBtn);
         }
+        
+        reactionBtn.querySelector('.reaction-count').textContent = count;
+        reactionBtn.classList.toggle('mine', this.myReactions.has(`${messageContainer.dataset.messageId}:${emoji}`));
     }
 }
 
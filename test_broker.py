@@ -0,0 +1,74 @@
+"""Unit tests for node number reservation in the backplane broker (app.broker)."""
+
+from app.broker import Broker
+from app.records import NODE_COUNT
+
+
+class FakeTransport:
+    def __init__(self):
+        self.buffered = 0
+        self.aborted = False
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+    def abort(self):
+        self.aborted = True
+
+
+class FakeWriter:
+    """Stands in for a node connection that never reads: everything written stays buffered"""
+
+    def __init__(self):
+        self.transport = FakeTransport()
+
+    def write(self, data):
+        self.transport.buffered += len(data)
+
+    def is_closing(self):
+        return self.transport.aborted
+
+
+def test_requested_number_is_granted_once_per_process():
+    broker = Broker()
+    first, shard, other = FakeWriter(), FakeWriter(), FakeWriter()
+    assert broker._reserve(7, "process-a", first) == {"op": "welcome", "message_node": 7}
+    # Another connection from the same process (a shard) shares the number
+    assert broker._reserve(7, "process-a", shard)["op"] == "welcome"
+    assert broker._reserve(7, "process-b", other)["op"] == "refused"
+
+
+def test_number_is_freed_when_its_last_holder_leaves():
+    broker = Broker()
+    first, shard, other = FakeWriter(), FakeWriter(), FakeWriter()
+    broker._reserve(7, "process-a", first)
+    broker._reserve(7, "process-a", shard)
+    broker._release(first)
+    assert broker._reserve(7, "process-b", other)["op"] == "refused"
+    broker._release(shard)
+    assert broker._reserve(7, "process-b", other)["op"] == "welcome"
+
+
+def test_assigned_numbers_are_distinct_and_in_range():
+    broker = Broker()
+    granted = {broker._reserve(None, f"process-{i}", FakeWriter())["message_node"] for i in range(50)}
+    assert len(granted) == 50
+    assert all(0 <= number < NODE_COUNT for number in granted)
+
+
+def test_out_of_range_numbers_are_refused():
+    broker = Broker()
+    assert broker._reserve(NODE_COUNT, "process-a", FakeWriter())["op"] == "refused"
+    assert broker._reserve(-1, "process-a", FakeWriter())["op"] == "refused"
+
+
+def test_node_that_stops_reading_is_disconnected():
+    broker = Broker(max_buffer=4096)
+    publisher, slow = FakeWriter(), FakeWriter()
+    broker.subscribers["room"] = {publisher, slow}
+    packet = {"room": "room", "envelope": {"kind": "event", "event": {"content": "x" * 100}}}
+    for _ in range(100):
+        broker._forward("room", packet, publisher)
+    assert slow.transport.aborted
+    assert slow.transport.buffered < 4096 + 200  # nothing more is queued once it is over the limit
+    assert not publisher.transport.aborted
@@ -0,0 +1,104 @@
+"""Unit tests for merging reaction changes and messages into one frame per flush (app.coalesce)."""
+
+import asyncio
+import logging
+
+from app.coalesce import Coalescer, ReactionChange
+
+
+def test_a_reaction_added_and_removed_again_cancels_out():
+    change = ReactionChange()
+    change.apply("alice", 1, 1)
+    change.apply("alice", -1, 0)
+    assert change.event("m1", "👍") is None
+
+
+def test_changes_by_one_user_keep_the_user():
+    change = ReactionChange()
+    change.apply("alice", 1, 3)
+    assert change.event("m1", "👍") == {"type": "reaction_delta", "message_id": "m1", "emoji": "👍", "delta": 1, "count": 3, "user": "alice"}
+
+
+def test_changes_by_several_users_are_listed_by_direction():
+    change = ReactionChange()
+    change.apply("alice", 1, 1)
+    change.apply("bob", 1, 2)
+    change.apply("carol", -1, 1)
+    change.apply("dave", 1, 2)
+    change.apply("dave", -1, 1)  # cancelled out
+    event = change.event("m1", "👍")
+    assert event["delta"] == 1 and event["count"] == 1
+    assert event["added"] == ["alice", "bob"] and event["removed"] == ["carol"]
+    assert "user" not in event
+
+
+class Recorder:
+    def __init__(self):
+        self.flushed = []
+
+    async def __call__(self, room, event):
+        self.flushed.append((asyncio.get_running_loop().time(), room, event))
+
+
+def test_reactions_are_merged_into_one_flush():
+    async def run():
+        recorder = Recorder()
+        coalescer = Coalescer(0.05, 0.05, recorder)
+        coalescer.add_reaction("room", "m1", "👍", "alice", 1, 1)
+        coalescer.add_reaction("room", "m1", "👍", "bob", 1, 2)
+        coalescer.add_reaction("room", "m2", "🎉", "alice", 1, 1)
+        await asyncio.sleep(0.1)
+        assert len(recorder.flushed) == 1
+        _, room, event = recorder.flushed[0]
+        assert room == "room" and event["type"] == "batch"
+        assert [(e["message_id"], e["count"]) for e in event["events"]] == [("m1", 2), ("m2", 1)]
+        assert coalescer.coalesced == 1 and not coalescer.pending and "room" not in coalescer.timers
+
+    asyncio.run(run())
+
+
+def test_a_message_pulls_the_batch_earlier():
+    async def run():
+        recorder = Recorder()
+        coalescer = Coalescer(1.0, 0.02, recorder)
+        started = asyncio.get_running_loop().time()
+        coalescer.add_reaction("room", "m1", "👍", "alice", 1, 1)
+        coalescer.add_message("room", {"type": "message", "id": "m2"})
+        coalescer.add_reaction("room", "m1", "👍", "bob", 1, 2)  # does not push the deadline back
+        await asyncio.sleep(0.1)
+        assert len(recorder.flushed) == 1
+        flushed_at, _, event = recorder.flushed[0]
+        assert flushed_at - started < 0.5
+        # Messages first, then the merged reactions
+        assert [e["type"] for e in event["events"]] == ["message", "reaction_delta"]
+
+    asyncio.run(run())
+
+
+def test_flush_now_sends_the_batch_and_cancels_the_timer():
+    async def run():
+        recorder = Recorder()
+        coalescer = Coalescer(0.05, 0.05, recorder)
+        coalescer.add_message("room", {"type": "message", "id": "m1"})
+        await coalescer.flush_now("room")
+        assert [event for _, _, event in recorder.flushed] == [{"type": "message", "id": "m1"}]
+        assert "room" not in coalescer.timers
+        await asyncio.sleep(0.1)
+        assert len(recorder.flushed) == 1
+
+    asyncio.run(run())
+
+
+def test_a_failed_flush_is_logged(caplog):
+    async def fail(room, event):
+        raise RuntimeError("boom")
+
+    async def run():
+        coalescer = Coalescer(0.01, 0.01, fail)
+        coalescer.add_message("room", {"type": "message", "id": "m1"})
+        await asyncio.sleep(0.05)
+        assert not coalescer.timers.tasks
+
+    with caplog.at_level(logging.ERROR, logger="app.timers"):
+        asyncio.run(run())
+    assert "coalesced event flush for room 'room' failed" in caplog.text
@@ -0,0 +1,102 @@
+"""Unit tests for the durable message log (app.eventlog)."""
+
+import asyncio
+import os
+import struct
+import uuid
+
+import msgpack
+
+from app.eventlog import MessageLog
+from app.records import StoredMessage
+
+
+def write(directory, room, contents):
+    """Append messages with a freshly started log, as a restarted server would, and return it"""
+    log = MessageLog(str(directory), batch_delay=0, fsync=False)
+
+    async def run():
+        await log.start()
+        for content in contents:
+            log.append(room, StoredMessage.new("alice", content))
+        await log.flush()
+        await log.stop()
+    asyncio.run(run())
+    return log
+
+
+def contents(page):
+    return [(cursor, message.content) for cursor, message in page]
+
+
+def test_pages_and_cursors(tmp_path):
+    log = write(tmp_path, "room", [f"m{i}" for i in range(10)])
+    assert log.count("room") == 10
+    page, total = log.read_page("room", 3)
+    assert total == 10 and contents(page) == [(7, "m7"), (8, "m8"), (9, "m9")]
+    page, _ = log.read_page("room", 3, before=7)
+    assert contents(page) == [(4, "m4"), (5, "m5"), (6, "m6")]
+    page, _ = log.read_page("room", 5, before=2)
+    assert contents(page) == [(0, "m0"), (1, "m1")]
+    page, _ = log.read_from("room", 8, 5)
+    assert contents(page) == [(8, "m8"), (9, "m9")]
+    assert log.read_from("room", 10, 5) == ([], 10)
+
+
+def test_rooms_are_separate_and_unknown_rooms_are_empty(tmp_path):
+    write(tmp_path, "a", ["one"])
+    log = write(tmp_path, "b", ["two", "three"])
+    assert (log.count("a"), log.count("b"), log.count("c")) == (1, 2, 0)
+    assert log.read_page("c", 10) == ([], 0)
+
+
+def test_messages_round_trip(tmp_path):
+    log = MessageLog(str(tmp_path), batch_delay=0, fsync=False)
+    message = StoredMessage.new("bob", "héllo")
+
+    async def run():
+        await log.start()
+        log.append("room", message)
+        await log.stop()  # stop flushes what is still pending
+    asyncio.run(run())
+    (_, stored), = log.read_page("room", 1)[0]
+    assert (stored.id, stored.user, stored.content, stored.timestamp) == (message.id, "bob", "héllo", message.timestamp)
+
+
+def test_legacy_records_are_readable(tmp_path):
+    log = write(tmp_path, "room", ["new"])
+    log_path, index_path = log._paths("room")
+    legacy_id = str(uuid.uuid4())
+    body = msgpack.packb({"id": legacy_id, "user": "carol", "content": "old", "ts": "2024-01-02T03:04:05"}, use_bin_type=True)
+    offset = log_path.stat().st_size
+    with open(log_path, "ab") as file:
+        file.write(struct.pack("<I", len(body)) + body)
+    with open(index_path, "ab") as file:
+        file.write(struct.pack("<Q", offset))
+    (_, stored), = log.read_from("room", 1, 1)[0]
+    assert stored.user == "carol" and stored.content == "old"
+    assert stored.message_id == legacy_id
+
+
+def test_torn_tail_is_repaired_on_start(tmp_path):
+    log = write(tmp_path, "room", ["m0", "m1", "m2"])
+    log_path, index_path = log._paths("room")
+    # A crash mid-write: the last record is cut short and a dangling index entry points past the end
+    with open(index_path, "ab") as file:
+        file.write(struct.pack("<Q", log_path.stat().st_size + 100))
+    os.truncate(log_path, log_path.stat().st_size - 3)
+    assert contents(log.read_page("room", 10)[0]) == [(0, "m0"), (1, "m1")]  # short reads end the page
+
+    log = write(tmp_path, "room", ["m3"])  # start() repairs before appending
+    assert log.count("room") == 3
+    assert contents(log.read_page("room", 10)[0]) == [(0, "m0"), (1, "m1"), (2, "m3")]
+
+
+def test_repair_drops_a_torn_index_entry(tmp_path):
+    log = write(tmp_path, "room", ["m0", "m1"])
+    _, index_path = log._paths("room")
+    with open(index_path, "ab") as file:
+        file.write(b"\x01\x02\x03")  # part of an 8-byte entry
+    assert log.repair() == 0
+    assert index_path.stat().st_size == 16
+    assert contents(log.read_page("room", 10)[0]) == [(0, "m0"), (1, "m1")]
@@ -0,0 +1,102 @@
+"""Unit tests for pinging and expiring quiet connections (app.heartbeat)."""
+
+import asyncio
+
+from app.heartbeat import PING_FRAME, Heartbeat
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.last_seen = 0.0
+        self.sent = []
+        self.expired = False
+
+    def enqueue(self, frame):
+        self.sent.append(frame)
+        return True
+
+    async def expire(self):
+        self.closed = self.expired = True
+
+
+def watched(heartbeat, count=1):
+    connections = [FakeConnection() for _ in range(count)]
+    for connection in connections:
+        heartbeat.watch(connection)
+        connection.last_seen = heartbeat.wheel.started  # pin the clock for exact tick arithmetic
+    return connections
+
+
+def check(heartbeat, offset):
+    asyncio.run(heartbeat.check(heartbeat.wheel.started + offset))
+
+
+def test_quiet_connection_is_pinged_after_the_interval():
+    heartbeat = Heartbeat(interval=5, timeout=3)
+    connection, = watched(heartbeat)
+    check(heartbeat, 4)
+    assert connection.sent == []
+    check(heartbeat, 5)
+    assert connection.sent == [PING_FRAME]
+    assert not connection.expired
+
+
+def test_unanswered_ping_expires_the_connection():
+    heartbeat = Heartbeat(interval=5, timeout=3)
+    connection, = watched(heartbeat)
+    check(heartbeat, 5)
+    check(heartbeat, 7)
+    assert not connection.expired
+    check(heartbeat, 8)
+    assert connection.expired
+    assert len(heartbeat.wheel) == 0
+
+
+def test_activity_postpones_the_ping():
+    heartbeat = Heartbeat(interval=5, timeout=3)
+    connection, = watched(heartbeat)
+    connection.last_seen += 3  # a frame arrived at 3s
+    check(heartbeat, 5)  # due, but only quiet for 2s: rescheduled, not pinged
+    assert connection.sent == []
+    check(heartbeat, 7)
+    assert connection.sent == []
+    check(heartbeat, 8)
+    assert connection.sent == [PING_FRAME]
+
+
+def test_reply_after_the_ping_keeps_the_connection():
+    heartbeat = Heartbeat(interval=5, timeout=3)
+    connection, = watched(heartbeat)
+    check(heartbeat, 5)
+    connection.last_seen += 6  # the pong
+    check(heartbeat, 8)
+    assert not connection.expired
+    assert connection in heartbeat.wheel.positions
+
+
+def test_closed_and_forgotten_connections_are_skipped():
+    heartbeat = Heartbeat(interval=5, timeout=3)
+    closed, forgotten = watched(heartbeat, 2)
+    closed.closed = True
+    heartbeat.forget(forgotten)
+    check(heartbeat, 20)
+    assert closed.sent == [] and not closed.expired
+    assert forgotten.sent == [] and not forgotten.expired
+    assert len(heartbeat.wheel) == 0
+
+
+def test_disabled_heartbeat_watches_nothing():
+    heartbeat = Heartbeat(interval=0, timeout=3)
+    assert not heartbeat.enabled
+    watched(heartbeat)
+    assert len(heartbeat.wheel) == 0
+
+
+def test_many_connections_due_together():
+    heartbeat = Heartbeat(interval=5, timeout=3)
+    connections = watched(heartbeat, 2500)  # more than one batch between yields
+    check(heartbeat, 5)
+    assert all(connection.sent == [PING_FRAME] for connection in connections)
+    check(heartbeat, 8)
+    assert all(connection.expired for connection in connections)
@@ -0,0 +1,115 @@
+"""Unit tests for the in-memory history and its budgets (app.history)."""
+
+import time
+
+from app.history import MESSAGE_OVERHEAD_BYTES, HistoryStore, estimate_size
+from app.records import StoredMessage
+from app.tiering import ColdStore
+
+
+def fill(store, room, count, content="x" * 60):
+    messages = [StoredMessage.new("alice", content) for _ in range(count)]
+    for message in messages:
+        store.add(room, message)
+    return messages
+
+
+def test_room_depth_evicts_oldest_messages():
+    store = HistoryStore(room_depth=3, max_bytes=1 << 30)
+    messages = fill(store, "room", 5)
+    page, total = store.page("room", 10)
+    assert total == 5
+    assert [cursor for cursor, _ in page] == [2, 3, 4]
+    assert [message for _, message in page] == messages[2:]
+    assert store.get("room", messages[0].id) is None
+    assert store.evicted_messages == 2
+    assert store.total_messages == 3
+
+
+def test_size_accounting_returns_to_zero():
+    store = HistoryStore(room_depth=10, max_bytes=1 << 30)
+    messages = fill(store, "room", 4)
+    store.add_reaction("room", messages[0].id, "👍", "bob")
+    assert store.total_size > 4 * estimate_size(messages[0])
+    store.drop_room("room")
+    assert (store.total_size, store.total_messages) == (0, 0)
+
+
+def test_budget_evicts_least_recently_active_rooms():
+    per_message = MESSAGE_OVERHEAD_BYTES + 60
+    store = HistoryStore(room_depth=100, max_bytes=per_message * 25)
+    fill(store, "a", 10)
+    fill(store, "b", 10)
+    fill(store, "a", 1)  # "a" is now the most recently active
+    fill(store, "c", 10)
+    assert list(store.rooms) == ["a", "c"]
+    assert store.total_size <= store.max_bytes
+    assert (store.evicted_rooms, store.evicted_room_messages) == (1, 10)
+
+
+def test_budget_never_evicts_the_room_being_written():
+    store = HistoryStore(room_depth=100, max_bytes=1)
+    fill(store, "a", 3)
+    assert list(store.rooms) == ["a"]
+    fill(store, "b", 1)
+    assert list(store.rooms) == ["b"]
+
+
+def test_budget_never_drops_rooms_with_members():
+    per_message = MESSAGE_OVERHEAD_BYTES + 60
+    store = HistoryStore(room_depth=100, max_bytes=per_message * 15)
+    store.pinned = {"a"}
+    messages = fill(store, "a", 10)
+    fill(store, "b", 3)
+    fill(store, "c", 10)  # "a" is least recently active but connected: "b" goes instead
+    assert set(store.rooms) == {"a", "c"}
+    assert store.total_size > store.max_bytes  # pinned rooms alone may exceed the budget
+    message, = fill(store, "a", 1)
+    page, total = store.page("a", 1)
+    assert total == 11 and page == [(10, message)]  # cursors still match the message log
+    assert store.add_reaction("a", messages[0].id, "👍", "bob") == 1
+
+
+def test_budget_spills_to_the_cold_store_and_rehydrates(tmp_path):
+    per_message = MESSAGE_OVERHEAD_BYTES + 60
+    cold = ColdStore(str(tmp_path))
+    cold.open()
+    store = HistoryStore(room_depth=100, max_bytes=per_message * 15, cold=cold)
+    messages = fill(store, "a", 10)
+    store.add_reaction("room", messages[0].id, "👍", "bob")  # unknown room: ignored
+    store.add_reaction("a", messages[0].id, "👍", "bob")
+    version = store.version("a")
+    fill(store, "b", 10)
+    assert list(store.rooms) == ["b"] and cold.rooms == {"a"}
+    assert store.holds("a") and store.evicted_rooms == 0
+    assert store.version("a") == version  # read without rehydrating
+    page, total = store.page("a", 3)  # brings "a" back, spilling "b"
+    assert total == 10 and [message.id for _, message in page] == [message.id for message in messages[-3:]]
+    assert list(store.rooms) == ["a"] and cold.rooms == {"b"}
+    assert store.reactions("a", messages[0].id).count("👍") == 1
+    assert store.version("a") == version
+    cold.close()
+
+
+def test_spill_idle_keeps_active_and_listed_rooms(tmp_path):
+    cold = ColdStore(str(tmp_path))
+    cold.open()
+    store = HistoryStore(room_depth=100, max_bytes=1 << 30, cold=cold)
+    fill(store, "old", 1)
+    fill(store, "kept", 1)
+    cutoff = time.monotonic()
+    fill(store, "new", 1)
+    assert store.spill_idle(cutoff, keep={"kept"}) == 1
+    assert set(store.rooms) == {"kept", "new"} and cold.rooms == {"old"}
+    cold.close()
+
+
+def test_versions_change_on_writes_only():
+    store = HistoryStore(room_depth=10, max_bytes=1 << 30)
+    assert store.version("room") == 0
+    message, = fill(store, "room", 1)
+    first = store.version("room")
+    store.page("room", 10)
+    assert store.version("room") == first
+    store.add_reaction("room", message.id, "👍", "bob")
+    assert store.version("room") != first
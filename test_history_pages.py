@@ -0,0 +1,126 @@
+"""Unit tests for the history pages sent to clients (app.main)."""
+
+import asyncio
+import json
+
+from starlette.requests import Request
+
+from app import config
+from app import main
+from app.main import ConnectionManager, etag_matches
+from app.reactions import ReactionIndex
+from app.records import StoredMessage
+
+
+def post(manager, room, count):
+    messages = [StoredMessage.new("alice", f"message {index}") for index in range(count)]
+    for message in messages:
+        manager.store_message(room, message)
+    return messages
+
+
+def test_reaction_index_lists_a_users_own_emoji():
+    index = ReactionIndex()
+    index.add("👍", "alice")
+    index.add("🎉", "bob")
+    index.add("❤️", "alice")
+    assert index.reacted("alice") == ["👍", "❤️"]
+    assert index.reacted("carol") == []
+
+
+def test_history_pages_carry_the_users_own_reactions():
+    async def run():
+        manager = ConnectionManager()
+        first, second, _ = post(manager, "room", 3)
+        manager.add_reaction("room", first.message_id, "👍", "alice")
+        manager.add_reaction("room", first.message_id, "👍", "bob")
+        manager.add_reaction("room", second.message_id, "🎉", "bob")
+        page = await manager.cached_history_page("room", 50)
+        shared = page.frame.event
+
+        mine = manager.with_own_reactions("room", shared, "bob")
+        assert [message.get("mine") for message in mine["messages"]] == [["👍"], ["🎉"], None]
+        assert [message.get("mine") for message in manager.with_own_reactions("room", shared, "alice")["messages"]] == [["👍"], None, None]
+        # The cached page is shared by every user and never modified
+        assert all("mine" not in message for message in shared["messages"])
+        assert manager.with_own_reactions("room", shared, "carol") is shared
+
+    asyncio.run(run())
+
+
+def request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_cached_pages_are_reused_until_the_room_changes():
+    async def run():
+        manager = ConnectionManager()
+        first, _ = post(manager, "room", 2)
+        page = await manager.cached_history_page("room", 50)
+        assert await manager.cached_history_page("room", 50) is page  # unchanged room: a hit
+
+        post(manager, "room", 1)
+        after_message = await manager.cached_history_page("room", 50)
+        assert after_message is not page and after_message.etag != page.etag
+        assert len(after_message.frame.event["messages"]) == 3
+
+        manager.add_reaction("room", first.message_id, "👍", "alice")
+        after_reaction = await manager.cached_history_page("room", 50)
+        assert after_reaction is not after_message and after_reaction.etag != after_message.etag
+        assert after_reaction.frame.event["messages"][0]["reactions"] == {"👍": 1}
+        # Another room's writes leave this room's page alone
+        post(manager, "other", 1)
+        assert await manager.cached_history_page("room", 50) is after_reaction
+
+    asyncio.run(run())
+
+
+def test_if_none_match():
+    etag = '"abc"'
+    assert not etag_matches(request(), etag)
+    assert etag_matches(request('"abc"'), etag)
+    assert etag_matches(request('W/"abc"'), etag)
+    assert etag_matches(request('"xyz", W/"abc"'), etag)
+    assert etag_matches(request("*"), etag)
+    assert not etag_matches(request('"xyz"'), etag)
+
+
+def test_history_requests_revalidate_with_the_etag(monkeypatch):
+    async def run():
+        manager = ConnectionManager()
+        monkeypatch.setattr(main, "manager", manager)
+        post(manager, "room", 2)
+        response = await main.get_history(request(), "room", 50, None)
+        assert response.status_code == 200 and len(json.loads(response.body)["messages"]) == 2
+        etag = response.headers["etag"]
+        assert (await main.get_history(request("W/" + etag), "room", 50, None)).status_code == 304
+        post(manager, "room", 1)
+        response = await main.get_history(request(etag), "room", 50, None)
+        assert response.status_code == 200 and response.headers["etag"] != etag
+
+    asyncio.run(run())
+
+
+def test_export_streams_every_chunk_and_stops_at_the_end(monkeypatch):
+    async def run():
+        manager = ConnectionManager()
+        monkeypatch.setattr(main, "manager", manager)
+        monkeypatch.setattr(config, "EXPORT_CHUNK", 3)
+        messages = post(manager, "room", 7)
+        calls = []
+        export_chunk = manager.export_chunk
+
+        async def counted(room, start, limit):
+            calls.append(start)
+            return await export_chunk(room, start, limit)
+
+        monkeypatch.setattr(manager, "export_chunk", counted)
+        response = await main.get_export("room")
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        assert [line["cursor"] for line in lines] == list(range(7))
+        assert [line["message_id"] for line in lines] == [message.message_id for message in messages]
+        assert calls == [0, 3, 6]
+
+    asyncio.run(run())
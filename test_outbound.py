@@ -0,0 +1,129 @@
+"""Unit tests for per-connection outbound queues and slow consumer policies (app.outbound)."""
+
+import asyncio
+
+from app.encoding import Frame
+from app.outbound import SLOW_CONSUMER_CLOSE_CODE, Connection, SlowConsumerPolicy
+
+
+class FakeWebSocket:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self.close_code = None
+
+    async def send_text(self, text):
+        if self.fail:
+            raise ConnectionResetError("gone")
+        self.sent.append(text)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+def make_connection(policy, max_queue=2, websocket=None):
+    closed = []
+
+    async def on_close(connection):
+        closed.append(connection)
+
+    connection = Connection(websocket or FakeWebSocket(), "room", "alice", max_queue, SlowConsumerPolicy(policy), on_close=on_close)
+    return connection, closed
+
+
+def frame(n, ephemeral=False):
+    return Frame({"type": "typing" if ephemeral else "message", "n": n}, ephemeral=ephemeral)
+
+
+def queued(connection):
+    return [frame.event["n"] for frame in connection.queue]
+
+
+def test_drop_oldest_makes_room_for_the_new_frame():
+    async def run():
+        connection, closed = make_connection("drop-oldest")
+        for n in range(3):
+            assert connection.enqueue(frame(n))
+        assert queued(connection) == [1, 2]
+        assert connection.dropped == 1 and not connection.closed and not closed
+
+    asyncio.run(run())
+
+
+def test_drop_ephemeral_sheds_ephemeral_frames_first():
+    async def run():
+        connection, closed = make_connection("drop-ephemeral", max_queue=4)
+        assert connection.enqueue(frame(0))
+        assert connection.enqueue(frame(1, ephemeral=True))
+        assert not connection.enqueue(frame(2, ephemeral=True))  # half full: no more ephemeral frames
+        assert connection.enqueue(frame(3))
+        assert connection.enqueue(frame(4))
+        assert connection.enqueue(frame(5))  # full: the queued ephemeral frame goes
+        assert queued(connection) == [0, 3, 4, 5]
+        assert connection.dropped == 2 and not connection.closed
+
+    asyncio.run(run())
+
+
+def test_drop_ephemeral_disconnects_when_only_real_frames_are_queued():
+    async def run():
+        connection, closed = make_connection("drop-ephemeral")
+        connection.enqueue(frame(0))
+        connection.enqueue(frame(1))
+        assert not connection.enqueue(frame(2, ephemeral=True))  # an ephemeral frame is just dropped
+        assert not connection.closed
+        assert not connection.enqueue(frame(3))
+        assert connection.closed and not connection.queue
+        await asyncio.sleep(0)
+        assert connection.websocket.close_code == SLOW_CONSUMER_CLOSE_CODE and closed == [connection]
+
+    asyncio.run(run())
+
+
+def test_disconnect_closes_a_full_connection():
+    async def run():
+        connection, closed = make_connection("disconnect")
+        connection.enqueue(frame(0))
+        connection.enqueue(frame(1))
+        assert not connection.enqueue(frame(2))
+        assert not connection.enqueue(frame(3))  # nothing is queued once closed
+        await asyncio.sleep(0)
+        assert connection.websocket.close_code == SLOW_CONSUMER_CLOSE_CODE and closed == [connection]
+
+    asyncio.run(run())
+
+
+def test_a_queue_of_one_still_takes_ephemeral_frames_when_empty():
+    async def run():
+        connection, _ = make_connection("drop-oldest", max_queue=1)
+        assert connection.enqueue(frame(0, ephemeral=True))
+        assert not connection.enqueue(frame(1, ephemeral=True))
+        assert queued(connection) == [0]
+
+    asyncio.run(run())
+
+
+def test_the_writer_sends_in_order():
+    async def run():
+        connection, _ = make_connection("disconnect", max_queue=10)
+        connection.start()
+        for n in range(3):
+            connection.enqueue(frame(n))
+        await asyncio.sleep(0.01)
+        assert connection.websocket.sent == ['{"type":"message","n":0}', '{"type":"message","n":1}', '{"type":"message","n":2}']
+        await connection.stop()
+
+    asyncio.run(run())
+
+
+def test_a_failed_send_closes_the_connection():
+    async def run():
+        connection, closed = make_connection("disconnect", max_queue=10, websocket=FakeWebSocket(fail=True))
+        connection.start()
+        connection.enqueue(frame(0))
+        connection.enqueue(frame(1))
+        await asyncio.sleep(0.01)
+        assert connection.closed and not connection.queue and closed == [connection]
+        assert not connection.enqueue(frame(2))
+
+    asyncio.run(run())
@@ -0,0 +1,100 @@
+"""Unit tests for online members and batched presence announcements (app.presence)."""
+
+import asyncio
+
+from app.presence import Presence, PresenceBatcher
+
+
+def test_several_tabs_are_one_member():
+    presence = Presence()
+    assert presence.add_local("room", "alice")
+    assert not presence.add_local("room", "alice")
+    assert not presence.remove_local("room", "alice")
+    assert presence.is_online("room", "alice")
+    assert presence.remove_local("room", "alice")
+    assert not presence.is_online("room", "alice") and presence.online("room") == []
+
+
+def test_members_of_other_nodes_are_online():
+    presence = Presence()
+    presence.add_local("room", "alice")
+    presence.add_remote("room", "node-2", "bob")
+    presence.add_remote("room", "node-3", "alice")
+    assert presence.online("room") == ["alice", "bob"]
+    assert presence.set_remote("room", "node-2", ["carol"]) == {"bob", "carol"}
+    assert presence.drop_node("room", "node-3") == {"alice"}
+    assert presence.online("room") == ["alice", "carol"]
+
+
+class Room:
+    """A room's presence plus what its batcher announced"""
+
+    def __init__(self, delay):
+        self.presence = Presence()
+        self.announced = []
+        self.batcher = PresenceBatcher(delay, self.presence, self.announce)
+
+    async def announce(self, room, event):
+        self.announced.append(event)
+
+    async def join(self, username):
+        was_online = self.presence.is_online("room", username)
+        self.presence.add_local("room", username)
+        await self.batcher.changed("room", username, was_online)
+
+    async def leave(self, username):
+        was_online = self.presence.is_online("room", username)
+        self.presence.remove_local("room", username)
+        await self.batcher.changed("room", username, was_online)
+
+
+def test_a_window_of_changes_is_one_delta():
+    async def run():
+        room = Room(0.02)
+        await room.join("alice")
+        await room.join("bob")
+        await room.join("carol")
+        await room.leave("carol")  # joined and left within the window: never announced
+        assert room.announced == []
+        await asyncio.sleep(0.05)
+        assert room.announced == [{"type": "presence", "joined": ["alice", "bob"], "left": []}]
+        await room.leave("alice")
+        await asyncio.sleep(0.05)
+        assert room.announced[1:] == [{"type": "leave", "user": "alice"}]
+
+    asyncio.run(run())
+
+
+def test_a_member_who_flaps_is_not_announced():
+    async def run():
+        room = Room(0.02)
+        await room.join("alice")
+        await asyncio.sleep(0.05)
+        await room.leave("alice")
+        await room.join("alice")
+        await asyncio.sleep(0.05)
+        assert room.announced == [{"type": "join", "user": "alice"}]
+
+    asyncio.run(run())
+
+
+def test_without_a_delay_changes_are_announced_at_once():
+    async def run():
+        room = Room(0)
+        await room.join("alice")
+        assert room.announced == [{"type": "join", "user": "alice"}]
+
+    asyncio.run(run())
+
+
+def test_flush_now_announces_and_cancels_the_timer():
+    async def run():
+        room = Room(0.02)
+        await room.join("alice")
+        await room.batcher.flush_now("room")
+        assert room.announced == [{"type": "join", "user": "alice"}]
+        assert "room" not in room.batcher.timers
+        await asyncio.sleep(0.05)
+        assert len(room.announced) == 1
+
+    asyncio.run(run())
@@ -0,0 +1,119 @@
+"""Unit tests for inbound rate limiting (app.ratelimit)."""
+
+import pytest
+
+from app.ratelimit import RateLimitExceeded, RateLimiter, TokenBucket, parse_limit, parse_limits
+
+
+def test_parse_limits():
+    assert parse_limit("5/10") == (5.0, 10.0)
+    assert parse_limit("5") == (5.0, 5.0)
+    assert parse_limit(" ") is None
+    assert parse_limits("message=5/10, reaction=20 ,*=50/100,") == {"message": (5.0, 10.0), "reaction": (20.0, 20.0), "*": (50.0, 100.0)}
+
+
+def test_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=2, burst=3)
+    now = bucket.updated
+    assert all(bucket.take(now) for _ in range(3))
+    assert not bucket.take(now)
+    assert bucket.wait_time(now) == pytest.approx(0.5)
+    assert not bucket.take(now + 0.4)
+    assert bucket.take(now + 0.5)
+    assert not bucket.take(now + 0.5)
+
+
+def test_bucket_refill_is_capped_at_the_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+    now = bucket.updated + 60
+    assert bucket.take(now) and bucket.take(now)
+    assert not bucket.take(now)
+
+
+def test_ready_does_not_take():
+    bucket = TokenBucket(rate=1, burst=1)
+    now = bucket.updated
+    assert bucket.ready(now) and bucket.ready(now)
+    assert bucket.take(now)
+    assert not bucket.ready(now)
+
+
+def test_bucket_ignores_an_earlier_clock_reading():
+    bucket = TokenBucket(rate=1, burst=1)
+    assert bucket.take(bucket.updated - 5)
+
+
+def test_operation_types_share_their_group_limit():
+    limits = make_limiter(connection_limits="reaction=0.001/2,*=0.001/1", room_limits="").for_connection()
+    assert limits.admit("room", "add_reaction") is None
+    assert limits.admit("room", "remove_reaction") is None
+    assert limits.admit("room", "reaction") is not None
+    # Types without a limit of their own fall back to "*"
+    assert limits.admit("room", "history") is None
+    assert limits.admit("room", "reactors") is not None
+
+
+def make_limiter(connection_limits="message=100/100", room_limits="message=1/2", action="throttle"):
+    return RateLimiter(action, 1000, "", connection_limits, room_limits)
+
+
+def test_room_refusal_does_not_charge_the_connection():
+    limiter = make_limiter()
+    first, second = limiter.for_connection(), limiter.for_connection()
+    assert first.admit("room", "message") is None
+    assert first.admit("room", "message") is None
+    before = second.operations.get("message").tokens
+    refused = second.admit("room", "message")
+    assert refused is limiter.room_bucket("room", "message")
+    assert second.operations.get("message").tokens == before
+
+
+def test_connection_refusal_does_not_charge_the_room():
+    limiter = make_limiter(connection_limits="message=0.001/1", room_limits="message=0.001/5")
+    limits = limiter.for_connection()
+    assert limits.admit("room", "message") is None
+    room_tokens = limiter.room_bucket("room", "message").tokens
+    assert limits.admit("room", "message") is limits.operations.get("message")
+    assert limiter.room_bucket("room", "message").tokens == pytest.approx(room_tokens, abs=1e-3)
+
+
+def test_warned_state_is_per_connection():
+    limiter = make_limiter(room_limits="message=0.001/1")
+    first, second = limiter.for_connection(), limiter.for_connection()
+    assert first.admit("room", "message") is None
+    bucket = first.admit("room", "message")
+    first.warned.add(bucket)
+    # The shared room bucket refuses the second member too, who has not been told yet
+    assert second.admit("room", "message") is bucket
+    assert bucket not in second.warned
+
+
+def test_disconnect_action_raises_for_the_connections_own_limit():
+    limits = make_limiter(connection_limits="message=0.001/1", room_limits="", action="disconnect").for_connection()
+    limits.admit("room", "message")
+    with pytest.raises(RateLimitExceeded):
+        limits.admit("room", "message")
+
+
+def test_disconnect_action_never_closes_for_a_room_limit():
+    limiter = make_limiter(room_limits="message=0.001/1", action="disconnect")
+    flooder, bystander = limiter.for_connection(), limiter.for_connection()
+    assert flooder.admit("room", "message") is None
+    # The bystander's first message finds the shared bucket empty: dropped, not disconnected
+    assert bystander.admit("room", "message") is limiter.room_bucket("room", "message")
+
+
+def test_oversized_frames_are_refused():
+    limits = make_limiter().for_connection()
+    assert limits.admit_size(1000)
+    assert not limits.admit_size(1001)
+
+
+def test_text_frames_are_measured_in_utf8_bytes():
+    limits = make_limiter().for_connection()  # 1000 bytes
+    assert limits.admit_text("x" * 250)
+    assert limits.admit_text("x" * 1000)
+    assert not limits.admit_text("x" * 1001)
+    assert limits.admit_text("é" * 500)  # 1000 bytes
+    assert not limits.admit_text("é" * 501)
+    assert not limits.admit_text("\U0001F600" * 251)
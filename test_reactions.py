@@ -9,6 +9,13 @@ import json
 import websockets
 import uuid
 
+async def recv_type(websocket, event_type):
+    """Receive events until one of the given type arrives (skipping session, history, join...)"""
+    while True:
+        data = json.loads(await websocket.recv())
+        if data.get("type") == event_type:
+            return data
+
 async def test_reaction_handlers():
     """Test the new add_reaction and remove_reaction event handlers"""
     
@@ -30,8 +37,7 @@ async def test_reaction_handlers():
             print("Sent test message")
             
             # Receive the message broadcast to get the actual message ID
-            response = await websocket.recv()
-            message_data = json.loads(response)
+            message_data = await recv_type(websocket, "message")
             if message_data.get("type") == "message":
                 actual_message_id = message_data.get("message_id")
                 print(f"Received message with ID: {actual_message_id}")
@@ -46,19 +52,18 @@ async def test_reaction_handlers():
                 await websocket.send(json.dumps(add_reaction))
                 print("Sent add_reaction event")
                 
-                # Receive the reaction_update response
-                response = await websocket.recv()
-                reaction_data = json.loads(response)
+                # Receive the reaction_delta response
+                reaction_data = await recv_type(websocket, "reaction_delta")
                 print(f"Add reaction response: {reaction_data}")
                 
                 # Verify required fields are present
-                if reaction_data.get("type") == "reaction_update":
-                    required_fields = ["message_id", "emoji", "users"]
+                if reaction_data.get("type") == "reaction_delta":
+                    required_fields = ["message_id", "emoji", "delta", "count"]
                     missing_fields = [field for field in required_fields if field not in reaction_data]
                     if missing_fields:
-                        print(f"❌ Missing fields in reaction_update: {missing_fields}")
+                        print(f"❌ Missing fields in reaction_delta: {missing_fields}")
                     else:
-                        print(f"✅ All required fields present: message_id={reaction_data['message_id']}, emoji={reaction_data['emoji']}, users={reaction_data['users']}")
+                        print(f"✅ All required fields present: message_id={reaction_data['message_id']}, emoji={reaction_data['emoji']}, delta={reaction_data['delta']}, count={reaction_data['count']}")
                 
                 # Test remove_reaction event
                 remove_reaction = {
@@ -70,19 +75,18 @@ async def test_reaction_handlers():
                 await websocket.send(json.dumps(remove_reaction))
                 print("Sent remove_reaction event")
                 
-                # Receive the reaction_update response
-                response = await websocket.recv()
-                reaction_data = json.loads(response)
+                # Receive the reaction_delta response
+                reaction_data = await recv_type(websocket, "reaction_delta")
                 print(f"Remove reaction response: {reaction_data}")
                 
                 # Verify required fields are present
-                if reaction_data.get("type") == "reaction_update":
-                    required_fields = ["message_id", "emoji", "users"]
+                if reaction_data.get("type") == "reaction_delta":
+                    required_fields = ["message_id", "emoji", "delta", "count"]
                     missing_fields = [field for field in required_fields if field not in reaction_data]
                     if missing_fields:
-                        print(f"❌ Missing fields in reaction_update: {missing_fields}")
+                        print(f"❌ Missing fields in reaction_delta: {missing_fields}")
                     else:
-                        print(f"✅ All required fields present: message_id={reaction_data['message_id']}, emoji={reaction_data['emoji']}, users={reaction_data['users']}")
+                        print(f"✅ All required fields present: message_id={reaction_data['message_id']}, emoji={reaction_data['emoji']}, delta={reaction_data['delta']}, count={reaction_data['count']}")
                 
                 print("✅ Test completed successfully!")
             
@@ -0,0 +1,74 @@
+"""Unit tests for message ids and records (app.records)."""
+
+import uuid
+
+import pytest
+
+from app.records import (
+    IdGenerator, NODE_COUNT, StoredMessage, decode_id, encode_id, format_timestamp, pack_id, parse_timestamp, unpack_id,
+)
+
+
+@pytest.mark.parametrize("message_id", [0, 1, 61, 62, 3843, 3844, 2**40 + 17, 2**63 - 1, 2**64 - 1])
+def test_base62_round_trip(message_id):
+    text = encode_id(message_id)
+    assert len(text) <= 11
+    assert decode_id(text) == message_id
+
+
+def test_base62_uses_the_full_alphabet():
+    assert encode_id(61) == "z"
+    assert encode_id(62) == "10"
+    assert encode_id(35) == "Z"
+
+
+@pytest.mark.parametrize("text", ["", "00", "01", "a-b", "zzzzzzzzzzzz", "LygHa16AHYG", None, 42, "é"])
+def test_decode_rejects_ids_this_server_never_issues(text):
+    # Leading zeros, foreign characters, overlong strings and values past 64 bits
+    assert decode_id(text) is None
+
+
+def test_legacy_uuid_ids_round_trip():
+    legacy = str(uuid.uuid4())
+    message_id = decode_id(legacy)
+    assert message_id is not None and message_id >= 2**64
+    assert encode_id(message_id) == legacy
+    # Stored as the uuid string, since MessagePack integers stop at 64 bits
+    assert pack_id(message_id) == legacy
+    assert unpack_id(pack_id(message_id)) == message_id
+
+
+def test_malformed_uuid_is_rejected():
+    assert decode_id("not-a-uuid-but-exactly-36-chars-long") is None
+
+
+def test_compact_ids_pack_as_integers():
+    assert pack_id(12345) == 12345
+    assert unpack_id(12345) == 12345
+    assert unpack_id("3D7") == decode_id("3D7")
+
+
+def test_generator_ids_are_unique_and_ordered():
+    generator = IdGenerator(node=5)
+    ids = [generator.next() for _ in range(20000)]  # more than one millisecond's sequence space
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert all((message_id >> 12) % NODE_COUNT == 5 for message_id in ids)
+
+
+def test_generators_on_different_nodes_never_collide():
+    first, second = IdGenerator(node=1), IdGenerator(node=2)
+    assert not {first.next() for _ in range(5000)} & {second.next() for _ in range(5000)}
+
+
+def test_stored_message_from_event():
+    message = StoredMessage.new("alice", "hi")
+    event = {"message_id": message.message_id, "user": "alice", "content": "hi", "timestamp": format_timestamp(message.timestamp)}
+    copy = StoredMessage.from_event(event)
+    assert (copy.id, copy.user, copy.content, copy.timestamp) == (message.id, "alice", "hi", message.timestamp)
+    assert StoredMessage.from_event(dict(event, message_id="0bad")) is None
+
+
+def test_parse_timestamp_accepts_milliseconds_and_iso():
+    assert parse_timestamp(1_700_000_000_123) == 1_700_000_000_123
+    assert parse_timestamp(format_timestamp(1_700_000_000_123)) == 1_700_000_000_123
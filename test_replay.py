@@ -0,0 +1,114 @@
+"""Unit tests for reconnect replay windows (app.replay)."""
+
+import asyncio
+import time
+
+from app import config
+from app.encoding import Frame
+from app.main import ConnectionManager
+from app.replay import FRAME_OVERHEAD_BYTES, ReplayWindows
+
+
+def broadcast(windows, room, event, occupied=True, binary=False):
+    """What ConnectionManager.broadcast does: number, encode for the recipients, remember"""
+    frame = Frame(dict(event))
+    windows.stamp(room, frame, occupied)
+    frame.encode(binary)
+    windows.keep(room, frame)
+    return frame
+
+
+def test_resume_from_a_seq():
+    windows = ReplayWindows(size=3, max_rooms=10, max_bytes=1 << 20, idle_ttl=60)
+    window = windows.get("room")
+    for index in range(5):
+        broadcast(windows, "room", {"type": "message", "content": str(index)})
+    assert window.seq == 5
+    assert [frame.event["content"] for frame in window.since(window.epoch, 2)] == ["2", "3", "4"]
+    assert window.since(window.epoch, 5) == []
+    assert window.since(window.epoch, 1) is None  # older than the window holds
+    assert window.since("other epoch", 4) is None
+
+
+def test_frames_are_sized_from_their_existing_encoding():
+    windows = ReplayWindows(size=10, max_rooms=10, max_bytes=1 << 20, idle_ttl=60)
+    frame = broadcast(windows, "room", {"type": "message", "content": "x" * 100}, binary=True)
+    assert frame._text is None  # a MessagePack-only room never pays for JSON
+    assert windows.total_size == FRAME_OVERHEAD_BYTES + 2 * len(frame.binary)
+
+
+def test_byte_budget_drops_other_rooms_then_trims():
+    windows = ReplayWindows(size=100, max_rooms=10, max_bytes=3000, idle_ttl=60)
+    broadcast(windows, "old", {"type": "message", "content": "x" * 200})
+    for _ in range(10):
+        broadcast(windows, "busy", {"type": "message", "content": "x" * 200})
+    assert "old" not in windows.rooms
+    assert windows.total_size <= 3000
+    assert windows.total_size == windows.rooms["busy"].size == sum(windows.rooms["busy"].sizes)
+
+
+def test_room_count_limit():
+    windows = ReplayWindows(size=10, max_rooms=2, max_bytes=1 << 20, idle_ttl=60)
+    for room in ("a", "b", "c"):
+        windows.get(room)
+    assert list(windows.rooms) == ["b", "c"]
+    assert windows.evicted_rooms == 1
+
+
+def test_events_after_release_do_not_restart_the_idle_clock():
+    windows = ReplayWindows(size=10, max_rooms=10, max_bytes=1 << 20, idle_ttl=60)
+    broadcast(windows, "room", {"type": "message"})
+    windows.release("room")
+    released = windows.idle["room"]
+    # The last member's leave is announced after the room emptied
+    broadcast(windows, "room", {"type": "leave", "user": "alice"}, occupied=False)
+    assert windows.idle["room"] == released
+    assert windows.rooms["room"].seq == 2
+    # ...and an empty room without a window does not get one
+    broadcast(windows, "elsewhere", {"type": "leave", "user": "bob"}, occupied=False)
+    assert "elsewhere" not in windows.rooms
+    windows.expire(released + 61)
+    assert not windows.rooms and not windows.idle and windows.total_size == 0
+
+
+def test_a_member_rejoining_stops_the_idle_clock():
+    windows = ReplayWindows(size=10, max_rooms=10, max_bytes=1 << 20, idle_ttl=60)
+    broadcast(windows, "room", {"type": "message"})
+    windows.release("room")
+    windows.get("room")
+    windows.expire(time.monotonic() + 61)
+    assert "room" in windows.rooms
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.scope = {"subprotocols": []}
+        self.sent = []
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def close(self, code=1000):
+        pass
+
+
+def test_window_expires_after_the_last_member_leaves():
+    async def run():
+        manager = ConnectionManager()
+        await manager.start()
+        websocket = FakeWebSocket()
+        await manager.connect("room", "alice", websocket)
+        await manager.broadcast("room", {"type": "message", "content": "hi"})
+        presence_window = config.PRESENCE_BATCH_MS / 1000 + 0.05
+        await asyncio.sleep(presence_window)  # the join is announced
+        await manager.disconnect("room", websocket)
+        await asyncio.sleep(presence_window)
+        assert "room" in manager.replay.idle
+        manager.replay.expire(time.monotonic() + config.REPLAY_IDLE_TTL_S + 1)
+        assert "room" not in manager.replay.rooms and manager.replay.total_size == 0
+        await manager.stop()
+
+    asyncio.run(run())
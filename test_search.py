@@ -0,0 +1,57 @@
+"""Unit tests for the per-room full-text index (app.search)."""
+
+from app.search import MAX_TOKEN_CHARS, RoomIndex, tokenize
+
+
+def test_tokenize_normalizes_and_drops_single_characters():
+    assert tokenize("Hello, WORLD! a b hello") == {"hello", "world"}
+    assert tokenize("ﬁle Straße") == {"file", "strasse"}  # NFKC, then case folding
+    assert tokenize(None) == set()
+    assert tokenize("x" * 100) == {"x" * MAX_TOKEN_CHARS}
+
+
+def make_index(*texts):
+    index = RoomIndex()
+    for cursor, text in enumerate(texts):
+        index.add(cursor, text)
+    return index
+
+
+def test_single_term_returns_newest_first():
+    index = make_index("deploy now", "lunch?", "deploy failed", "deploy fixed")
+    ranked, total = index.search({"deploy"}, documents=4, limit=2)
+    assert total == 3
+    assert [cursor for _, cursor in ranked] == [3, 2]
+
+
+def test_messages_with_more_and_rarer_terms_rank_first():
+    index = make_index("deploy", "deploy rollback", "rollback", "deploy", "deploy")
+    ranked, total = index.search({"deploy", "rollback"}, documents=5, limit=5)
+    assert total == 5
+    cursors = [cursor for _, cursor in ranked]
+    assert cursors[0] == 1  # both terms
+    assert cursors[1] == 2  # the rarer term alone
+    assert cursors[2:] == [4, 3, 0]  # the common term, newest first
+    assert [score for score, _ in ranked] == sorted((score for score, _ in ranked), reverse=True)
+
+
+def test_unknown_terms_match_nothing():
+    index = make_index("hello world")
+    assert index.search({"nothing"}, documents=1, limit=10) == ([], 0)
+
+
+def test_remove_evicts_oldest_first_and_drops_empty_postings():
+    index = make_index("alpha beta", "alpha", "gamma")
+    assert index.remove(0, "alpha beta") == 2
+    assert "beta" not in index.postings
+    assert list(index.postings["alpha"]) == [1]
+    ranked, total = index.search({"alpha"}, documents=2, limit=10)
+    assert (total, [cursor for _, cursor in ranked]) == (1, [1])
+
+
+def test_remove_out_of_order_and_unknown_cursors():
+    index = make_index("alpha", "alpha", "alpha")
+    index.remove(1, "alpha")
+    index.remove(7, "alpha")  # never indexed
+    index.remove(2, "unindexed words")
+    assert list(index.postings["alpha"]) == [0, 2]
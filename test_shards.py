@@ -0,0 +1,60 @@
+"""Unit tests for relaying frames between shard loops (app.shards) and the metrics they share."""
+
+import asyncio
+import threading
+
+from app.encoding import Frame
+from app.metrics import BROADCAST_RECIPIENTS, Counter
+from app.shards import LoopRelay
+
+
+class FakeConnection:
+    def __init__(self, takes):
+        self.takes = takes
+        self.queued = []
+
+    def enqueue(self, frame):
+        if self.takes:
+            self.queued.append(frame)
+        return self.takes
+
+
+def test_recipients_are_counted_where_frames_are_queued():
+    async def run():
+        loop = asyncio.get_running_loop()
+        relay = LoopRelay(loop)
+        connections = [FakeConnection(True), FakeConnection(False), FakeConnection(True)]
+        before = BROADCAST_RECIPIENTS.sum, sum(BROADCAST_RECIPIENTS.counts)
+
+        def shard_broadcast():
+            frame = Frame({"type": "message"})
+            for connection in connections:
+                relay.enqueue(connection, frame)
+            relay.end_broadcast()
+
+        thread = threading.Thread(target=shard_broadcast)
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0.01)
+        # The connection that refused the frame is not a recipient
+        assert (BROADCAST_RECIPIENTS.sum, sum(BROADCAST_RECIPIENTS.counts)) == (before[0] + 2, before[1] + 1)
+        assert [len(connection.queued) for connection in connections] == [1, 0, 1]
+        assert relay.recipients == 0
+
+    asyncio.run(run())
+
+
+def test_metrics_updated_from_several_threads_lose_nothing():
+    counter = Counter("test_counter", "for the test", ("label",))
+
+    def work():
+        for _ in range(20000):
+            counter.labels("a").inc()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(counter.children) == 1
+    assert counter.labels("a").value == 80000
@@ -0,0 +1,57 @@
+"""Unit tests for batching typing indicators and seen markers (app.signals)."""
+
+import asyncio
+
+from app.signals import SignalBatcher
+
+
+def make_batcher(delay):
+    sent = []
+
+    async def send(room, event):
+        sent.append(event)
+
+    return SignalBatcher(delay, send), sent
+
+
+def test_the_latest_signal_of_each_user_and_type_wins():
+    async def run():
+        batcher, sent = make_batcher(0.02)
+        await batcher.post("room", {"type": "typing", "user": "alice", "active": True})
+        await batcher.post("room", {"type": "typing", "user": "bob", "active": True})
+        await batcher.post("room", {"type": "seen", "user": "alice", "message_id": "m1"})
+        await batcher.post("room", {"type": "typing", "user": "alice", "active": False})
+        await batcher.post("room", {"type": "seen", "user": "alice", "message_id": "m2"})
+        assert sent == []
+        await asyncio.sleep(0.05)
+        # One frame, ordered by each signal's latest update
+        assert sent == [{"type": "batch", "events": [
+            {"type": "typing", "user": "bob", "active": True},
+            {"type": "typing", "user": "alice", "active": False},
+            {"type": "seen", "user": "alice", "message_id": "m2"},
+        ]}]
+        assert batcher.coalesced == 2 and not batcher.pending
+
+    asyncio.run(run())
+
+
+def test_a_single_signal_is_sent_unwrapped():
+    async def run():
+        batcher, sent = make_batcher(0.02)
+        await batcher.post("room", {"type": "typing", "user": "alice", "active": True})
+        await asyncio.sleep(0.05)
+        assert sent == [{"type": "typing", "user": "alice", "active": True}]
+
+    asyncio.run(run())
+
+
+def test_flush_now_sends_and_cancels_the_timer():
+    async def run():
+        batcher, sent = make_batcher(0.02)
+        await batcher.post("room", {"type": "typing", "user": "alice", "active": True})
+        await batcher.flush_now("room")
+        assert len(sent) == 1 and "room" not in batcher.timers
+        await asyncio.sleep(0.05)
+        assert len(sent) == 1
+
+    asyncio.run(run())
@@ -0,0 +1,102 @@
+"""Unit tests for the cold store that idle rooms are spilled to (app.tiering)."""
+
+import asyncio
+import threading
+
+from app.reactions import ReactionIndex
+from app.records import StoredMessage
+from app.tiering import ColdStore, decode_room, encode_room
+
+
+def snapshot(*contents, appended=None):
+    messages = [StoredMessage.new("alice", content) for content in contents]
+    return encode_room(len(messages) if appended is None else appended, messages, {}), messages
+
+
+def test_snapshot_round_trip_keeps_reactions():
+    messages = [StoredMessage.new("alice", "one"), StoredMessage.new("bob", "two")]
+    reactions = ReactionIndex()
+    reactions.add("👍", "bob")
+    reactions.add("👍", "carol")
+    appended, decoded = decode_room(encode_room(12, messages, {messages[0].id: reactions}))
+    assert appended == 12
+    assert [(message.id, message.user, message.content, message.timestamp) for message, _ in decoded] == [
+        (message.id, message.user, message.content, message.timestamp) for message in messages
+    ]
+    assert sorted(decoded[0][1]["👍"]) == ["bob", "carol"]
+    assert decoded[1][1] == {}
+
+
+def test_take_from_pending(tmp_path):
+    store = ColdStore(str(tmp_path))
+    store.open()
+    data, messages = snapshot("a", "b")
+    store.spill("room", data)
+    assert "room" in store.rooms
+    appended, decoded = store.take("room")
+    assert appended == 2 and [message.content for message, _ in decoded] == ["a", "b"]
+    assert "room" not in store.rooms and not store.pending
+    assert (store.spilled, store.rehydrated) == (1, 1)
+    store.close()
+
+
+def test_take_from_disk(tmp_path):
+    store = ColdStore(str(tmp_path))
+    store.open()
+    store.spill("room", snapshot("a")[0])
+    assert asyncio.run(store.write_pending()) == 1
+    assert not store.pending and "room" in store.rooms
+    assert store._path("room").exists()
+    _, decoded = store.take("room")
+    assert [message.content for message, _ in decoded] == ["a"]
+    assert not store._path("room").exists()
+    store.close()
+    assert not store.directory.exists()
+
+
+def run_write_racing(store, during_write):
+    """Run write_pending, calling `during_write` on the event loop while the files are being written"""
+    release = threading.Event()
+    write_files = store._write_files
+
+    def blocked_write_files(snapshots):
+        release.wait(5)
+        return write_files(snapshots)
+
+    store._write_files = blocked_write_files
+
+    async def run():
+        writing = asyncio.create_task(store.write_pending())
+        await asyncio.sleep(0.01)
+        during_write()
+        release.set()
+        return await writing
+
+    return asyncio.run(run())
+
+
+def test_respill_during_write_keeps_the_newer_snapshot(tmp_path):
+    store = ColdStore(str(tmp_path))
+    store.open()
+    store.spill("room", snapshot("old")[0])
+    newer = snapshot("old", "new")[0]
+
+    def respill():
+        store.take("room")
+        store.spill("room", newer)
+
+    run_write_racing(store, respill)
+    assert store.pending["room"] is newer
+    _, decoded = store.take("room")
+    assert [message.content for message, _ in decoded] == ["old", "new"]
+    store.close()
+
+
+def test_rehydrate_during_write_removes_the_stale_file(tmp_path):
+    store = ColdStore(str(tmp_path))
+    store.open()
+    store.spill("room", snapshot("a")[0])
+    run_write_racing(store, lambda: store.take("room"))
+    assert "room" not in store.rooms and not store.pending
+    assert not store._path("room").exists()
+    store.close()
@@ -0,0 +1,75 @@
+"""Unit tests for the hashed timing wheel (app.timers)."""
+
+from app.timers import TimingWheel
+
+
+def test_items_come_due_on_their_tick():
+    wheel = TimingWheel(tick=1.0, slots=8, now=0.0)
+    wheel.schedule("a", 2.0)
+    wheel.schedule("b", 3.0)
+    assert wheel.advance(1.5) == []
+    assert wheel.advance(2.0) == ["a"]
+    assert wheel.advance(3.0) == ["b"]
+    assert len(wheel) == 0
+
+
+def test_delays_round_up_to_whole_ticks():
+    wheel = TimingWheel(tick=1.0, slots=8, now=0.0)
+    wheel.schedule("a", 0.1)  # never due before the next tick
+    wheel.schedule("b", 1.2)
+    assert wheel.advance(1.0) == ["a"]
+    assert wheel.advance(1.9) == []
+    assert wheel.advance(2.0) == ["b"]
+
+
+def test_rescheduling_moves_the_item():
+    wheel = TimingWheel(tick=1.0, slots=8, now=0.0)
+    wheel.schedule("a", 2.0)
+    wheel.schedule("a", 5.0)
+    assert len(wheel) == 1
+    assert wheel.advance(4.0) == []
+    assert wheel.advance(5.0) == ["a"]
+
+
+def test_rescheduling_relative_to_the_current_tick():
+    wheel = TimingWheel(tick=1.0, slots=8, now=0.0)
+    wheel.schedule("a", 2.0)
+    wheel.advance(1.0)
+    wheel.schedule("a", 2.0)  # from tick 1, so due at tick 3
+    assert wheel.advance(2.0) == []
+    assert wheel.advance(3.0) == ["a"]
+
+
+def test_cancel():
+    wheel = TimingWheel(tick=1.0, slots=8, now=0.0)
+    wheel.schedule("a", 1.0)
+    wheel.cancel("a")
+    wheel.cancel("never scheduled")
+    assert wheel.advance(10.0) == []
+    assert len(wheel) == 0
+
+
+def test_deadlines_beyond_one_revolution_come_due_early_not_late():
+    # 8 slots of 1s: a 20s delay is clamped to the wheel's 7-tick span
+    wheel = TimingWheel(tick=1.0, slots=8, now=0.0)
+    wheel.schedule("far", 20.0)
+    assert wheel.advance(6.0) == []
+    assert wheel.advance(7.0) == ["far"]
+    # The caller sees it is not yet due and reschedules the remainder, possibly several times
+    due_at, now, laps = 20.0, 7.0, 1
+    while now < due_at:
+        wheel.schedule("far", due_at - now)
+        while True:
+            now += 1.0
+            if wheel.advance(now):
+                break
+        laps += 1
+    assert now == due_at
+    assert laps == 3
+
+
+def test_a_late_advance_returns_everything_due_in_between():
+    wheel = TimingWheel(tick=1.0, slots=8, now=0.0)
+    for index, delay in enumerate((1.0, 3.0, 6.0)):
+        wheel.schedule(index, delay)
+    assert sorted(wheel.advance(6.5)) == [0, 1, 2]